@@ -0,0 +1,120 @@
+"""
+Benchmark the autonomous control stack on the simulated hardware backend.
+
+Runs main.autonomous_mode unmodified against sim_hardware, drops a wall in
+front of the robot part-way through, and reports loop rate, obstacle scan
+time and obstacle-reaction latency.
+
+Usage: python3 bench.py [--duration 20] [--obstacle-at 8] [--real-cloud] [--offline]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import hal
+
+def run_benchmark(duration=20.0, obstacle_at=8.0, obstacle_distance=200.0, sim_cloud=True, offline=False):
+    hal.select_backend("sim", cloud=sim_cloud)
+    import sim_hardware
+    import main
+    import gemini
+    import connectivity
+    import quota
+    import telemetry
+    import run_index
+    import metrics
+
+    scans = []
+    real_plan_navigation = main.plan_navigation
+
+    def timed_plan_navigation(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return real_plan_navigation(*args, **kwargs)
+        finally:
+            scans.append(time.monotonic() - start)
+
+    main.plan_navigation = timed_plan_navigation
+    if offline:
+        connectivity.forced_state = False
+    if sim_cloud:
+        # Keep simulated requests out of the real daily quota
+        gemini.request_quota = quota.QuotaManager(os.path.join(tempfile.mkdtemp(), "request_count.txt"),
+                                                  gemini.DAILY_LIMIT)
+
+    # Keep benchmark runs out of the robot's telemetry log
+    main.telemetry = telemetry.TelemetryStore(os.path.join(tempfile.mkdtemp(), "telemetry"))
+    main.run_index = run_index.RunIndex(main.telemetry)
+    world = sim_hardware.world
+    main.initialize_system()
+    world.reset()
+    main.control_stats.update(ticks=0, overruns=0, max_tick_time=0.0)
+    metrics.reset()
+    main.stop_event.clear()
+    worker = threading.Thread(target=main.autonomous_mode, daemon=True)
+    start = time.monotonic()
+    worker.start()
+
+    obstacle_time = None
+    try:
+        while time.monotonic() - start < duration:
+            if obstacle_time is None and time.monotonic() - start >= obstacle_at:
+                world.place_wall_ahead(obstacle_distance)
+                obstacle_time = time.monotonic()
+            time.sleep(0.01)
+    finally:
+        elapsed = time.monotonic() - start
+        main.stop_event.set()
+        worker.join(timeout=30)
+        main.cleanup_system()
+        main.plan_navigation = real_plan_navigation
+
+    reaction = None
+    if obstacle_time is not None:
+        stops = [t for t in world.motor_stops if t >= obstacle_time]
+        if stops:
+            reaction = stops[0] - obstacle_time
+    stats = main.control_stats
+    reflex = main.navigation.reflex.stats() if main.navigation.reflex else None
+    return {
+        "duration_s": elapsed,
+        "loop_ticks": stats["ticks"],
+        "loop_rate_hz": stats["ticks"] / elapsed if elapsed else 0.0,
+        "loop_overruns": stats["overruns"],
+        "max_tick_time_s": stats["max_tick_time"],
+        "loop_p50_s": main.loop_time.quantile(0.5),
+        "loop_p99_s": main.loop_time.quantile(0.99),
+        "scans": len(scans),
+        "mean_scan_time_s": sum(scans) / len(scans) if scans else None,
+        "obstacle_reaction_s": reaction,
+        "cloud_requests": world.cloud_requests,
+        "cache_hits": gemini.detection_cache.hits,
+        "cache_misses": gemini.detection_cache.misses,
+        "scene_frames_sent": main.scene_gate.passed,
+        "scene_frames_skipped": main.scene_gate.skipped,
+        "map_samples": main.occupancy.samples,
+        "map_occupied_cells": int(main.occupancy.occupied().sum()),
+        "reflex_trips": reflex["trips"] if reflex else None,
+        "reflex_max_stop_s": reflex["max_stop"] if reflex else None,
+        "reflex_observed_stop_s": reflex["observed_stop_time"] if reflex else None,
+        "gemini_batch_p50_s": metrics.stage("gemini_batch").quantile(0.5),
+        "ranging_p99_s": metrics.stage("ranging").quantile(0.99),
+        "motor_update_p99_s": metrics.stage("motor_update").quantile(0.99),
+        "telemetry_records": len(main.telemetry.load_run(main.telemetry.last_run() or 0)),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FormBot on simulated hardware.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run autonomous mode")
+    parser.add_argument("--obstacle-at", type=float, default=8.0, help="Seconds before a wall appears ahead")
+    parser.add_argument("--obstacle-distance", type=float, default=200.0, help="Wall distance in mm")
+    parser.add_argument("--real-cloud", action="store_true", help="Call the real Gemini API")
+    parser.add_argument("--offline", action="store_true", help="Report the robot as offline")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.duration, args.obstacle_at, args.obstacle_distance,
+                            sim_cloud=not args.real_cloud, offline=args.offline)
+    print("\nBenchmark results:")
+    for key, value in results.items():
+        print(f"  {key}: {value if value is None or isinstance(value, int) else round(value, 4)}")
@@ -0,0 +1,9 @@
+import os
+
+# Tests run on the simulated backends (see hal.py), with a simulated Gemini
+os.environ.setdefault("FORMBOT_HARDWARE", "sim")
+os.environ.setdefault("FORMBOT_SIM_CLOUD", "1")
+os.environ.setdefault("GOOGLE_API_KEY", "sim")
+
+# Interactive scripts for the real devices, not tests
+collect_ignore = ["test.py", "gemini_test.py"]
@@ -0,0 +1,129 @@
+import socket
+import threading
+import time
+import metrics
+from log import get_logger
+
+logger = get_logger("connectivity")
+
+# Probe settings
+PROBE_HOST = ("8.8.8.8", 53)  # Google DNS over TCP
+PROBE_TIMEOUT = 2             # Seconds per probe
+ONLINE_INTERVAL = 15.0        # Seconds between probes while online
+OFFLINE_MIN_INTERVAL = 1.0    # First retry delay after going offline
+OFFLINE_MAX_INTERVAL = 30.0   # Backoff cap while offline
+
+# Published connectivity state, written only under _lock
+state = {"online": False, "checked_at": None, "changed_at": None, "last_error": None}
+forced_state = None  # Set to True/False to override the probes (benchmarks, bench tests)
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+probe_time = metrics.stage("connectivity_probe")
+metrics.register("formbot_online", "1 while the robot is considered online", lambda: int(state["online"]))
+
+def probe(timeout=PROBE_TIMEOUT):
+    """
+    Open one TCP connection to PROBE_HOST.
+    Returns:
+        bool: True if the connection succeeded
+    """
+    try:
+        with probe_time.time(), socket.create_connection(PROBE_HOST, timeout=timeout):
+            return True
+    except OSError as e:
+        with _lock:
+            state["last_error"] = str(e)
+        return False
+
+def _publish(online, error=None):
+    now = time.time()
+    with _lock:
+        changed = online != state["online"] or state["checked_at"] is None
+        state["online"] = online
+        state["checked_at"] = now
+        if error is not None:
+            state["last_error"] = str(error)
+        if changed:
+            state["changed_at"] = now
+    if changed:
+        if online:
+            logger.info("Internet connection available.")
+        else:
+            logger.warning("No internet connection detected. Skipping Gemini API calls...")
+    return changed
+
+def _monitor(online):
+    failures = 0 if online else 1
+    while not _stop.is_set():
+        _wake.wait(ONLINE_INTERVAL if failures == 0 else
+                   min(OFFLINE_MIN_INTERVAL * 2 ** (failures - 1), OFFLINE_MAX_INTERVAL))
+        _wake.clear()
+        if _stop.is_set():
+            break
+        online = probe()
+        _publish(online)
+        failures = 0 if online else failures + 1
+
+def start_monitor():
+    """
+    Start the background probe thread (idempotent). The first probe runs
+    synchronously so the state is valid as soon as this returns.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    online = probe()
+    _publish(online)
+    _thread = threading.Thread(target=_monitor, args=(online,), name="connectivity", daemon=True)
+    _thread.start()
+
+def stop_monitor():
+    global _thread
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout=PROBE_TIMEOUT + 1)
+        _thread = None
+
+def is_online():
+    """
+    Cached connectivity state; costs a dict read once the monitor is running.
+    Returns:
+        bool: True if the last probe or API call succeeded
+    """
+    if forced_state is not None:
+        return forced_state
+    if state["checked_at"] is None:
+        start_monitor()
+    return state["online"]
+
+def report_success():
+    """
+    Record a successful API round trip as proof of connectivity.
+    """
+    if not state["online"]:
+        _publish(True)
+    else:
+        with _lock:
+            state["checked_at"] = time.time()
+
+def report_failure(error):
+    """
+    Record a failed API call. Network-level failures mark the robot offline
+    and trigger an immediate re-probe; other errors are ignored.
+    """
+    if not is_network_error(error):
+        return
+    _publish(False, error)
+    _wake.set()
+
+def is_network_error(error):
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    message = str(error)
+    return any(text in message for text in ("503", "504", "Deadline", "Unavailable", "timed out", "Connection"))
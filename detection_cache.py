@@ -0,0 +1,111 @@
+import base64
+import io
+import threading
+import time
+from collections import OrderedDict
+from log import get_logger
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow missing: every lookup is a miss
+    Image = None
+
+logger = get_logger("detection_cache")
+
+# Cache settings
+CACHE_MAX_ENTRIES = 256      # LRU capacity
+CACHE_TTL = 30.0             # Seconds before a cached label expires
+CACHE_MAX_DISTANCE = 6       # Max Hamming distance (of 64 bits) for a near-duplicate frame
+CACHE_ANGLE_TOLERANCE = 2    # Max servo angle difference (degrees) for a match
+
+def dhash(image, hash_size=8):
+    """
+    Compute a 64-bit difference hash of a JPEG frame.
+    Args:
+        image: JPEG data as bytes or a base64-encoded string
+        hash_size: Hash is hash_size x hash_size bits
+    Returns:
+        int: Perceptual hash, or None if the frame can't be decoded
+    """
+    if Image is None or image is None:
+        return None
+    try:
+        if isinstance(image, str):
+            image = base64.b64decode(image)
+        img = Image.open(io.BytesIO(image))
+        img.draft("L", (hash_size * 8, hash_size * 8))  # Let the JPEG decoder downscale
+        img = img.convert("L").resize((hash_size + 1, hash_size))
+        pixels = list(img.getdata())
+    except Exception as e:
+        logger.warning("Failed to hash frame: %s", e)
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class DetectionCache:
+    """
+    LRU cache of detection labels keyed by perceptual hash and servo angle.
+    A frame matches an entry when its hash is within max_distance bits and its
+    angle within angle_tolerance degrees of a fresh (younger than ttl) entry.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL,
+                 max_distance=CACHE_MAX_DISTANCE, angle_tolerance=CACHE_ANGLE_TOLERANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.angle_tolerance = angle_tolerance
+        self.entries = OrderedDict()  # (hash, angle) -> (label, timestamp)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, frame_hash, angle=None):
+        """
+        Returns:
+            str: Cached label for a near-duplicate frame, or None on a miss
+        """
+        if frame_hash is None:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (label, stamp) in list(self.entries.items()):
+                if now - stamp > self.ttl:
+                    del self.entries[key]
+                    continue
+                cached_hash, cached_angle = key
+                if angle is not None and cached_angle is not None and abs(angle - cached_angle) > self.angle_tolerance:
+                    continue
+                distance = hamming(frame_hash, cached_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_key)
+            self.hits += 1
+            return self.entries[best_key][0]
+
+    def store(self, frame_hash, angle, label):
+        if frame_hash is None:
+            return
+        with self.lock:
+            key = (frame_hash, angle)
+            self.entries[key] = (label, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque, namedtuple
+import metrics
+from log import get_logger
+
+logger = get_logger("frame_buffer")
+
+# Frame buffer sizing
+FRAME_SLOT_SIZE = 256 * 1024  # Bytes preallocated per JPEG slot (640x480 frames are ~50-100 KB)
+FRAME_RING_SLOTS = 40         # An unpinned frame stays valid for this many newer captures
+FRAME_HISTORY = 8             # Recent frames kept by CaptureWorker
+CAPTURE_FPS = 10              # Continuous capture rate
+
+capture_time = metrics.stage("capture")  # First JPEG byte to the complete frame in its ring slot
+
+# One captured frame. data is a memoryview into slot; timestamp (time.monotonic)
+# and angle are taken when the frame's first bytes arrive.
+Frame = namedtuple("Frame", ["seq", "data", "timestamp", "angle", "slot"])
+
+class FrameSlot:
+    """
+    Reusable, preallocated capture target. picamera writes the encoded frame
+    straight into the slot's bytearray; view() exposes it without copying.
+    """
+
+    def __init__(self, size=FRAME_SLOT_SIZE):
+        self.buffer = bytearray(size)
+        self.length = 0
+        self.pinned = 0  # Consumers holding this frame; pinned slots are not reused
+
+    def reset(self):
+        self.length = 0
+
+    def write(self, data):
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            # Oversized frame: move to a larger buffer once. Resizing in place
+            # would fail while older views of this slot are still alive.
+            larger = bytearray(max(end, len(self.buffer) * 3 // 2))
+            larger[:self.length] = self.buffer[:self.length]
+            self.buffer = larger
+        self.buffer[self.length:end] = data
+        self.length = end
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def view(self):
+        return memoryview(self.buffer)[:self.length]
+
+class FrameRing:
+    """
+    Fixed set of FrameSlots reused round-robin, so steady-state capture allocates nothing.
+    """
+
+    def __init__(self, slots=FRAME_RING_SLOTS, slot_size=FRAME_SLOT_SIZE):
+        self.slots = [FrameSlot(slot_size) for _ in range(slots)]
+        self.index = 0
+        self.lock = threading.Lock()
+
+    def next_slot(self):
+        with self.lock:
+            for _ in range(len(self.slots)):
+                slot = self.slots[self.index]
+                self.index = (self.index + 1) % len(self.slots)
+                if not slot.pinned:
+                    slot.reset()
+                    return slot
+        # Every slot is pinned: fall back to a one-off buffer
+        logger.warning("All frame slots pinned. Allocating a temporary frame buffer...")
+        return FrameSlot(len(self.slots[0].buffer))
+
+def pin_frame(frame):
+    """
+    Keep a frame's slot from being reused until release_frame is called.
+    """
+    with _pin_lock:
+        frame.slot.pinned += 1
+
+def release_frame(frame):
+    with _pin_lock:
+        frame.slot.pinned = max(frame.slot.pinned - 1, 0)
+
+_pin_lock = threading.Lock()
+
+class _CaptureTarget:
+    """
+    File-like object handed to capture_continuous. Each frame goes into a fresh
+    ring slot, stamped with the time and servo angle of its first write.
+    """
+
+    def __init__(self, ring, angle_source):
+        self.ring = ring
+        self.angle_source = angle_source
+        self.slot = None
+        self.timestamp = None
+        self.angle = None
+
+    def write(self, data):
+        if self.slot is None:
+            self.timestamp = time.monotonic()
+            self.angle = self.angle_source() if self.angle_source else None
+            self.slot = self.ring.next_slot()
+        return self.slot.write(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        slot, self.slot = self.slot, None
+        return slot
+
+class CaptureWorker:
+    """
+    Background thread that records frames continuously from the camera's video
+    port into a FrameRing. Consumers read the newest frame with latest(), which
+    never blocks, or wait for a newer one with wait_for_frame().
+    """
+
+    def __init__(self, camera, ring, angle_source=None, fps=CAPTURE_FPS, history=FRAME_HISTORY):
+        self.camera = camera
+        self.ring = ring
+        self.angle_source = angle_source
+        self.fps = fps
+        self.frames = deque(maxlen=history)
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.seq = 0
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.camera.framerate = self.fps
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def _run(self):
+        target = _CaptureTarget(self.ring, self.angle_source)
+        try:
+            for _ in self.camera.capture_continuous(target, format="jpeg", use_video_port=True):
+                slot = target.take()
+                if slot is not None:
+                    capture_time.record(time.monotonic() - target.timestamp)
+                    self.seq += 1
+                    frame = Frame(self.seq, slot.view(), target.timestamp, target.angle, slot)
+                    with self.condition:
+                        self.frames.append(frame)
+                        self.condition.notify_all()
+                if self.stop_event.is_set():
+                    break
+        except Exception as e:
+            logger.exception("Error in continuous capture: %s", e)
+
+    def latest(self):
+        """
+        Returns:
+            Frame: Newest frame, or None if nothing was captured yet
+        """
+        try:
+            return self.frames[-1]
+        except IndexError:
+            return None
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """
+        Block until a frame newer than after_seq is available.
+        Returns:
+            Frame: The newest frame, or None on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frames and self.frames[-1].seq > after_seq, timeout)
+            frame = self.latest()
+            return frame if frame is not None and frame.seq > after_seq else None
@@ -1,9 +1,17 @@
 import os
+import re
 from dotenv import load_dotenv
-import http.client
 import time
-from datetime import datetime, timedelta
+import threading
+import hal  # selects real or simulated devices (and optionally a simulated Gemini)
 import google.generativeai as genai
+from detection_cache import DetectionCache, dhash
+from quota import QuotaManager, QuotaExceededError
+from connectivity import is_online, report_success, report_failure
+from log import get_logger
+import metrics
+
+logger = get_logger("gemini")
 
 # Load the API key from .env file
 load_dotenv()
@@ -16,90 +24,135 @@ genai.configure(api_key=GOOGLE_API_KEY)
 
 REQUEST_COUNT_FILE = "request_count.txt"
 DAILY_LIMIT = 200
+request_quota = QuotaManager(REQUEST_COUNT_FILE, DAILY_LIMIT)
+
+MODEL_NAME = "gemini-1.5-flash"
+
+# Prompts and generation settings are built once at import
+DETECT_PROMPT = (
+    "I am using a Raspberry Pi with a camera to detect objects. "
+    "Analyze the attached image and identify the most prominent object. "
+    "Return only the name of the object (e.g., 'apple', 'car', 'tree') without any additional text."
+)
+PLAN_PROMPT = "Analyze the image and suggest a navigation path for a small farm robot to avoid obstacles."
+CHAT_PROMPT = "As a farming assistant, answer the following query: "
+
+# Batched detection: one request per servo sweep
+BATCH_PROMPT = (
+    "I am using a Raspberry Pi with a camera to detect objects. "
+    "The {count} attached images are numbered 1 to {count}. "
+    "For each image, identify the most prominent object. "
+    "Reply with exactly one line per image in the form '<number>: <object name>' "
+    "(e.g., '1: apple') without any additional text."
+)
+BATCH_LINE = re.compile(r"^\s*(?:image\s*)?(\d+)\s*[:.)\-]\s*(.*)$", re.IGNORECASE)
+
+GENERATION_CONFIGS = {
+    "detect": genai.GenerationConfig(temperature=0.0, max_output_tokens=20),
+    "batch": genai.GenerationConfig(temperature=0.0, max_output_tokens=512),
+    "plan": None,
+    "chat": None,
+}
+
+# One long-lived model per task. Reusing it keeps the SDK client and its
+# connection to the API open, so each call only pays for inference.
+_models = {}
+_models_lock = threading.Lock()
+
+# Near-duplicate frames from the servo sweep reuse earlier labels
+detection_cache = DetectionCache()
+
+# Instrumentation; quota and cache values are read from their owners on each scrape
+encode_time = metrics.stage("encode")  # JPEG payload preparation for an upload
+api_errors = metrics.counter("formbot_gemini_errors_total", "Gemini round trips that raised")
+metrics.register("formbot_gemini_requests_today", "Gemini requests counted against today's quota",
+                 lambda: request_quota.total())
+metrics.register("formbot_gemini_daily_limit", "Gemini daily request limit", lambda: request_quota.daily_limit)
+metrics.register("formbot_detection_cache_hits_total", "Detections answered from the cache",
+                 lambda: detection_cache.hits, "counter")
+metrics.register("formbot_detection_cache_misses_total", "Detections not found in the cache",
+                 lambda: detection_cache.misses, "counter")
 
-def is_online(timeout=5):
+def get_model(task):
     """
-    Check if the system is online by attempting an HTTP connection to Google.
-    Args:
-        timeout: Time in seconds to wait for a response
+    Return the shared GenerativeModel for a task ("detect", "batch", "plan" or "chat").
+    """
+    model = _models.get(task)
+    if model is None:
+        with _models_lock:
+            model = _models.get(task)
+            if model is None:
+                model = genai.GenerativeModel(MODEL_NAME, generation_config=GENERATION_CONFIGS[task])
+                _models[task] = model
+    return model
+
+def warm_up():
+    """
+    Build every task model and open the API connection ahead of the first detection.
+    Uses count_tokens, which does not count against the generate_content quota.
     Returns:
-        bool: True if online, False if offline
+        bool: True if the connection was warmed up
     """
+    for task in GENERATION_CONFIGS:
+        get_model(task)
+    if not is_online():
+        return False
     try:
-        conn = http.client.HTTPConnection("www.google.com", timeout=timeout)
-        conn.request("HEAD", "/")
-        conn.close()
+        get_model("detect").count_tokens(DETECT_PROMPT)
+        report_success()
+        logger.info("Gemini API connection warmed up.")
         return True
     except Exception as e:
-        print(f"No internet connection detected: {e}. Skipping Gemini API calls...")
+        logger.warning("Gemini API warm-up failed: %s", e)
+        report_failure(e)
         return False
 
 def update_request_count():
     """
-    Update the request count for Gemini API calls, enforcing a daily limit.
+    Count one Gemini API call against the daily limit (see quota.QuotaManager).
     Returns:
         int: Total requests made today
     Raises:
-        Exception: If daily request limit is exceeded
+        QuotaExceededError: If daily request limit is exceeded
     """
-    current_date = datetime.now().date()
-    total_requests = 0
-    last_reset = current_date.strftime("%Y-%m-%d")
-
-    # Initialize the request count file if it doesn't exist
-    if not os.path.exists(REQUEST_COUNT_FILE):
-        try:
-            with open(REQUEST_COUNT_FILE, "w") as f:
-                f.write(f"{last_reset},0")
-            os.chmod(REQUEST_COUNT_FILE, 0o666)  # Ensure the file is writable by all users
-        except Exception as e:
-            print(f"Error creating request_count.txt: {e}")
-            raise
-
-    # Read the current request count
-    try:
-        with open(REQUEST_COUNT_FILE, "r") as f:
-            line = f.read().strip()
-            if line:
-                date_str, count = line.split(",")
-                total_requests = int(count)
-                last_reset = date_str
-            else:
-                raise ValueError("request_count.txt is empty")
-    except Exception as e:
-        print(f"Error reading request_count.txt: {e}")
-        raise
-
-    # Reset the count if the date has changed
-    if last_reset != current_date.strftime("%Y-%m-%d"):
-        total_requests = 0
-        last_reset = current_date.strftime("%Y-%m-%d")
+    total_requests = request_quota.record()
+    logger.info("Total requests made: %d", total_requests, extra={"requests": total_requests})
+    return total_requests
 
-    total_requests += 1
+def _image_part(image_data):
+    """
+    Inline JPEG part for generate_content. Frames arrive as memoryviews into the
+    capture ring; the SDK needs bytes, so this is the one copy on the upload path.
+    """
+    with encode_time.time():
+        if not isinstance(image_data, (bytes, str)):
+            image_data = bytes(image_data)
+        return {"mime_type": "image/jpeg", "data": image_data}
 
-    # Write the updated count back to the file
+def _generate(task, contents):
+    # One generate_content round trip (including the SDK's base64 encoding), timed per task
     try:
-        with open(REQUEST_COUNT_FILE, "w") as f:
-            f.write(f"{last_reset},{total_requests}")
-    except Exception as e:
-        print(f"Error writing to request_count.txt: {e}")
+        with metrics.timed(f"gemini_{task}"):
+            return get_model(task).generate_content(contents)
+    except Exception:
+        api_errors.inc()
         raise
 
-    print(f"Total requests made: {total_requests}")
-
-    if total_requests > DAILY_LIMIT:
-        raise Exception("Daily request limit exceeded for Gemini API.")
-
-    return total_requests
-
-def detect_object(image_base64):
+def detect_object(image_data, angle=None):
     """
     Detect the most prominent object in the image using Gemini API.
+    Near-duplicate frames at the same servo angle are answered from detection_cache.
     Args:
-        image_base64: Base64-encoded image data
+        image_data: JPEG bytes (bytes, bytearray or memoryview)
+        angle: Horizontal servo angle the frame was taken at (optional)
     Returns:
         str: Name of the detected object, or "unknown" if detection fails
     """
+    frame_hash = dhash(image_data)
+    cached = detection_cache.lookup(frame_hash, angle)
+    if cached is not None:
+        return cached
+
     if not is_online():
         return "unknown (offline)"
 
@@ -107,29 +160,116 @@ def detect_object(image_base64):
     for attempt in range(max_retries):
         try:
             update_request_count()
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            prompt = (
-                "I am using a Raspberry Pi with a camera to detect objects. "
-                "Analyze the attached image and identify the most prominent object. "
-                "Return only the name of the object (e.g., 'apple', 'car', 'tree') without any additional text."
-            )
-            response = model.generate_content([prompt, {"mime_type": "image/jpeg", "data": image_base64}])
+            response = _generate("detect", [DETECT_PROMPT, _image_part(image_data)])
+            report_success()
             object_name = response.text.strip() if response.text else "unknown"
+            if object_name != "unknown":
+                detection_cache.store(frame_hash, angle, object_name)
             return object_name
         except Exception as e:
             if "429" in str(e) and attempt < max_retries - 1:
                 wait_time = 2 ** attempt  # Exponential backoff
-                print(f"Quota exceeded, retrying in {wait_time} seconds...")
+                logger.warning("Quota exceeded, retrying in %d seconds...", wait_time)
                 time.sleep(wait_time)
             else:
-                print(f"Error in Gemini API for object detection: {e}")
+                logger.error("Error in Gemini API for object detection: %s", e)
+                report_failure(e)
                 return "unknown"
 
-def plan_path(image_base64):
+def parse_batch_labels(text, count):
+    """
+    Parse a numbered batch answer ("1: weed" per line) into a label list.
+    Returns:
+        list: count labels in frame order, or None if the answer can't be aligned
+    """
+    labels = {}
+    for line in (text or "").splitlines():
+        match = BATCH_LINE.match(line)
+        if not match:
+            continue
+        index = int(match.group(1))
+        if index in labels or not 1 <= index <= count:
+            return None
+        labels[index] = match.group(2).strip().strip("'\"*").strip() or "unknown"
+    if len(labels) != count:
+        return None
+    return [labels[i] for i in range(1, count + 1)]
+
+def detect_objects_batch(frames):
+    """
+    Detect the most prominent object in each of several frames with one Gemini request.
+    Cached frames are answered locally; the rest are sent together. If the answer
+    can't be aligned to the frames, the batch is split in half and retried.
+    Args:
+        frames: List of (image_data, angle) tuples, e.g. one servo sweep
+    Returns:
+        list: Detected object name per frame, in the same order
+    """
+    results = [None] * len(frames)
+    pending = []
+    for i, (image_data, angle) in enumerate(frames):
+        frame_hash = dhash(image_data)
+        cached = detection_cache.lookup(frame_hash, angle)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append((i, image_data, angle, frame_hash))
+
+    if pending and not is_online():
+        for i, _, _, _ in pending:
+            results[i] = "unknown (offline)"
+        return results
+
+    for i, label in _detect_batch(pending):
+        results[i] = label
+    return results
+
+def _detect_batch(pending):
+    # pending: list of (index, image_data, angle, frame_hash)
+    if not pending:
+        return []
+    if len(pending) == 1:
+        i, image_data, angle, _ = pending[0]
+        return [(i, detect_object(image_data, angle))]
+
+    contents = [BATCH_PROMPT.format(count=len(pending))]
+    for n, (_, image_data, _, _) in enumerate(pending, start=1):
+        contents.append(f"Image {n}:")
+        contents.append(_image_part(image_data))
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            update_request_count()
+            response = _generate("batch", contents)
+            report_success()
+            labels = parse_batch_labels(response.text, len(pending))
+            break
+        except Exception as e:
+            if "429" in str(e) and attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                logger.warning("Quota exceeded, retrying in %d seconds...", wait_time)
+                time.sleep(wait_time)
+            else:
+                logger.error("Error in Gemini API for batch object detection: %s", e)
+                report_failure(e)
+                return [(i, "unknown") for i, _, _, _ in pending]
+
+    if labels is None:
+        logger.warning("Could not align batch answer to %d frames. Splitting batch...", len(pending))
+        half = len(pending) // 2
+        return _detect_batch(pending[:half]) + _detect_batch(pending[half:])
+
+    for (_, _, angle, frame_hash), label in zip(pending, labels):
+        if label != "unknown":
+            detection_cache.store(frame_hash, angle, label)
+    return [(i, label) for (i, _, _, _), label in zip(pending, labels)]
+
+def plan_path(image_data):
     """
     Plan a navigation path using Gemini API.
     Args:
-        image_base64: Base64-encoded image data
+        image_data: JPEG bytes (bytes, bytearray or memoryview)
     Returns:
         str: Suggested path, or fallback message if planning fails
     """
@@ -140,17 +280,17 @@ def plan_path(image_base64):
     for attempt in range(max_retries):
         try:
             update_request_count()
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            prompt = "Analyze the image and suggest a navigation path for a small farm robot to avoid obstacles."
-            response = model.generate_content([prompt, {"mime_type": "image/jpeg", "data": image_base64}])
+            response = _generate("plan", [PLAN_PROMPT, _image_part(image_data)])
+            report_success()
             return response.text.strip() if response.text else "No path suggestion available."
         except Exception as e:
             if "429" in str(e) and attempt < max_retries - 1:
                 wait_time = 2 ** attempt
-                print(f"Quota exceeded, retrying in {wait_time} seconds...")
+                logger.warning("Quota exceeded, retrying in %d seconds...", wait_time)
                 time.sleep(wait_time)
             else:
-                print(f"Error in Gemini API for path planning: {e}")
+                logger.error("Error in Gemini API for path planning: %s", e)
+                report_failure(e)
                 return "No path suggestion available."
 
 def chat_assistant(query):
@@ -168,15 +308,15 @@ def chat_assistant(query):
     for attempt in range(max_retries):
         try:
             update_request_count()
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            prompt = f"As a farming assistant, answer the following query: {query}"
-            response = model.generate_content([prompt])
+            response = _generate("chat", [CHAT_PROMPT + query])
+            report_success()
             return response.text.strip() if response.text else "I couldn't generate a response."
         except Exception as e:
             if "429" in str(e) and attempt < max_retries - 1:
                 wait_time = 2 ** attempt
-                print(f"Quota exceeded, retrying in {wait_time} seconds...")
+                logger.warning("Quota exceeded, retrying in %d seconds...", wait_time)
                 time.sleep(wait_time)
             else:
-                print(f"Error in Gemini API for chat: {e}")
+                logger.error("Error in Gemini API for chat: %s", e)
+                report_failure(e)
                 return "I couldn't generate a response due to an error."
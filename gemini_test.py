@@ -1,3 +1,4 @@
+import hal  # selects real or simulated devices
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
@@ -1,46 +1,362 @@
+import hal  # selects real or simulated devices
 import serial
+import struct
+import threading
 import time
-import pynmea2
+from collections import deque, namedtuple
+from log import get_logger
+
+logger = get_logger("gps")
 
 # UART3 configuration (likely /dev/ttyAMA2 on Raspberry Pi)
 UART_PORT = '/dev/ttyAMA0'
 BAUD_RATE = 9600  # Common baud rate for GPS modules like NEO-6M
 
-def gps_init():
+# Module configuration applied by gps_init()
+GPS_PROTOCOL = "ubx"      # "ubx" (u-blox NEO-6M/7M/8M, the FormBot module) or "pmtk" (MediaTek modules)
+FAST_BAUD_RATE = 115200   # 5-10 Hz of GGA + RMC + VTG needs 1-2 kB/s, more than 9600 baud carries
+UPDATE_RATE = 5           # Fixes per second, clamped to MAX_UPDATE_RATE of the protocol
+MAX_UPDATE_RATE = {"ubx": 5, "pmtk": 10}  # NEO-6M tops out at 5 Hz; MediaTek MT3339 at 10 Hz
+VERIFY_TIME = 2.0         # Seconds to wait for valid sentences after changing the baud rate
+
+# Reader settings
+FIX_HISTORY = 64          # Fixes kept by GpsReader
+READ_TIMEOUT = 0.2        # Seconds a UART read may block (bounds how long stop() takes)
+MAX_SENTENCE = 82         # NMEA 0183 limit including "$" and the line ending
+
+KNOTS_TO_MPS = 0.514444
+
+# One position/velocity epoch merged from GGA, RMC and VTG. timestamp is the
+# time.monotonic() the latest sentence of the epoch arrived; utc is "hhmmss.ss".
+# latitude/longitude in degrees, altitude in m, speed in m/s, course in degrees true.
+Fix = namedtuple("Fix", ["seq", "timestamp", "utc", "latitude", "longitude", "altitude",
+                         "satellites", "quality", "speed", "course", "valid"])
+
+reader = None  # GpsReader once start_reader() has run
+
+def gps_init(configure_module=True):
     try:
         ser = serial.Serial(UART_PORT, BAUD_RATE, timeout=1)
-        print("GPS initialized successfully.")
-        return ser
+        logger.info("GPS initialized successfully.")
     except Exception as e:
-        print(f"Failed to initialize GPS: {e}")
+        logger.error("Failed to initialize GPS: %s", e)
         raise
+    if configure_module:
+        configure(ser)
+    return ser
 
-def read_gps(ser):
+# --- Module configuration -----------------------------------------------------
+
+def _nmea_command(body):
+    checksum = 0
+    for ch in body:
+        checksum ^= ord(ch)
+    return f"${body}*{checksum:02X}\r\n".encode("ascii")
+
+def _ubx_command(msg_class, msg_id, payload):
+    frame = struct.pack("<BBH", msg_class, msg_id, len(payload)) + payload
+    ck_a = ck_b = 0
+    for byte in frame:
+        ck_a = (ck_a + byte) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return b"\xb5\x62" + frame + bytes((ck_a, ck_b))
+
+def _baud_command(protocol, baud_rate):
+    if protocol == "ubx":
+        # CFG-PRT for UART1: 8N1, UBX + NMEA in, UBX + NMEA out
+        return _ubx_command(0x06, 0x00, struct.pack("<BBHIIHHHH", 1, 0, 0, 0x08D0, baud_rate, 0x0003, 0x0003, 0, 0))
+    return _nmea_command(f"PMTK251,{baud_rate}")
+
+def _setup_commands(protocol, update_rate):
+    interval = int(round(1000.0 / update_rate))
+    if protocol == "ubx":
+        # CFG-MSG: stop GLL, GSA and GSV on this port (saves bandwidth); then CFG-RATE:
+        # measurement period in ms, one navigation solution per measurement, UTC time
+        return [_ubx_command(0x06, 0x01, struct.pack("<BBB", 0xF0, msg_id, 0)) for msg_id in (0x01, 0x02, 0x03)] + \
+               [_ubx_command(0x06, 0x08, struct.pack("<HHH", interval, 1, 0))]
+    # Only RMC, VTG and GGA (saves bandwidth), then the fix interval in ms
+    return [_nmea_command("PMTK314,0,1,1,1" + ",0" * 15), _nmea_command(f"PMTK220,{interval}")]
+
+def _sentences_arrive(ser, timeout):
+    parser = NmeaParser()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if parser.feed(ser.read(max(ser.in_waiting, 1))):
+            return True
+    return False
+
+def configure(ser, baud_rate=FAST_BAUD_RATE, update_rate=UPDATE_RATE, protocol=GPS_PROTOCOL):
+    """
+    Switch the module to a faster baud rate and update rate, and follow with the UART.
+    If no valid sentence arrives at the new baud rate, the UART goes back to the old one.
+    update_rate is clamped to what the protocol's modules support (MAX_UPDATE_RATE).
+    Returns:
+        bool: True if the module is talking at baud_rate afterwards
+    """
+    old_baud_rate = ser.baudrate
+    if update_rate > MAX_UPDATE_RATE[protocol]:
+        logger.warning("%s Hz is above what %s modules support. Using %s Hz.",
+                       update_rate, protocol.upper(), MAX_UPDATE_RATE[protocol])
+        update_rate = MAX_UPDATE_RATE[protocol]
     try:
-        line = ser.readline().decode('ascii', errors='replace').strip()
-        if line.startswith('$GNGGA') or line.startswith('$GPGGA'):
-            msg = pynmea2.parse(line)
-            if msg.latitude and msg.longitude:
-                return {
-                    'latitude': msg.latitude,
-                    'longitude': msg.longitude,
-                    'altitude': msg.altitude if msg.altitude else 'N/A',
-                    'satellites': msg.num_sats
-                }
-        return None
+        if baud_rate != old_baud_rate:
+            ser.write(_baud_command(protocol, baud_rate))
+            ser.flush()
+            time.sleep(0.1)  # Let the module finish its own transmission before switching
+            ser.baudrate = baud_rate
+        ser.reset_input_buffer()
+        for command in _setup_commands(protocol, update_rate):
+            ser.write(command)
+        ser.flush()
+        if _sentences_arrive(ser, VERIFY_TIME):
+            logger.info("GPS configured: %d baud, %s Hz updates.", baud_rate, update_rate)
+            return True
+        logger.warning("No GPS data at %d baud. Staying at %d baud.", baud_rate, old_baud_rate)
     except Exception as e:
-        print(f"Error reading GPS data: {e}")
+        logger.error("Failed to configure GPS: %s", e)
+    ser.baudrate = old_baud_rate
+    ser.reset_input_buffer()
+    return False
+
+# --- NMEA parsing -------------------------------------------------------------
+
+WAIT_START, BODY, CHECKSUM = range(3)
+
+class NmeaParser:
+    """
+    Incremental NMEA 0183 framer. feed() accepts bytes in arbitrary pieces (a
+    sentence may span several UART reads) and returns the checksummed sentence
+    bodies completed so far, without "$", "*hh" or the line ending. Corrupt or
+    overlong sentences are counted in errors and dropped; a "$" always starts over.
+    """
+
+    def __init__(self):
+        self.state = WAIT_START
+        self.body = bytearray()
+        self.checksum = 0
+        self.received = bytearray()
+        self.sentences = 0
+        self.errors = 0
+
+    def feed(self, data):
+        completed = []
+        for byte in data:
+            if byte == 0x24:  # "$"
+                if self.state != WAIT_START:
+                    self.errors += 1
+                self.state = BODY
+                self.body.clear()
+                self.checksum = 0
+            elif self.state == BODY:
+                if byte == 0x2A:  # "*"
+                    self.state = CHECKSUM
+                    self.received.clear()
+                elif 0x20 <= byte <= 0x7E and len(self.body) < MAX_SENTENCE:
+                    self.body.append(byte)
+                    self.checksum ^= byte
+                else:
+                    self.errors += 1
+                    self.state = WAIT_START
+            elif self.state == CHECKSUM:
+                self.received.append(byte)
+                if len(self.received) == 2:
+                    self.state = WAIT_START
+                    try:
+                        valid = int(self.received, 16) == self.checksum
+                    except ValueError:
+                        valid = False
+                    if valid:
+                        self.sentences += 1
+                        completed.append(self.body.decode("ascii"))
+                    else:
+                        self.errors += 1
+        return completed
+
+def _coordinate(value, hemisphere):
+    # ddmm.mmmm / dddmm.mmmm to signed degrees
+    if not value:
+        return None
+    point = value.find(".")
+    split = (point if point >= 0 else len(value)) - 2
+    degrees = float(value[:split]) + float(value[split:]) / 60.0
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+def _number(value, kind=float):
+    return kind(value) if value else None
+
+# --- Background reader --------------------------------------------------------
+
+class GpsReader:
+    """
+    Background thread that reads the UART as bytes arrive, parses every GGA, RMC
+    and VTG sentence and merges the sentences of one epoch (same UTC time) into a
+    Fix. latest() is a single attribute read, so readers never wait for the
+    UART; history() returns the most recent FIX_HISTORY fixes.
+    """
+
+    def __init__(self, ser, history_size=FIX_HISTORY):
+        self.ser = ser
+        self.parser = NmeaParser()
+        self.history_ring = deque(maxlen=history_size)
+        self.slot = None
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.ser.timeout = READ_TIMEOUT
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="gps", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                data = self.ser.read(max(self.ser.in_waiting, 1))
+            except Exception as e:
+                logger.error("Error reading GPS data: %s", e)
+                self.stop_event.wait(1)
+                continue
+            if not data:
+                continue
+            timestamp = time.monotonic()
+            for sentence in self.parser.feed(data):
+                try:
+                    self._handle(sentence, timestamp)
+                except (ValueError, IndexError) as e:
+                    self.parser.errors += 1
+                    logger.warning("Malformed GPS sentence %r: %s", sentence, e)
+
+    def _handle(self, sentence, timestamp):
+        fields = sentence.split(",")
+        kind = fields[0][2:] if fields[0].startswith("G") else fields[0]
+        current = self.slot
+        if kind == "GGA":
+            update = {"utc": fields[1],
+                      "latitude": _coordinate(fields[2], fields[3]),
+                      "longitude": _coordinate(fields[4], fields[5]),
+                      "quality": _number(fields[6], int),
+                      "satellites": _number(fields[7], int),
+                      "altitude": _number(fields[9])}
+            update["valid"] = bool(update["quality"])
+        elif kind == "RMC":
+            update = {"utc": fields[1],
+                      "latitude": _coordinate(fields[3], fields[4]),
+                      "longitude": _coordinate(fields[5], fields[6]),
+                      "speed": _number(fields[7]),
+                      "course": _number(fields[8]),
+                      "valid": fields[2] == "A"}
+            if update["speed"] is not None:
+                update["speed"] *= KNOTS_TO_MPS
+        elif kind == "VTG":
+            # No time of its own: belongs to the epoch in progress
+            update = {"course": _number(fields[1]), "speed": _number(fields[7])}
+            if update["speed"] is not None:
+                update["speed"] /= 3.6
+            if current is None:
+                return
+        else:
+            return
+        new_epoch = current is None or ("utc" in update and update["utc"] != current.utc)
+        if new_epoch:
+            self.seq += 1
+            fix = Fix(self.seq, timestamp, None, None, None, None, None, None, None, None, False)
+            if current is not None:
+                # Carry position forward until this epoch's own sentences replace it
+                fix = fix._replace(latitude=current.latitude, longitude=current.longitude,
+                                   altitude=current.altitude, satellites=current.satellites)
+        else:
+            fix = current
+        fix = fix._replace(timestamp=timestamp, **{key: value for key, value in update.items() if value is not None})
+        if new_epoch:
+            self.history_ring.append(fix)
+        else:
+            self.history_ring[-1] = fix
+        self.slot = fix
+        with self.condition:
+            self.condition.notify_all()
+
+    def latest(self):
+        """
+        Returns:
+            Fix: Newest (possibly still incomplete) fix, or None before the first sentence
+        """
+        return self.slot
+
+    def history(self):
+        return list(self.history_ring)
+
+    def wait_for_fix(self, after_seq=0, timeout=None):
+        """
+        Block until a fix newer than after_seq is published.
+        Returns:
+            Fix: The newest fix, or None on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.slot is not None and self.slot.seq > after_seq, timeout)
+        fix = self.slot
+        return fix if fix is not None and fix.seq > after_seq else None
+
+def start_reader(ser):
+    """
+    Start the background reader on an open UART (idempotent).
+    Returns:
+        GpsReader: The running reader
+    """
+    global reader
+    if reader is None or reader.ser is not ser:
+        if reader is not None:
+            reader.stop()
+        reader = GpsReader(ser)
+    reader.start()
+    return reader
+
+def read_gps(ser):
+    """
+    Latest valid fix as a dict, without waiting for the UART. Starts the
+    background reader on first use.
+    Returns:
+        dict: latitude, longitude, altitude, satellites, speed (m/s), course (degrees)
+              and age (s), or None if there is no valid fix yet
+    """
+    fix = start_reader(ser).latest()
+    if fix is None or not fix.valid or fix.latitude is None or fix.longitude is None:
         return None
+    return {
+        'latitude': fix.latitude,
+        'longitude': fix.longitude,
+        'altitude': fix.altitude if fix.altitude is not None else 'N/A',
+        'satellites': fix.satellites,
+        'speed': fix.speed,
+        'course': fix.course,
+        'age': time.monotonic() - fix.timestamp
+    }
 
 def gps_close(ser):
-    print("Closing GPS UART port...")
+    if reader is not None:
+        reader.stop()
+    logger.info("Closing GPS UART port...")
     try:
         ser.close()
-        print("GPS UART port closed successfully.")
+        logger.info("GPS UART port closed successfully.")
     except Exception as e:
-        print(f"Failed to close GPS UART port: {e}")
+        logger.error("Failed to close GPS UART port: %s", e)
 
 if __name__ == "__main__":
+    gps = None
     try:
         gps = gps_init()
         print("Reading GPS data (press Ctrl+C to stop)...")
@@ -48,7 +364,8 @@ if __name__ == "__main__":
             data = read_gps(gps)
             if data:
                 print(f"Latitude: {data['latitude']:.6f}, Longitude: {data['longitude']:.6f}, "
-                      f"Altitude: {data['altitude']} m, Satellites: {data['satellites']}")
+                      f"Altitude: {data['altitude']} m, Satellites: {data['satellites']}, "
+                      f"Speed: {data['speed'] or 0:.2f} m/s, Course: {data['course'] or 0:.1f}°")
             else:
                 print("No valid GPS data received.")
             time.sleep(1)
@@ -57,4 +374,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error in main: {e}")
     finally:
-        gps_close(gps)
+        if gps is not None:
+            gps_close(gps)
@@ -0,0 +1,303 @@
+import heapq
+import math
+import threading
+import time
+import numpy as np
+
+from occupancy_grid import OCCUPIED_PROBABILITY
+
+# Planner settings
+PLANNER_CELL = 2          # Occupancy grid cells per planner cell (100 mm at 50 mm)
+ROBOT_RADIUS = 150.0      # mm; obstacles are inflated by this
+FREE_PROBABILITY = 0.35   # Cells below this count as known free
+UNKNOWN_COST = 1.5        # Step cost through unexplored cells (known free cells cost 1)
+REPLAN_BUDGET = 0.02      # Seconds of search per replan call
+GOAL_DISTANCE = 2000.0    # mm ahead along the goal heading
+GOAL_REACHED = 500.0      # Move the goal on once the robot is this close
+LOOKAHEAD = 250.0         # mm along the path used to pick the steering direction
+
+INF = float("inf")
+NEIGHBORS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+class DStarLite:
+    """
+    D* Lite over an 8-connected cost grid (Koenig & Likhachev). The search runs
+    backwards from the goal, so when the robot moves or cell costs change only
+    the affected part of the previous solution is repaired. compute() stops at
+    a deadline and resumes from the same queue on the next call.
+    """
+
+    def __init__(self, costs, start, goal):
+        self.height, self.width = costs.shape
+        self.costs = costs.copy()
+        self.g = np.full(costs.size, INF)
+        self.rhs = np.full(costs.size, INF)
+        self.queue = []
+        self.queued = {}  # cell -> key it is queued with (older heap entries are stale)
+        self.km = 0.0
+        self.start = self._index(start)
+        self.last_start = self.start
+        self.goal = self._index(goal)
+        self.rhs[self.goal] = 0.0
+        self._push(self.goal, (self._heuristic(self.start, self.goal), 0.0))
+        self.expanded = 0
+
+    def _index(self, cell):
+        return cell[0] * self.width + cell[1]
+
+    def _cell(self, index):
+        return divmod(index, self.width)
+
+    def _heuristic(self, a, b):
+        ai, aj = divmod(a, self.width)
+        bi, bj = divmod(b, self.width)
+        di, dj = abs(ai - bi), abs(aj - bj)
+        return max(di, dj) + (math.sqrt(2) - 1) * min(di, dj)
+
+    def _neighbors(self, index):
+        i, j = divmod(index, self.width)
+        for di, dj in NEIGHBORS:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < self.height and 0 <= nj < self.width:
+                yield ni * self.width + nj, (1.4142135623730951 if di and dj else 1.0)
+
+    def _edge(self, a, b, step):
+        ca = self.costs.flat[a]
+        cb = self.costs.flat[b]
+        if ca == INF or cb == INF:
+            return INF
+        return step * (ca + cb) / 2.0
+
+    def _key(self, index):
+        best = min(self.g[index], self.rhs[index])
+        return (best + self._heuristic(self.start, index) + self.km, best)
+
+    def _push(self, index, key):
+        self.queued[index] = key
+        heapq.heappush(self.queue, (key[0], key[1], index))
+
+    def _update_vertex(self, index):
+        if index != self.goal:
+            best = INF
+            for neighbor, step in self._neighbors(index):
+                cost = self._edge(index, neighbor, step) + self.g[neighbor]
+                if cost < best:
+                    best = cost
+            self.rhs[index] = best
+        self.queued.pop(index, None)
+        if self.g[index] != self.rhs[index]:
+            self._push(index, self._key(index))
+
+    def _top(self):
+        while self.queue:
+            k1, k2, index = self.queue[0]
+            if self.queued.get(index) == (k1, k2):
+                return (k1, k2), index
+            heapq.heappop(self.queue)  # Stale entry
+        return (INF, INF), None
+
+    def move_start(self, start):
+        start = self._index(start)
+        if start != self.start:
+            self.km += self._heuristic(self.last_start, start)
+            self.last_start = start
+            self.start = start
+
+    def update_costs(self, costs):
+        """
+        Apply a new cost grid, repairing only around the cells that changed.
+        Returns:
+            int: Number of changed cells
+        """
+        changed = np.flatnonzero(costs.ravel() != self.costs.ravel())
+        if not len(changed):
+            return 0
+        self.costs = costs.copy()
+        touched = set()
+        for index in changed:
+            touched.add(int(index))
+            for neighbor, _ in self._neighbors(int(index)):
+                touched.add(neighbor)
+        for index in touched:
+            self._update_vertex(index)
+        return len(changed)
+
+    def compute(self, deadline=None):
+        """
+        Expand vertices until the start is consistent or the deadline passes.
+        Returns:
+            bool: True if the search finished
+        """
+        while True:
+            key, index = self._top()
+            start_key = self._key(self.start)
+            if key >= start_key and self.rhs[self.start] == self.g[self.start]:
+                return True
+            if index is None:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            heapq.heappop(self.queue)
+            del self.queued[index]
+            self.expanded += 1
+            new_key = self._key(index)
+            if key < new_key:
+                self._push(index, new_key)
+            elif self.g[index] > self.rhs[index]:
+                self.g[index] = self.rhs[index]
+                for neighbor, _ in self._neighbors(index):
+                    self._update_vertex(neighbor)
+            else:
+                self.g[index] = INF
+                self._update_vertex(index)
+                for neighbor, _ in self._neighbors(index):
+                    self._update_vertex(neighbor)
+
+    def path(self, max_length=None):
+        """
+        Follow the cheapest successors from the start.
+        Returns:
+            list: (i, j) cells from start to goal, or [] if the goal is unreachable
+        """
+        if self.g[self.start] == INF:
+            return []
+        index = self.start
+        cells = [self._cell(index)]
+        limit = max_length or self.costs.size
+        while index != self.goal and len(cells) < limit:
+            best, best_cost = None, INF
+            for neighbor, step in self._neighbors(index):
+                cost = self._edge(index, neighbor, step) + self.g[neighbor]
+                if cost < best_cost:
+                    best, best_cost = neighbor, cost
+            if best is None or best_cost == INF:
+                return []
+            index = best
+            cells.append(self._cell(index))
+        return cells
+
+class GridPlanner:
+    """
+    Keeps a D* Lite search over a coarse, inflated cost map of an OccupancyGrid
+    towards a waypoint GOAL_DISTANCE ahead along a goal heading. replan() is
+    cheap enough for every map update: it applies only the cost changes and
+    searches for at most REPLAN_BUDGET seconds. The search is rebuilt only
+    when the goal moves or the grid window slides.
+    """
+
+    def __init__(self, grid, cell=PLANNER_CELL, robot_radius=ROBOT_RADIUS):
+        self.grid = grid
+        self.cell = cell
+        self.resolution = grid.resolution * cell
+        self.inflation = int(math.ceil(robot_radius / self.resolution))
+        self.goal_heading = 0.0
+        self.goal = None        # World (x, y) of the current waypoint
+        self.search = None
+        self.origin = None      # Grid origin the search was built for
+        self.done = False
+        self.lock = threading.Lock()
+
+    def set_goal_heading(self, heading):
+        with self.lock:
+            self.goal_heading = heading
+            self.goal = None
+
+    def cost_map(self):
+        """
+        Returns:
+            numpy.ndarray: Step cost per planner cell (1 free, UNKNOWN_COST unexplored, inf blocked)
+        """
+        probabilities = self.grid.probabilities()
+        size = probabilities.shape[0] // self.cell
+        blocks = probabilities[:size * self.cell, :size * self.cell].reshape(size, self.cell, size, self.cell)
+        worst = blocks.max(axis=(1, 3))
+        costs = np.where(worst < FREE_PROBABILITY, 1.0, UNKNOWN_COST)
+        occupied = worst > OCCUPIED_PROBABILITY
+        inflated = occupied.copy()
+        r = self.inflation
+        for di in range(-r, r + 1):
+            for dj in range(-r, r + 1):
+                if di * di + dj * dj > r * r:
+                    continue
+                shifted = np.zeros_like(occupied)
+                shifted[max(di, 0):size + min(di, 0), max(dj, 0):size + min(dj, 0)] = \
+                    occupied[max(-di, 0):size + min(-di, 0), max(-dj, 0):size + min(-dj, 0)]
+                inflated |= shifted
+        costs[inflated] = INF
+        return costs
+
+    def _cell_of(self, x, y, size):
+        i, j = self.grid.cell_of(x, y)
+        return min(max(i // self.cell, 0), size - 1), min(max(j // self.cell, 0), size - 1)
+
+    def _free_cell_near(self, costs, cell):
+        # Nearest passable cell to a blocked goal, searching outwards ring by ring
+        size = costs.shape[0]
+        for radius in range(1, size):
+            for di in range(-radius, radius + 1):
+                for dj in (-radius, radius) if abs(di) != radius else range(-radius, radius + 1):
+                    i, j = cell[0] + di, cell[1] + dj
+                    if 0 <= i < size and 0 <= j < size and costs[i, j] != INF:
+                        return i, j
+        return cell
+
+    def replan(self, pose, budget=REPLAN_BUDGET):
+        """
+        Bring the plan up to date with the map and the robot's pose.
+        Args:
+            pose: odometry.Pose (or anything with x, y and heading)
+            budget: Seconds the search may run in this call
+        Returns:
+            bool: True if the plan is complete for the current map
+        """
+        with self.lock:
+            deadline = time.monotonic() + budget
+            costs = self.cost_map()
+            size = costs.shape[0]
+            if self.goal is None or math.hypot(self.goal[0] - pose.x, self.goal[1] - pose.y) < GOAL_REACHED:
+                self.goal = (pose.x + GOAL_DISTANCE * math.cos(self.goal_heading),
+                             pose.y + GOAL_DISTANCE * math.sin(self.goal_heading))
+                self.search = None
+            start = self._cell_of(pose.x, pose.y, size)
+            costs[start] = min(costs[start], UNKNOWN_COST)  # The robot's own cell is never blocked
+            origin = tuple(self.grid.origin)
+            if self.search is None or origin != self.origin:
+                goal = self._cell_of(self.goal[0], self.goal[1], size)
+                if costs[goal] == INF:
+                    goal = self._free_cell_near(costs, goal)
+                self.search = DStarLite(costs, start, goal)
+                self.origin = origin
+            else:
+                self.search.move_start(start)
+                self.search.update_costs(costs)
+            self.done = self.search.compute(deadline)
+            return self.done
+
+    def waypoints(self):
+        """
+        Returns:
+            list: (x, y) world points along the current plan, robot first
+        """
+        with self.lock:
+            if self.search is None:
+                return []
+            cells = self.search.path()
+        return [self.grid.world_of(i * self.cell + (self.cell - 1) / 2.0, j * self.cell + (self.cell - 1) / 2.0)
+                for i, j in cells]
+
+    def steering(self, pose, lookahead=LOOKAHEAD):
+        """
+        Returns:
+            float: Turn in radians (positive = left) towards the point LOOKAHEAD
+                   along the plan, or None if there is no path
+        """
+        points = self.waypoints()
+        if not points:
+            return None
+        target = points[-1]
+        for x, y in points[1:]:
+            if math.hypot(x - pose.x, y - pose.y) >= lookahead:
+                target = (x, y)
+                break
+        bearing = math.atan2(target[1] - pose.y, target[0] - pose.x)
+        return math.atan2(math.sin(bearing - pose.heading), math.cos(bearing - pose.heading))
@@ -0,0 +1,46 @@
+import os
+from dotenv import load_dotenv
+from log import get_logger
+
+load_dotenv()
+logger = get_logger("hal")
+
+# Hardware backend selection.
+# "pi"  - real devices (pigpio, smbus, RPi.GPIO, board/busio, picamera, serial)
+# "sim" - in-process simulated devices from sim_hardware.py
+# Set FORMBOT_HARDWARE=sim (environment or .env) to run the stack without a robot.
+HARDWARE_BACKEND = os.getenv("FORMBOT_HARDWARE", "pi").lower()
+
+# With the sim backend, FORMBOT_SIM_CLOUD=1 also replaces google.generativeai
+# with a simulated model so detection latency can be benchmarked offline.
+SIM_CLOUD = os.getenv("FORMBOT_SIM_CLOUD", "0") == "1"
+
+_installed = False
+
+def using_simulation():
+    return HARDWARE_BACKEND == "sim"
+
+def select_backend(backend=None, cloud=None, **sim_options):
+    """
+    Select the hardware backend. Must run before the device modules are imported.
+    Args:
+        backend: "pi" or "sim" (defaults to FORMBOT_HARDWARE)
+        cloud: Also simulate the Gemini API (sim backend only)
+        **sim_options: Overrides for sim_hardware.SIM_CONFIG
+    """
+    global HARDWARE_BACKEND, SIM_CLOUD, _installed
+    if backend is not None:
+        HARDWARE_BACKEND = backend.lower()
+    if cloud is not None:
+        SIM_CLOUD = cloud
+    if HARDWARE_BACKEND not in ("pi", "sim"):
+        raise ValueError(f"Unknown hardware backend: {HARDWARE_BACKEND}")
+    if HARDWARE_BACKEND == "sim":
+        import sim_hardware
+        sim_hardware.configure(**sim_options)
+        if not _installed:
+            sim_hardware.install(cloud=SIM_CLOUD)
+            _installed = True
+            logger.info("Using simulated hardware backend.")
+
+select_backend()
@@ -0,0 +1,123 @@
+import math
+import threading
+import time
+import numpy as np
+
+import motor
+from log import get_logger
+
+logger = get_logger("heading")
+
+# Filter settings
+CALIBRATION_TIME = 1.0    # Seconds of stationary samples averaged for the initial gyro bias
+BIAS_RATE = 0.5           # Fraction per second the bias moves towards the gyro reading while stopped
+SETTLE_TIME = 0.5         # Seconds after the wheels stop before the gyro counts as standing still
+TILT_ALPHA = 0.98         # Complementary filter weight of the gyro for pitch and roll (per sample)
+
+class HeadingEstimator:
+    """
+    Yaw, pitch and roll from an mpu6050.ImuSampler. Yaw integrates the bias-
+    corrected gyro z rate; the bias is re-estimated whenever the wheels are
+    commanded to stop, which keeps drift in check without a magnetometer.
+    Pitch and roll blend the gyro with the accelerometer (complementary
+    filter). New samples are pulled and processed as one NumPy batch whenever
+    an angle is read, so there is no extra thread.
+    """
+
+    def __init__(self, sampler, tilt_alpha=TILT_ALPHA, bias_rate=BIAS_RATE):
+        self.sampler = sampler
+        self.tilt_alpha = tilt_alpha
+        self.bias_rate = bias_rate
+        self.count = 0
+        self.last_time = None
+        self.bias = np.zeros(3)   # Gyro bias in °/s
+        self.yaw = 0.0            # Radians, counter-clockwise
+        self.pitch = 0.0          # Degrees
+        self.roll = 0.0
+        self.rate = 0.0           # Latest yaw rate in rad/s
+        self.stopped_since = None
+        self.lock = threading.Lock()
+
+    def calibrate(self, duration=CALIBRATION_TIME):
+        """
+        Average the gyro over duration seconds with the robot standing still.
+        """
+        start_count = self.sampler.read_since(0)[0]
+        time.sleep(duration)
+        count, rows = self.sampler.read_since(start_count)
+        if len(rows):
+            with self.lock:
+                self.bias = rows[:, 4:7].mean(axis=0)
+                accel = rows[:, 1:4].mean(axis=0)
+                self.pitch, self.roll = self._tilt(accel[None, :])
+                self.pitch, self.roll = float(self.pitch[0]), float(self.roll[0])
+                self.count = count
+                self.last_time = rows[-1, 0]
+            logger.info("Gyro bias calibrated from %d samples: z = %.3f°/s.", len(rows), self.bias[2])
+        else:
+            logger.warning("No IMU samples for calibration. Using zero gyro bias.")
+
+    def _tilt(self, accel):
+        pitch = np.degrees(np.arctan2(accel[:, 1], np.sqrt(accel[:, 0] ** 2 + accel[:, 2] ** 2)))
+        roll = np.degrees(np.arctan2(-accel[:, 0], accel[:, 2]))
+        return pitch, roll
+
+    def _blend(self, start, rates, dt, measured):
+        # x[n] = a * (x[n-1] + rate[n] * dt[n]) + (1 - a) * measured[n], solved for the whole batch
+        a = self.tilt_alpha
+        n = len(rates)
+        powers = a ** np.arange(1, n + 1)
+        terms = (a * rates * dt + (1 - a) * measured) / powers
+        return powers * (start + np.cumsum(terms))
+
+    def update(self):
+        """
+        Process every sample the IMU produced since the last update.
+        Returns:
+            int: Number of samples processed
+        """
+        with self.lock:
+            count, rows = self.sampler.read_since(self.count)
+            self.count = count
+            if not len(rows):
+                return 0
+            times = rows[:, 0]
+            previous = self.last_time if self.last_time is not None else times[0]
+            dt = np.diff(np.concatenate(([previous], times)))
+            self.last_time = times[-1]
+            gyro = rows[:, 4:7]
+            if motor.wheel_duty["left"] == 0 and motor.wheel_duty["right"] == 0:
+                if self.stopped_since is None:
+                    self.stopped_since = time.monotonic()
+                still = times > self.stopped_since + SETTLE_TIME
+                if still.any():
+                    # Standing still: every gyro reading is bias
+                    weight = min(self.bias_rate * float(dt[still].sum()), 1.0)
+                    self.bias += (gyro[still].mean(axis=0) - self.bias) * weight
+            else:
+                self.stopped_since = None
+            corrected = gyro - self.bias
+            self.yaw += math.radians(float((corrected[:, 2] * dt).sum()))
+            self.yaw = math.atan2(math.sin(self.yaw), math.cos(self.yaw))
+            self.rate = math.radians(float(corrected[-1, 2]))
+            recent = slice(-200, None)  # Older samples no longer affect the tilt (and a ** -n stays finite)
+            pitch, roll = self._tilt(rows[recent, 1:4])
+            self.pitch = float(self._blend(self.pitch, corrected[recent, 0], dt[recent], pitch)[-1])
+            self.roll = float(self._blend(self.roll, corrected[recent, 1], dt[recent], roll)[-1])
+            return len(rows)
+
+    def heading(self):
+        """
+        Returns:
+            float: Current yaw in radians (counter-clockwise, wrapped to ±pi)
+        """
+        self.update()
+        return self.yaw
+
+    def angles(self):
+        """
+        Returns:
+            tuple: (yaw in degrees, pitch in degrees, roll in degrees)
+        """
+        self.update()
+        return math.degrees(self.yaw), self.pitch, self.roll
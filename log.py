@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Logging configuration (environment or .env, like FORMBOT_HARDWARE)
+# FORMBOT_LOG_LEVEL  - console level: DEBUG, INFO (default), WARNING, ERROR
+# FORMBOT_LOG_JSONL  - also write every record at FORMBOT_LOG_FILE_LEVEL to this JSONL file
+LOG_LEVEL = os.getenv("FORMBOT_LOG_LEVEL", "INFO").upper()
+LOG_JSONL = os.getenv("FORMBOT_LOG_JSONL", "")
+LOG_FILE_LEVEL = os.getenv("FORMBOT_LOG_FILE_LEVEL", "DEBUG").upper()
+
+# Queue and rate-limit settings
+QUEUE_SIZE = 4096         # Records waiting for the writer thread; more are dropped, never blocking the caller
+RATE_LIMIT_BURST = 5      # Identical messages (same call site and format string) let through per window...
+RATE_LIMIT_WINDOW = 10.0  # ...of this many seconds; the rest are counted and summarized
+
+ROOT_LOGGER = "formbot"
+
+# LogRecord attributes that are not user-supplied extra fields
+_STANDARD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most burst records with the same message from one call site
+    (logger, file, line and unformatted message) through per window seconds. When the window rolls over, the first record carries
+    a "(suppressed N similar messages)" note. Runs in the logging thread before
+    the record is queued, so suppressed records cost a dict lookup.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, window=RATE_LIMIT_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sites = {}  # (name, pathname, lineno, msg) -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno, record.msg)
+        now = record.created
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            site[1] += 1
+            if site[1] <= self.burst:
+                return True
+            site[2] += 1
+            return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full instead of raising,
+    so a stalled console can never block the control loop.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Keep args and extra fields for the JSONL sink; format the message once here
+        record.message = record.getMessage()
+        if getattr(record, "suppressed", 0):
+            record.message += f" (suppressed {record.suppressed} similar messages)"
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonlFormatter(logging.Formatter):
+    """
+    One JSON object per line: t (epoch seconds), level, logger, msg, any extra
+    fields passed with extra={...}, and the traceback if there was one.
+    """
+
+    def format(self, record):
+        entry = {"t": round(record.created, 6), "level": record.levelname, "logger": record.name, "msg": record.msg}
+        for key, value in vars(record).items():
+            if key not in _STANDARD_FIELDS and key != "suppressed":
+                entry[key] = value if isinstance(value, (int, float, str, bool, type(None))) else repr(value)
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, separators=(",", ":"))
+
+class ConsoleFormatter(logging.Formatter):
+    # Plain messages as before, with the level only for warnings and errors
+    def format(self, record):
+        text = record.msg if record.levelno < logging.WARNING else f"{record.levelname}: {record.msg}"
+        return text + ("\n" + record.exc_text if record.exc_text else "")
+
+def _level(value):
+    return value if isinstance(value, int) else logging.getLevelName(str(value).upper())
+
+def setup_logging(level=None, jsonl_path=None, file_level=None):
+    """
+    Route the "formbot" loggers through a background queue to the console and,
+    optionally, a JSONL file. Called on import with the FORMBOT_LOG_* settings;
+    call again to change them.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+        level = _level(level or LOG_LEVEL)
+        console = logging.StreamHandler()
+        console.setFormatter(ConsoleFormatter())
+        console.setLevel(level)
+        handlers = [console]
+        jsonl_path = jsonl_path if jsonl_path is not None else LOG_JSONL
+        lowest = level
+        if jsonl_path:
+            sink = logging.FileHandler(jsonl_path, encoding="utf-8")
+            sink.setFormatter(JsonlFormatter())
+            sink.setLevel(_level(file_level or LOG_FILE_LEVEL))
+            handlers.append(sink)
+            lowest = min(lowest, sink.level)
+        log_queue = queue.Queue(QUEUE_SIZE)
+        root = logging.getLogger(ROOT_LOGGER)
+        if _queue_handler is not None:
+            root.removeHandler(_queue_handler)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(RateLimitFilter())
+        root.addHandler(_queue_handler)
+        root.setLevel(lowest)  # Records below every sink's level are rejected before any work
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+def flush_logging():
+    """
+    Write out everything queued so far and stop the writer thread.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+def get_logger(name):
+    """
+    Returns:
+        logging.Logger: Child of the "formbot" logger, e.g. get_logger("motor")
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+setup_logging()
+atexit.register(flush_logging)
@@ -1,189 +1,402 @@
+import os
 import time
+import asyncio
+import hal  # selects real or simulated devices
 import picamera
-import io
-import base64
 import threading
-import keyboard
-import socket
-from vl53l1x import vl53l1x_init, read_distance, vl53l1x_stop
+from vl53l1x import vl53l1x_init, vl53l1x_stop, start_sampler
 from motor import motor_init, forward, reverse, turn_left, turn_right, u_turn, stop as motor_stop, cleanup as motor_cleanup
-from servo import servo_init, servo_move, servo_stop
-from gemini import detect_object, plan_path, chat_assistant
+from servo import servo_init, servo_move, servo_stop, start_sweep, stop_sweep, get_angle as get_servo_angle, angle_at
+from servo import VERTICAL_SERVO_PIN
+from gemini import detect_objects_batch, plan_path, chat_assistant, warm_up
 from path_plan import plan_path as plan_navigation
+from connectivity import is_online, start_monitor, stop_monitor
+from frame_buffer import FrameRing, CaptureWorker, pin_frame, release_frame
+from scene_change import SceneChangeGate
+from odometry import Odometry
+from occupancy_grid import OccupancyGrid, RangeMapper
+from grid_planner import GridPlanner
+from heading import HeadingEstimator
+import navigation
+from telemetry import TelemetryStore
+from run_index import RunIndex
+import motor
+import metrics
+from log import get_logger
+
+logger = get_logger("main")
 
 # Global variables for sensors, actuators, and data storage
 camera = None
 vl53 = None
+ranging_sampler = None    # Background VL53L1X sampler
+frame_ring = FrameRing()  # Reusable JPEG capture buffers
+capture_worker = None     # Continuous capture into frame_ring
+scene_gate = SceneChangeGate()  # On-device filter in front of cloud detection
+odometry = Odometry()           # Dead-reckoning pose from the motor commands
+occupancy = OccupancyGrid()     # Map built from every range sample
+planner = GridPlanner(occupancy)  # Incremental path planner over the occupancy grid
+mapper = None                   # RangeMapper feeding occupancy once the sampler runs
+imu_sampler = None              # Background MPU6050 sampler
+heading_estimator = None        # Gyro heading used to end turns and by odometry
 stop_event = threading.Event()
-run_data = []  # Store data from Autonomous Mode runs
+reflex_tripped = threading.Event()  # Set by the safety reflex after it cut the motors
+telemetry = TelemetryStore()  # Per-tick data from Autonomous Mode runs, kept on disk
+run_index = RunIndex(telemetry)  # Offline answers about past runs
 
-def is_online(timeout=2):
-    try:
-        socket.setdefaulttimeout(timeout)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect(("8.8.8.8", 53))
-        return True
-    except (socket.error, socket.timeout):
-        print("No internet connection detected. Skipping Gemini API calls...")
-        return False
+# Autonomous Mode scheduling
+CONTROL_RATE_HZ = 20          # Fixed control tick rate
+SENSOR_CHECK_INTERVAL = 0.1   # Seconds between VL53L1X health checks
+RANGE_MAX_AGE = 0.5           # Ignore distances older than this (seconds)
+SENSOR_TIMEOUT = 5.0          # Disable the VL53L1X after this long without a valid reading
+DETECTION_BATCH_SIZE = 17     # Frames per Gemini request (one 0-80° sweep at 5° steps)
+MAP_INTERVAL = 0.2            # Seconds between occupancy grid updates
+GEMINI_WARM_UP = os.getenv("FORMBOT_GEMINI_WARM_UP", "0") == "1"  # Warm up the Gemini connection at startup
+control_stats = {"ticks": 0, "overruns": 0, "max_tick_time": 0.0}
+
+# Instrumentation served by metrics.start_server(); p50/p99 of "loop" is the tick latency
+loop_time = metrics.stage("loop")
+metrics.register("formbot_loop_ticks_total", "Autonomous Mode control ticks", lambda: control_stats["ticks"], "counter")
+metrics.register("formbot_loop_overruns_total", "Control ticks that overran their period",
+                 lambda: control_stats["overruns"], "counter")
+metrics.register("formbot_reflex_trips_total", "Safety reflex motor stops",
+                 lambda: navigation.reflex.trips if navigation.reflex else None, "counter")
 
 def initialize_system():
-    global camera, vl53
+    global camera, vl53, capture_worker, ranging_sampler, imu_sampler, heading_estimator
 
     try:
         camera = picamera.PiCamera()
         camera.resolution = (640, 480)
         camera.start_preview()
         time.sleep(2)
-        print("Camera initialized successfully.")
+        logger.info("Camera initialized successfully.")
     except Exception as e:
-        print(f"Failed to initialize camera: {e}")
+        logger.error("Failed to initialize camera: %s", e)
         camera = None
 
     if vl53l1x_init():
         from vl53l1x import vl53 as vl53_obj
         vl53 = vl53_obj
-        print("VL53L1X initialized successfully.")
+        ranging_sampler = start_sampler()
+        logger.info("VL53L1X initialized successfully.")
     else:
-        print("Continuing without VL53L1X distance sensor.")
+        logger.warning("Continuing without VL53L1X distance sensor.")
 
     motor_init()
     servo_init()
+    if ranging_sampler is not None:
+        # Cuts the motors on close readings by itself, whatever the control loop is doing
+        navigation.start_reflex(ranging_sampler, on_trip=lambda sample: reflex_tripped.set())
+    try:
+        import mpu6050  # Opens the I2C bus on import
+        mpu6050.mpu6050_init()
+        imu_sampler = mpu6050.start_sampler()
+        heading_estimator = HeadingEstimator(imu_sampler)
+        heading_estimator.calibrate()  # The robot is standing still during startup
+        motor.set_heading_source(heading_estimator.heading)
+        odometry.heading_source = heading_estimator.heading
+        logger.info("MPU6050 initialized successfully. Turns end on the measured heading.")
+    except Exception as e:
+        logger.warning("Failed to initialize MPU6050: %s. Turns fall back to fixed durations.", e)
+        imu_sampler = heading_estimator = None
+    if camera:
+        # Frames are tagged with the servo angle commanded when they were exposed
+        capture_worker = CaptureWorker(camera, frame_ring, angle_source=get_servo_angle)
+        capture_worker.start()
+    start_monitor()
+    try:
+        metrics.start_server()
+    except OSError as e:
+        logger.warning("Metrics endpoint unavailable: %s", e)
+    if GEMINI_WARM_UP:
+        # Open the Gemini connection in the background so startup isn't delayed
+        threading.Thread(target=warm_up, daemon=True).start()
 
 def cleanup_system():
-    print("Cleaning up system resources...")
+    logger.info("Cleaning up system resources...")
+    navigation.stop_reflex()
+    stop_monitor()
+    metrics.stop_server()
+    if capture_worker:
+        capture_worker.stop()
     if camera:
         camera.close()
-        print("Camera closed.")
+        logger.info("Camera closed.")
     vl53l1x_stop(vl53)
     servo_stop()
     motor_stop()
     motor_cleanup()
-    print("All resources cleaned up.")
+    if imu_sampler is not None:
+        import mpu6050
+        mpu6050.mpu6050_close()
+    telemetry.close()
+    logger.info("All resources cleaned up.")
+
+def record_detections(run_log, frames, labels):
+    """
+    Store one telemetry record per detected frame, at the time and servo angles
+    the frame was exposed and with the range sample closest to it.
+    Args:
+        run_log: TelemetryStore of the current run
+        frames: Frames sent in one detection batch
+        labels: Label per frame, as returned by detect_objects_batch
+    """
+    samples = [sample for sample in ranging_sampler.history() if sample.valid] if ranging_sampler else []
+    clock_offset = time.time() - time.monotonic()  # Frame times are monotonic, telemetry uses wall time
+    for frame, label in zip(frames, labels):
+        horizontal_angle = frame.angle if frame.angle is not None else angle_at(frame.timestamp)
+        vertical_angle = angle_at(frame.timestamp, VERTICAL_SERVO_PIN)
+        nearest = min(samples, key=lambda sample: abs(sample.timestamp - frame.timestamp), default=None)
+        distance = nearest.distance if nearest and abs(nearest.timestamp - frame.timestamp) <= RANGE_MAX_AGE else None
+        run_log.append(label, round(horizontal_angle), round(vertical_angle), distance,
+                       timestamp=frame.timestamp + clock_offset)
 
 def capture_image():
+    """
+    Return a JPEG frame. While the capture worker runs this is its newest frame
+    and never blocks; otherwise a still is captured into the next frame_ring slot.
+    Returns:
+        memoryview: Raw JPEG bytes (valid until FRAME_RING_SLOTS newer captures), or None
+    """
     if not camera:
         return None
-    stream = io.BytesIO()
+    if capture_worker and capture_worker.running:
+        frame = capture_worker.latest()
+        return frame.data if frame else None
+    slot = frame_ring.next_slot()
     try:
-        camera.capture(stream, format='jpeg', use_video_port=True)
-        stream.seek(0)
-        image_data = stream.read()
-        return base64.b64encode(image_data).decode('utf-8')
+        with metrics.timed("capture"):
+            camera.capture(slot, format='jpeg', use_video_port=True)
+        return slot.view()
     except Exception as e:
-        print(f"Error capturing image: {e}")
+        logger.error("Error capturing image: %s", e)
         return None
-    finally:
-        stream.close()
 
 def autonomous_mode():
     print("Entering Autonomous Mode... (Press Ctrl+C to return to mode selection)")
+    telemetry.begin_run()
+    try:
+        asyncio.run(autonomous_loop(telemetry))
+    except KeyboardInterrupt:
+        print("Returning to mode selection...")
+    except Exception as e:
+        logger.exception("Error in Autonomous Mode: %s", e)
+    finally:
+        stop_event.set()
+        telemetry.end_run()
+        run_index.refresh()
+
+async def autonomous_loop(run_log):
+    """
+    Cooperative scheduler for Autonomous Mode.
+    The control tick runs at CONTROL_RATE_HZ and only reads the latest results of
+    the ranging, servo, capture and detection tasks, so a slow Gemini call or
+    capture never delays the obstacle check. Blocking driver calls run in the
+    default executor.
+    Args:
+        run_log: TelemetryStore that receives one record per detected frame
+    """
+    global mapper
+    loop = asyncio.get_running_loop()
     servo_angles = {"horizontal": 0, "vertical": 0}
     servo_lock = threading.Lock()
-    horizontal_angle = 0
-    vertical_angle = 0
-    direction = 1
-    local_run_data = []
-    sensor_failed = False
-    consecutive_failures = 0  # Track consecutive sensor failures
+    range_valid_after = {"time": 0.0}  # Ignore samples taken before the last obstacle maneuver
+    sweep = {"frames": [], "completed": 0}  # Frames captured since the last detection batch
+    maneuver = {"future": None}  # Background maneuver started by the last obstacle plan
+    last_detected_object = "unknown"
+    sensor_failed = vl53 is None or ranging_sampler is None
+    scanning = False
 
-    def servo_thread():
-        nonlocal horizontal_angle, vertical_angle, direction
+    async def servo_task():
+        # The sweep itself is hardware-timed (servo.start_sweep); mirror its
+        # commanded angles and count the ends of the sweep for batching
+        player = await loop.run_in_executor(None, start_sweep)
+        last_completed = 0
         while not stop_event.is_set():
-            horizontal_angle, vertical_angle, direction, at_extreme = servo_move(horizontal_angle, vertical_angle, direction)
-            with servo_lock:
-                servo_angles["horizontal"] = horizontal_angle
-                servo_angles["vertical"] = vertical_angle
-            time.sleep(0.05)
+            if player.running:
+                now = time.monotonic()
+                horizontal_angle, vertical_angle, _ = player.angles_at(now)
+                with servo_lock:
+                    servo_angles["horizontal"] = round(horizontal_angle)
+                    servo_angles["vertical"] = round(vertical_angle)
+                completed = player.sweeps_completed(now)
+                if completed != last_completed:
+                    sweep["completed"] += 1
+                last_completed = completed
+            await asyncio.sleep(1.0 / CONTROL_RATE_HZ)
 
-    try:
-        servo_t = threading.Thread(target=servo_thread)
-        servo_t.start()
+    async def ranging_task():
+        # Watch the background sampler and give up on the sensor if it stops producing valid ranges
+        nonlocal sensor_failed
+        last_valid = loop.time()
+        while not stop_event.is_set() and not sensor_failed:
+            sample = ranging_sampler.latest()
+            if sample is not None and sample.valid:
+                last_valid = max(last_valid, sample.timestamp)
+            elif scanning:
+                last_valid = loop.time()
+            elif loop.time() - last_valid > SENSOR_TIMEOUT:
+                logger.error("VL53L1X sensor failed repeatedly. Disabling sensor...")
+                sensor_failed = True
+            await asyncio.sleep(SENSOR_CHECK_INTERVAL)
 
-        last_detected_object = "unknown"
-        scanning = False
+    async def capture_task():
+        # Take one frame per 5° step of the sweep from the capture worker into the sweep batch
+        last_seq = 0
+        last_step = None
+        while not stop_event.is_set():
+            frame = capture_worker.latest() if capture_worker else None
+            if frame is None or frame.seq == last_seq:
+                await asyncio.sleep(1.0 / CONTROL_RATE_HZ)
+                continue
+            last_seq = frame.seq
+            step = round(frame.angle / 5) if frame.angle is not None else None
+            if step != last_step:
+                last_step = step
+                # Skip the cloud call when the view hasn't changed since it was last sent
+                if not await loop.run_in_executor(None, scene_gate.check, frame.data, frame.angle):
+                    continue
+                pin_frame(frame)  # Keep the slot until the batch is answered
+                sweep["frames"].append(frame)
 
+    async def detection_task():
+        # Detect objects on each finished sweep with one batched request.
+        # detect_objects_batch answers from the cache and skips the API while offline.
+        nonlocal last_detected_object
+        sweeps_seen = 0
         while not stop_event.is_set():
-            # Read distance from VL53L1X, with error handling
-            distance = None
-            if not sensor_failed:
-                distance = read_distance(vl53)
-                if distance is None:
-                    consecutive_failures += 1
-                    if consecutive_failures >= 5:  # Too many consecutive failures
-                        print("VL53L1X sensor failed repeatedly. Disabling sensor...")
-                        sensor_failed = True
-                else:
-                    consecutive_failures = 0  # Reset counter on successful read
+            sweep_done = sweep["completed"] != sweeps_seen
+            if not sweep["frames"] or (not sweep_done and len(sweep["frames"]) < DETECTION_BATCH_SIZE):
+                await asyncio.sleep(1.0 / CONTROL_RATE_HZ)
+                continue
+            sweeps_seen = sweep["completed"]
+            frames, sweep["frames"] = sweep["frames"], []
+            try:
+                detected_objects = await loop.run_in_executor(
+                    None, detect_objects_batch, [(frame.data, frame.angle) for frame in frames])
+                logger.info("Gemini API response: %s", ", ".join(
+                    f"{frame.angle:.0f}°={label}" for frame, label in zip(frames, detected_objects)))
+                record_detections(run_log, frames, detected_objects)
+                # Only the status line uses the latest label; the run data keeps every frame's
+                for detected_object in detected_objects:
+                    if detected_object != "unknown":
+                        last_detected_object = detected_object
+            except Exception as e:
+                logger.error("Error with Gemini API: %s. Treating as offline...", e)
+                last_detected_object = "unknown (offline)"
+            finally:
+                for frame in frames:
+                    release_frame(frame)
 
-            distance_str = f"{distance} mm" if distance is not None else "N/A"
+    async def mapping_task():
+        # Fold new range samples into the occupancy grid and repair the plan
+        while not stop_event.is_set():
+            await asyncio.sleep(MAP_INTERVAL)
+            if await loop.run_in_executor(None, mapper.update):
+                await loop.run_in_executor(None, planner.replan, odometry.latest())
 
-            # Capture image and detect object (every 5 degrees), but only if online
+    async def navigation_task():
+        nonlocal scanning
+        # plan_navigation steps the servo itself, so pause the sweep meanwhile
+        await loop.run_in_executor(None, stop_sweep)
+        try:
+            # Returns as soon as the maneuver has started; it runs on the motor scheduler
+            maneuver["future"] = await loop.run_in_executor(None, lambda: plan_navigation(
+                vl53, servo_move, servo_angles, servo_lock, stop_event,
+                mapper=mapper, odometry=odometry, planner=planner))
+        except Exception as e:
+            logger.error("Error in path planning: %s. Continuing in Autonomous Mode...", e)
+        if not stop_event.is_set():
+            with servo_lock:
+                resume_angle = servo_angles["horizontal"]
+            await loop.run_in_executor(None, start_sweep, resume_angle)
+        range_valid_after["time"] = loop.time()
+        scanning = False
+        logger.info("Resuming Autonomous Mode after obstacle handling...")
+
+    odometry.reset()
+    planner.set_goal_heading(0.0)  # Keep heading the way the robot faced at the start
+    tasks = [asyncio.create_task(task()) for task in (servo_task, ranging_task, capture_task, detection_task)]
+    if ranging_sampler is not None:
+        mapper = RangeMapper(occupancy, ranging_sampler, odometry,
+                             lambda timestamp: angle_at(timestamp, interpolate=True))
+        tasks.append(asyncio.create_task(mapping_task()))
+    period = 1.0 / CONTROL_RATE_HZ
+    next_tick = loop.time()
+    last_status = 0.0
+    motor_state = "stop"
+    reflex_tripped.clear()
+    try:
+        while not stop_event.is_set():
+            tick_start = loop.time()
+            odometry.update()
+            if reflex_tripped.is_set():
+                # The reflex stopped the motors from its own thread; drive on once the path is clear
+                reflex_tripped.clear()
+                motor_state = "stop"
+            distance = None
+            sample = ranging_sampler.latest() if not sensor_failed else None
+            if (sample is not None and sample.valid and sample.timestamp > range_valid_after["time"]
+                    and tick_start - sample.timestamp <= RANGE_MAX_AGE):
+                distance = sample.distance
             with servo_lock:
                 horizontal_angle = servo_angles["horizontal"]
                 vertical_angle = servo_angles["vertical"]
-            if horizontal_angle % 5 == 0:
-                image_base64 = capture_image()
-                if not image_base64:
-                    print("Failed to capture image. Skipping detection...")
-                    time.sleep(1)
-                    continue
-                if is_online():
-                    try:
-                        detected_object = detect_object(image_base64)
-                        print(f"Gemini API response: {detected_object}")
-                        last_detected_object = detected_object if detected_object != "unknown" else last_detected_object
-                    except Exception as e:
-                        print(f"Error with Gemini API: {e}. Treating as offline...")
-                        last_detected_object = "unknown (offline)"
-                else:
-                    last_detected_object = "unknown (offline)"
-
-            # Store data for this run
-            local_run_data.append({
-                "object": last_detected_object,
-                "horizontal_angle": horizontal_angle,
-                "vertical_angle": vertical_angle,
-                "distance": distance
-            })
 
             # Check for obstacle within 300 mm, but only if sensor is working
-            if not sensor_failed and distance is not None and distance < 300 and not scanning:
-                print(f"Obstacle detected at {distance} mm at horizontal angle {horizontal_angle}°!")
+            maneuvering = maneuver["future"] is not None and not maneuver["future"].done()
+            # While maneuvering only forward motion is guarded: a turn away starts with the obstacle still close
+            guarded = not maneuvering or (motor.wheel_duty["left"] > 0 and motor.wheel_duty["right"] > 0)
+            if not sensor_failed and distance is not None and distance < 300 and not scanning and guarded:
+                logger.warning("Obstacle detected at %s mm at horizontal angle %s°!", distance, horizontal_angle,
+                               extra={"distance": distance, "horizontal_angle": horizontal_angle})
                 motor_stop()
+                motor_state = "stop"
                 scanning = True
-                try:
-                    plan_navigation(vl53, servo_move, servo_angles, servo_lock, stop_event)
-                except Exception as e:
-                    print(f"Error in path planning: {e}. Continuing in Autonomous Mode...")
-                scanning = False
-                print("Resuming Autonomous Mode after obstacle handling...")
-                continue
-            else:
+                tasks.append(asyncio.create_task(navigation_task()))
+            elif not scanning and not maneuvering:
                 # If sensor has failed, move forward cautiously as a fallback
-                if sensor_failed and not scanning:
-                    print("VL53L1X sensor unavailable. Moving forward cautiously...")
+                if sensor_failed and motor_state != "cautious":
+                    logger.warning("VL53L1X sensor unavailable. Moving forward cautiously...")
                     forward(duty_cycle=10)
-                elif not scanning:
-                    print("No obstacle within 300 mm. Moving forward...")
+                    motor_state = "cautious"
+                elif not sensor_failed and motor_state != "forward":
+                    logger.info("No obstacle within 300 mm. Moving forward...")
                     forward(duty_cycle=15)
+                    motor_state = "forward"
+            else:
+                # Scanning or maneuvering leaves the motors in an unknown state
+                motor_state = "unknown"
 
-            # Print status
-            with servo_lock:
-                print(f"Detected Object: {last_detected_object}, Horizontal Servo: {servo_angles['horizontal']}°, "
-                      f"Vertical Servo: {servo_angles['vertical']}°, Distance: {distance_str}")
-
-            time.sleep(1)
+            # Log status once per second
+            if tick_start - last_status >= 1.0:
+                last_status = tick_start
+                logger.info("Detected Object: %s, Horizontal Servo: %s°, Vertical Servo: %s°, Distance: %s",
+                            last_detected_object, horizontal_angle, vertical_angle,
+                            f"{distance} mm" if distance is not None else "N/A",
+                            extra={"object": last_detected_object, "horizontal_angle": horizontal_angle,
+                                   "vertical_angle": vertical_angle, "distance": distance})
 
-    except KeyboardInterrupt:
-        print("Returning to mode selection...")
-        stop_event.set()
-        servo_t.join()
-        run_data.append(local_run_data)
-    except Exception as e:
-        print(f"Error in Autonomous Mode: {e}")
+            tick_time = loop.time() - tick_start
+            loop_time.record(tick_time)
+            control_stats["ticks"] += 1
+            control_stats["max_tick_time"] = max(control_stats["max_tick_time"], tick_time)
+            next_tick += period
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Overran the tick; skip missed ticks instead of bursting
+                control_stats["overruns"] += 1
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+    finally:
         stop_event.set()
-        servo_t.join()
-        run_data.append(local_run_data)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        motor_stop()  # Also ends a maneuver still running in the background
+        stop_sweep()
 
 def ai_chat_mode():
     print("Entering AI Chat Mode... (Type 'exit' to return to mode selection)")
@@ -192,28 +405,16 @@ def ai_chat_mode():
         if query.lower() == "exit":
             break
 
-        if "last run" in query.lower() and "pest" in query.lower():
-            if not run_data:
-                print("Assistant: No data from previous runs available.")
-                continue
-            last_run = run_data[-1]
-            pest_found = False
-            pest_details = []
-            for entry in last_run:
-                if "pest" in entry["object"].lower():
-                    pest_found = True
-                    pest_details.append(f"Pest detected: {entry['object']} at horizontal angle {entry['horizontal_angle']}°, distance {entry['distance']} mm")
-            if pest_found:
-                response = "Yes, pests were found in the last run.\n" + "\n".join(pest_details)
-            else:
-                response = "No pests were found in the last run."
+        # Questions about past runs are answered from the local index, online or not
+        response = run_index.answer(query)
+        if response is not None:
             print(f"Assistant: {response}")
         else:
             if is_online():
                 response = chat_assistant(query)
                 print(f"Assistant: {response}")
             else:
-                print("Assistant: Cannot respond to queries offline. Please ask about the last run or reconnect to the internet.")
+                print("Assistant: Cannot respond to queries offline. Please ask about past runs or reconnect to the internet.")
 
 def remote_mode():
     print("Entering Remote Mode... (Type 'q' to return to mode selection)")
@@ -287,6 +488,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\nProgram interrupted by user.")
     except Exception as e:
-        print(f"Error in main program: {e}")
+        logger.exception("Error in main program: %s", e)
     finally:
         cleanup_system()
@@ -0,0 +1,259 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from log import get_logger
+
+logger = get_logger("metrics")
+
+# Metrics endpoint (environment or .env, like FORMBOT_HARDWARE)
+# FORMBOT_METRICS_PORT - port of the Prometheus endpoint; 0 disables it
+# FORMBOT_METRICS_HOST - interface to bind; only this machine by default
+METRICS_PORT = int(os.getenv("FORMBOT_METRICS_PORT", "9108"))
+METRICS_HOST = os.getenv("FORMBOT_METRICS_HOST", "127.0.0.1")
+
+# Histogram settings
+HISTOGRAM_LOWEST = 1e-6    # Seconds; smaller values count in the first bucket
+HISTOGRAM_HIGHEST = 1e3    # Seconds; larger values count in the last bucket
+SUB_BUCKETS = 32           # Linear buckets per power of two (~3% worst-case relative error)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+STAGE_METRIC = "formbot_stage_seconds"
+
+_stages = {}     # stage name -> Histogram
+_counters = {}   # metric name -> Counter
+_gauges = {}     # metric name -> (help, type, function)
+_registry_lock = threading.Lock()
+server = None    # ThreadingHTTPServer once start_server() has run
+
+class Histogram:
+    """
+    Fixed-memory latency histogram in the style of HdrHistogram: every power of
+    two between lowest and highest is split into sub_buckets linear buckets, so
+    a recorded value is kept to within 1/sub_buckets of itself whatever its
+    magnitude. With the defaults this is 960 counters per histogram, however
+    many values are recorded. record() is a frexp and an increment.
+    """
+
+    def __init__(self, lowest=HISTOGRAM_LOWEST, highest=HISTOGRAM_HIGHEST, sub_buckets=SUB_BUCKETS):
+        self.lowest = lowest
+        self.min_exponent = math.frexp(lowest)[1]
+        self.max_exponent = math.frexp(highest)[1]
+        self.sub_buckets = sub_buckets
+        self.counts = [0] * ((self.max_exponent - self.min_exponent + 1) * sub_buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def _index(self, value):
+        if value < self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+        if exponent > self.max_exponent:
+            return len(self.counts) - 1
+        return (exponent - self.min_exponent) * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _upper(self, index):
+        # Largest value that lands in bucket index
+        exponent, sub = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 1) / (2 * self.sub_buckets), exponent + self.min_exponent)
+
+    def record(self, value):
+        index = self._index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """
+        Record the seconds spent in a with block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def snapshot(self, quantiles=QUANTILES):
+        """
+        Returns:
+            dict: count, sum, max and the requested quantiles (NaN while empty), consistent with each other
+        """
+        with self.lock:
+            counts, count, total, largest = list(self.counts), self.count, self.sum, self.max
+        values = {}
+        cumulative, index = 0, 0
+        for q in sorted(quantiles):
+            # Upper bound of the bucket holding the quantile, capped at the largest value seen
+            target = max(q * count, 1)
+            while index < len(counts) - 1 and cumulative + counts[index] < target:
+                cumulative += counts[index]
+                index += 1
+            values[q] = min(self._upper(index), largest) if count else math.nan
+        return {"count": count, "sum": total, "max": largest, "quantiles": values}
+
+    def quantile(self, q):
+        return self.snapshot((q,))["quantiles"][q]
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+class Counter:
+    """
+    Monotonic count exposed as a Prometheus counter.
+    """
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+def stage(name):
+    """
+    Latency histogram of one pipeline stage, exposed as formbot_stage_seconds{stage="name"}.
+    Look it up once at import and call record() or time() on the hot path.
+    Returns:
+        Histogram: The stage's histogram (created on first use)
+    """
+    histogram = _stages.get(name)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _stages.setdefault(name, Histogram())
+    return histogram
+
+def timed(name):
+    """
+    Context manager recording the time spent in a with block under stage name.
+    """
+    return stage(name).time()
+
+def counter(name, help_text):
+    """
+    Returns:
+        Counter: The counter called name (created on first use)
+    """
+    with _registry_lock:
+        if name not in _counters:
+            _counters[name] = Counter(name, help_text)
+        return _counters[name]
+
+def register(name, help_text, function, metric_type="gauge"):
+    """
+    Expose a value another module already keeps (cache hits, quota use) without
+    touching its hot path. function is called on every scrape.
+    Args:
+        metric_type: "gauge" or "counter"
+    """
+    with _registry_lock:
+        _gauges[name] = (help_text, metric_type, function)
+
+def reset():
+    """
+    Clear every stage histogram and counter (e.g. between benchmark runs).
+    """
+    with _registry_lock:
+        histograms, counters = list(_stages.values()), list(_counters.values())
+    for histogram in histograms:
+        histogram.reset()
+    for item in counters:
+        with item.lock:
+            item.value = 0
+
+def _number(value):
+    if isinstance(value, float):
+        return "NaN" if math.isnan(value) else repr(value)
+    return str(value)
+
+def render():
+    """
+    Returns:
+        str: Every metric in the Prometheus text exposition format (version 0.0.4)
+    """
+    with _registry_lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+    lines = []
+    if stages:
+        lines.append(f"# HELP {STAGE_METRIC} Time spent per pipeline stage")
+        lines.append(f"# TYPE {STAGE_METRIC} summary")
+        snapshots = [(name, histogram.snapshot()) for name, histogram in stages]
+        for name, snapshot in snapshots:
+            for q, value in snapshot["quantiles"].items():
+                lines.append(f'{STAGE_METRIC}{{stage="{name}",quantile="{q}"}} {_number(value)}')
+            lines.append(f'{STAGE_METRIC}_sum{{stage="{name}"}} {_number(snapshot["sum"])}')
+            lines.append(f'{STAGE_METRIC}_count{{stage="{name}"}} {snapshot["count"]}')
+        lines.append(f"# HELP {STAGE_METRIC}_max Longest time seen per pipeline stage")
+        lines.append(f"# TYPE {STAGE_METRIC}_max gauge")
+        for name, snapshot in snapshots:
+            lines.append(f'{STAGE_METRIC}_max{{stage="{name}"}} {_number(snapshot["max"])}')
+    for name, item in counters:
+        lines.append(f"# HELP {name} {item.help}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {item.value}")
+    for name, (help_text, metric_type, function) in gauges:
+        try:
+            value = function()
+        except Exception as e:
+            logger.debug("Metric %s unavailable: %s", name, e)
+            continue
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request from %s: " + format, self.client_address[0], *args)
+
+def start_server(port=None, host=None):
+    """
+    Serve render() at http://host:port/metrics from a background thread (idempotent).
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled (port 0)
+    """
+    global server
+    port = METRICS_PORT if port is None else port
+    if server is not None or not port:
+        return server
+    server = ThreadingHTTPServer((host or METRICS_HOST, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics available at http://%s:%d/metrics", *server.server_address[:2])
+    return server
+
+def stop_server():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
@@ -1,5 +1,14 @@
+import hal  # selects real or simulated devices
 import RPi.GPIO as GPIO
+import math
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import Future
+from log import get_logger
+import metrics
+
+logger = get_logger("motor")
 
 # Left driver pin setup
 LEFT_RPWM = 12  # GPIO12 for Left motor forward
@@ -22,6 +31,74 @@ right_r_pwm = None
 left_l_pwm = None
 right_l_pwm = None
 
+# Signed duty cycle currently applied per wheel (+ forward, - reverse), read by odometry
+wheel_duty = {"left": 0.0, "right": 0.0}
+
+# Motor controller settings
+SLEW_RATE = 150.0       # Max duty cycle change in % per second (0 -> 15% in 0.1 s)
+RAMP_INTERVAL = 0.01    # Seconds between ramp steps
+
+controller = None  # MotorController started by motor_init()
+scheduler = None   # ManeuverScheduler started by motor_init()
+
+update_time = metrics.stage("motor_update")  # One ramp step written to the PWM channels
+metrics.register("formbot_motor_writes_total", "ChangeDutyCycle calls made",
+                 lambda: controller.updates if controller else None, "counter")
+metrics.register("formbot_motor_skipped_commands_total", "Motor commands that matched the current target",
+                 lambda: controller.skipped if controller else None, "counter")
+
+# One leg of a maneuver: signed wheel duty cycles held for duration seconds, or
+# until the robot has turned angle degrees (positive = left) when a heading
+# source is set. duration None sets the wheels and moves straight on.
+Step = namedtuple("Step", ["left", "right", "duration", "angle", "message"])
+
+# How a maneuver ended. reason is "completed", "stopped" (safety stop),
+# "preempted" (a newer command) or "cancelled"; turned is in degrees or None.
+ManeuverResult = namedtuple("ManeuverResult", ["name", "completed", "reason", "turned", "elapsed"])
+
+# Closed-loop turn settings
+TURN_TOLERANCE = 2.0        # Stop a turn this many degrees short of the target (the robot coasts on)
+TURN_TIMEOUT_FACTOR = 2.0   # Heading-terminated turns give up after this many times the timed duration
+TURN_POLL_INTERVAL = 0.005  # Seconds between heading checks
+
+heading_source = None  # Function returning the robot's yaw in radians, see set_heading_source()
+
+def set_heading_source(source):
+    """
+    Use source() (yaw in radians, counter-clockwise) to end turns on heading instead of time.
+    """
+    global heading_source
+    heading_source = source
+
+def _wait_for_turn(angle, duration, cancel_event=None):
+    """
+    Wait until the robot has turned angle degrees (positive = left). Without an
+    angle or a heading source this is a plain timed wait of duration seconds.
+    Either wait ends early once cancel_event is set.
+    Returns:
+        float: Degrees turned, or None for a timed wait
+    """
+    source = heading_source
+    cancel_event = cancel_event or threading.Event()
+    if angle is None or source is None:
+        cancel_event.wait(duration)
+        return None
+    target = abs(angle) - TURN_TOLERANCE
+    sign = 1 if angle > 0 else -1
+    deadline = time.monotonic() + duration * TURN_TIMEOUT_FACTOR
+    previous = source()
+    turned = 0.0
+    while turned * sign < target and not cancel_event.is_set():
+        if time.monotonic() > deadline:
+            logger.warning("Turn stopped after %.0f° of %.0f° (time limit).", abs(turned), abs(angle))
+            break
+        cancel_event.wait(TURN_POLL_INTERVAL)
+        current = source()
+        # Accumulate wrapped steps so turns past 180° keep counting
+        turned += math.degrees(math.atan2(math.sin(current - previous), math.cos(current - previous)))
+        previous = current
+    return turned
+
 def motor_init():
     global left_r_pwm, right_r_pwm, left_l_pwm, right_l_pwm
 
@@ -57,90 +134,366 @@ def motor_init():
     left_l_pwm.start(0)
     right_l_pwm.start(0)
 
-    print("Motors initialized with PWM.")
+    start_controller()
+    start_scheduler()
+    logger.info("Motors initialized with PWM.")
+
+class MotorController:
+    """
+    Background thread that owns the four PWM channels. Callers post signed
+    target duty cycles per wheel with set_target(); the thread ramps the applied
+    duty towards them at slew_rate (a direction change ramps through zero) and
+    only touches a channel when its value changes. Immediate targets, used for
+    stopping, are applied in the calling thread without waiting for the ramp.
+    """
+
+    def __init__(self, slew_rate=SLEW_RATE, interval=RAMP_INTERVAL):
+        self.slew_rate = slew_rate
+        self.interval = interval
+        self.target = {"left": 0.0, "right": 0.0}
+        self.applied = {"left": 0.0, "right": 0.0}
+        self.channels = {}         # PWM object -> duty cycle last written
+        self.updates = 0           # ChangeDutyCycle calls made
+        self.skipped = 0           # Commands that matched the current target
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="motor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def set_target(self, left, right, immediate=False):
+        """
+        Post signed duty cycles (% , + forward) for both wheels.
+        Returns:
+            bool: False if the wheels were already headed for these values
+        """
+        with self.condition:
+            if self.target["left"] == left and self.target["right"] == right and \
+                    (not immediate or self.applied == self.target):
+                self.skipped += 1
+                return False
+            self.target["left"], self.target["right"] = float(left), float(right)
+            if immediate or not self.running:
+                self._apply(self.target)
+            self.condition.notify_all()
+            return True
+
+    def settled(self):
+        return self.applied == self.target
+
+    def _write(self, pwm, duty):
+        if self.channels.get(pwm) != duty:
+            pwm.ChangeDutyCycle(duty)
+            self.channels[pwm] = duty
+            self.updates += 1
+
+    def _apply(self, duties):
+        # Caller holds self.condition
+        start = time.perf_counter()
+        for wheel, forward_pwm, reverse_pwm in (("left", left_r_pwm, left_l_pwm), ("right", right_r_pwm, right_l_pwm)):
+            duty = duties[wheel]
+            # Switch the opposing channel off before driving the other one
+            if duty >= 0:
+                self._write(reverse_pwm, 0)
+                self._write(forward_pwm, duty)
+            else:
+                self._write(forward_pwm, 0)
+                self._write(reverse_pwm, -duty)
+            self.applied[wheel] = duty
+            wheel_duty[wheel] = duty
+        update_time.record(time.perf_counter() - start)
+
+    def _run(self):
+        last = time.monotonic()
+        while not self.stop_event.is_set():
+            with self.condition:
+                if self.applied == self.target:
+                    self.condition.wait()
+                    last = time.monotonic() - self.interval
+                    continue
+                now = time.monotonic()
+                step = self.slew_rate * (now - last)
+                last = now
+                ramped = {}
+                for wheel in ("left", "right"):
+                    current, target = self.applied[wheel], self.target[wheel]
+                    ramped[wheel] = target if abs(target - current) <= step else \
+                        current + math.copysign(step, target - current)
+                try:
+                    self._apply(ramped)
+                except Exception as e:
+                    logger.error("Motor update failed: %s", e)
+            self.stop_event.wait(self.interval)
+
+def start_controller(**options):
+    """
+    Start the motor controller thread (idempotent).
+    Returns:
+        MotorController: The running controller
+    """
+    global controller
+    if controller is None:
+        controller = MotorController(**options)
+    controller.start()
+    return controller
+
+class _Maneuver:
+    def __init__(self, name, steps, stop_at_end):
+        self.name = name
+        self.steps = steps
+        self.stop_at_end = stop_at_end
+        self.future = Future()
+        self.cancel_event = threading.Event()
+        self.reason = None
+
+class ManeuverScheduler:
+    """
+    Runs one maneuver (a list of Steps) at a time on a background thread so
+    callers keep running while the robot turns. submit() returns a
+    concurrent.futures.Future resolved with a ManeuverResult; a newer
+    submission, a direct motor command or stop() preempts the running
+    maneuver within TURN_POLL_INTERVAL. Done-callbacks run on the scheduler
+    thread and must not block.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.pending = None
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="maneuver", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.cancel("cancelled")
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def submit(self, name, steps, stop_at_end=True, callback=None):
+        """
+        Queue a maneuver, preempting the current one.
+        Args:
+            stop_at_end: Stop the wheels once the last step is done
+            callback: Called with the Future when the maneuver ends
+        Returns:
+            concurrent.futures.Future: Resolves to a ManeuverResult
+        """
+        maneuver = _Maneuver(name, steps, stop_at_end)
+        if callback is not None:
+            maneuver.future.add_done_callback(callback)
+        with self.condition:
+            self._cancel("preempted")
+            self.pending = maneuver
+            self.condition.notify_all()
+        return maneuver.future
+
+    def cancel(self, reason="cancelled"):
+        with self.condition:
+            return self._cancel(reason)
+
+    def preempt(self, reason, action):
+        """
+        Cancel any maneuver and run action() before a maneuver step can slip in between.
+        """
+        with self.condition:
+            self._cancel(reason)
+            return action()
+
+    def busy(self):
+        return self.active is not None or self.pending is not None
+
+    def _cancel(self, reason):
+        # Caller holds self.condition
+        cancelled = False
+        if self.active is not None and not self.active.cancel_event.is_set():
+            self.active.reason = reason
+            self.active.cancel_event.set()
+            cancelled = True
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.future.set_result(ManeuverResult(pending.name, False, reason, None, 0.0))
+            cancelled = True
+        return cancelled
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                while self.pending is None and not self.stop_event.is_set():
+                    self.condition.wait()
+                maneuver, self.pending = self.pending, None
+                self.active = maneuver
+            if maneuver is None:
+                continue
+            try:
+                result = self._execute(maneuver)
+            except Exception as e:
+                logger.error("Maneuver %s failed: %s", maneuver.name, e)
+                _command(0, 0, "Stopping motors...", immediate=True)
+                result = ManeuverResult(maneuver.name, False, f"error: {e}", None, 0.0)
+            with self.condition:
+                self.active = None
+            maneuver.future.set_result(result)
+
+    def _execute(self, maneuver):
+        start = time.monotonic()
+        turned = None
+        for step in maneuver.steps:
+            with self.condition:
+                if maneuver.cancel_event.is_set():
+                    break
+                _command(step.left, step.right, step.message)
+            if step.duration is None:
+                continue
+            step_turn = _wait_for_turn(step.angle, step.duration, maneuver.cancel_event)
+            if step_turn is not None:
+                turned = (turned or 0.0) + step_turn
+        with self.condition:
+            completed = not maneuver.cancel_event.is_set()
+            if completed and maneuver.stop_at_end and self.pending is None:
+                _command(0, 0, "Stopping motors...", immediate=True)
+        reason = "completed" if completed else maneuver.reason
+        return ManeuverResult(maneuver.name, completed, reason, turned, time.monotonic() - start)
+
+def start_scheduler():
+    """
+    Start the maneuver scheduler thread (idempotent).
+    Returns:
+        ManeuverScheduler: The running scheduler
+    """
+    global scheduler
+    if scheduler is None:
+        scheduler = ManeuverScheduler()
+    scheduler.start()
+    return scheduler
+
+def maneuver(name, steps, stop_at_end=True, wait=False, callback=None):
+    """
+    Run a sequence of Steps in the background, preempting any running maneuver.
+    Returns:
+        Future resolving to a ManeuverResult, or the ManeuverResult itself with wait=True
+    """
+    future = scheduler.submit(name, steps, stop_at_end, callback)
+    return future.result() if wait else future
+
+def maneuvering():
+    """
+    Returns:
+        bool: True while a maneuver is running or queued
+    """
+    return scheduler is not None and scheduler.busy()
+
+def _direct(left, right, message, immediate=False, reason="preempted"):
+    # A direct command replaces whatever maneuver is running
+    if scheduler is None:
+        return _command(left, right, message, immediate)
+    return scheduler.preempt(reason, lambda: _command(left, right, message, immediate))
+
+def _command(left, right, message, immediate=False):
+    """
+    Post a wheel target to the controller, printing message only if it changes anything.
+    Returns:
+        bool: True if the target changed
+    """
+    if controller is None:
+        raise RuntimeError("Motors not initialized; call motor_init() first")
+    changed = controller.set_target(left, right, immediate)
+    if changed and message:
+        logger.info(message, extra={"left": left, "right": right})
+    return changed
 
 def forward(duty_cycle=15):  # Reduced default duty cycle
     """
     Move forward at the specified duty cycle using PWM.
     """
-    print(f"Moving forward at {duty_cycle}% duty cycle...")
-    # Ensure reverse PWM is off
-    left_l_pwm.ChangeDutyCycle(0)
-    right_l_pwm.ChangeDutyCycle(0)
-    # Set forward PWM to specified duty cycle
-    left_r_pwm.ChangeDutyCycle(duty_cycle)
-    right_r_pwm.ChangeDutyCycle(duty_cycle)
+    _direct(duty_cycle, duty_cycle, f"Moving forward at {duty_cycle}% duty cycle...")
 
 def reverse(duty_cycle=15):  # Reduced default duty cycle
     """
     Move reverse at the specified duty cycle using PWM.
     """
-    print(f"Moving reverse at {duty_cycle}% duty cycle...")
-    # Ensure forward PWM is off
-    left_r_pwm.ChangeDutyCycle(0)
-    right_r_pwm.ChangeDutyCycle(0)
-    # Set reverse PWM to specified duty cycle
-    left_l_pwm.ChangeDutyCycle(duty_cycle)
-    right_l_pwm.ChangeDutyCycle(duty_cycle)
+    _direct(-duty_cycle, -duty_cycle, f"Moving reverse at {duty_cycle}% duty cycle...")
 
-def turn_left(duty_cycle=15, duration=2):  # Reduced default duty cycle
+def turn_left(duty_cycle=15, duration=2, angle=None, wait=True, callback=None):  # Reduced default duty cycle
     """
     Turn left: left motor reverse, right motor forward.
+    With angle (degrees) and a heading source the turn ends once the robot has
+    turned that far; duration then only bounds it (times TURN_TIMEOUT_FACTOR).
+    With wait=False the turn runs in the background (see maneuver()).
     """
-    print(f"Turning left at {duty_cycle}% duty cycle...")
-    left_r_pwm.ChangeDutyCycle(0)
-    left_l_pwm.ChangeDutyCycle(duty_cycle)
-    right_r_pwm.ChangeDutyCycle(duty_cycle)
-    right_l_pwm.ChangeDutyCycle(0)
-    time.sleep(duration)
-    stop()
+    step = Step(-duty_cycle, duty_cycle, duration, angle and abs(angle), f"Turning left at {duty_cycle}% duty cycle...")
+    return maneuver("turn_left", [step], wait=wait, callback=callback)
 
-def turn_right(duty_cycle=15, duration=2):  # Reduced default duty cycle
+def turn_right(duty_cycle=15, duration=2, angle=None, wait=True, callback=None):  # Reduced default duty cycle
     """
     Turn right: left motor forward, right motor reverse.
+    With angle (degrees) and a heading source the turn ends once the robot has
+    turned that far; duration then only bounds it (times TURN_TIMEOUT_FACTOR).
+    With wait=False the turn runs in the background (see maneuver()).
     """
-    print(f"Turning right at {duty_cycle}% duty cycle...")
-    left_r_pwm.ChangeDutyCycle(duty_cycle)
-    left_l_pwm.ChangeDutyCycle(0)
-    right_r_pwm.ChangeDutyCycle(0)
-    right_l_pwm.ChangeDutyCycle(duty_cycle)
-    time.sleep(duration)
-    stop()
+    step = Step(duty_cycle, -duty_cycle, duration, angle and -abs(angle), f"Turning right at {duty_cycle}% duty cycle...")
+    return maneuver("turn_right", [step], wait=wait, callback=callback)
 
-def u_turn(duty_cycle=15, duration=3):  # Reduced default duty cycle
+def u_turn(duty_cycle=15, duration=3, angle=None, wait=True, callback=None):  # Reduced default duty cycle
     """
     Perform a U-turn: left motor forward, right motor reverse for a longer duration.
+    With angle (degrees, e.g. 180) and a heading source the turn ends on heading.
+    With wait=False the turn runs in the background (see maneuver()).
     """
-    print(f"Performing U-turn at {duty_cycle}% duty cycle...")
-    left_r_pwm.ChangeDutyCycle(duty_cycle)
-    left_l_pwm.ChangeDutyCycle(0)
-    right_r_pwm.ChangeDutyCycle(0)
-    right_l_pwm.ChangeDutyCycle(duty_cycle)
-    time.sleep(duration)
-    stop()
+    step = Step(duty_cycle, -duty_cycle, duration, angle and -abs(angle), f"Performing U-turn at {duty_cycle}% duty cycle...")
+    return maneuver("u_turn", [step], wait=wait, callback=callback)
 
 def stop():
     """
-    Stop the motors by setting the duty cycle to 0%.
+    Stop the motors by setting the duty cycle to 0%. Not ramped: applied at once.
+    Cancels any running maneuver.
     """
-    print("Stopping motors...")
-    left_r_pwm.ChangeDutyCycle(0)
-    right_r_pwm.ChangeDutyCycle(0)
-    left_l_pwm.ChangeDutyCycle(0)
-    right_l_pwm.ChangeDutyCycle(0)
+    _direct(0, 0, "Stopping motors...", immediate=True, reason="stopped")
 
 def cleanup():
     """
     Clean up GPIO and stop PWM.
     """
-    print("Cleaning up GPIO and stopping PWM...")
+    logger.info("Cleaning up GPIO and stopping PWM...")
     stop()
+    scheduler.stop()
+    controller.stop()
     left_r_pwm.stop()
     right_r_pwm.stop()
     left_l_pwm.stop()
     right_l_pwm.stop()
     GPIO.cleanup()
-    print("GPIO cleaned up.")
+    logger.info("GPIO cleaned up.")
 
 if __name__ == "__main__":
     try:
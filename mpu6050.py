@@ -1,35 +1,67 @@
+import hal  # selects real or simulated devices
 import smbus
 import time
 import math
+import threading
+import numpy as np
+from log import get_logger
+
+logger = get_logger("mpu6050")
 
 # MPU6050 registers
 MPU6050_ADDR = 0x68
 PWR_MGMT_1 = 0x6B
 ACCEL_XOUT_H = 0x3B
 GYRO_XOUT_H = 0x43
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+FIFO_EN = 0x23
+INT_STATUS = 0x3A
+USER_CTRL = 0x6A
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+
+# Register bits
+FIFO_EN_ACCEL_GYRO = 0x78  # XG, YG, ZG and ACCEL into the FIFO (12 bytes per sample)
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+INT_STATUS_FIFO_OFLOW = 0x10
+
+# Sampling settings
+SAMPLE_RATE = 200        # Hz; 1 kHz / (1 + SMPLRT_DIV) with the DLPF on
+DLPF_CFG = 3             # 44 Hz accelerometer / 42 Hz gyro bandwidth
+ACCEL_SCALE = 16384.0    # LSB per g at ±2g
+GYRO_SCALE = 131.0       # LSB per °/s at ±250°/s
+FIFO_SIZE = 1024         # Bytes of on-chip FIFO
+FIFO_FRAME = 12          # Bytes per FIFO sample (accel XYZ, gyro XYZ)
+FIFO_BLOCK = 24          # Bytes per block read: whole samples within the 32-byte SMBus limit
+RING_SIZE = 4096         # Samples kept by ImuSampler (about 20 s at 200 Hz)
+POLL_INTERVAL = 0.02     # Seconds between FIFO drains (4 samples at 200 Hz; the FIFO holds 85)
+
+sampler = None  # ImuSampler once start_sampler() has run
 
 # I2C bus (I2C6, GPIO 22/23 on Raspberry Pi)
-print("Opening I2C bus 6...")
+logger.info("Opening I2C bus 6...")
 try:
     bus = smbus.SMBus(6)
-    print("I2C bus 6 opened successfully.")
+    logger.info("I2C bus 6 opened successfully.")
 except Exception as e:
-    print(f"Failed to open I2C bus 6: {e}")
+    logger.error("Failed to open I2C bus 6: %s", e)
     raise
 
 def mpu6050_init():
-    print("Attempting to initialize MPU6050 at address 0x68...")
+    logger.info("Attempting to initialize MPU6050 at address 0x68...")
     time.sleep(1)  # Delay to let the bus settle
     retries = 3
     for attempt in range(retries):
         try:
             bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_1, 0)
-            print("MPU6050 woken up successfully.")
+            logger.info("MPU6050 woken up successfully.")
             break
         except Exception as e:
-            print(f"Attempt {attempt + 1}/{retries} failed: {e}")
+            logger.warning("Attempt %d/%d failed: %s", attempt + 1, retries, e)
             if attempt == retries - 1:
-                print(f"Failed to wake up MPU6050 after {retries} attempts.")
+                logger.error("Failed to wake up MPU6050 after %d attempts.", retries)
                 raise
             time.sleep(0.5)
     time.sleep(0.1)
@@ -45,24 +77,211 @@ def read_word(reg):
                 return -((65535 - value) + 1)
             return value
         except Exception as e:
-            print(f"Attempt {attempt + 1}/{retries} to read register {reg} failed: {e}")
+            logger.warning("Attempt %d/%d to read register %d failed: %s", attempt + 1, retries, reg, e)
             if attempt == retries - 1:
-                print(f"Failed to read word from register {reg} after {retries} attempts.")
+                logger.error("Failed to read word from register %d after %d attempts.", reg, retries)
                 raise
             time.sleep(0.1)
     return value
 
+def read_block(reg, length):
+    retries = 3
+    for attempt in range(retries):
+        try:
+            return bus.read_i2c_block_data(MPU6050_ADDR, reg, length)
+        except Exception as e:
+            logger.warning("Attempt %d/%d to read %d bytes from register %d failed: %s", attempt + 1, retries, length, reg, e)
+            if attempt == retries - 1:
+                logger.error("Failed to read block from register %d after %d attempts.", reg, retries)
+                raise
+            time.sleep(0.01)
+
+def read_vector(reg, scale):
+    # Three big-endian words in one 6-byte I2C transaction
+    raw = np.frombuffer(bytes(read_block(reg, 6)), dtype=">i2")
+    return tuple((raw / scale).tolist())
+
 def get_acceleration():
-    accel_x = read_word(ACCEL_XOUT_H) / 16384.0  # Scale factor for ±2g
-    accel_y = read_word(ACCEL_XOUT_H + 2) / 16384.0
-    accel_z = read_word(ACCEL_XOUT_H + 4) / 16384.0
-    return accel_x, accel_y, accel_z
+    return read_vector(ACCEL_XOUT_H, ACCEL_SCALE)  # ±2g
 
 def get_gyro_data():
-    gyro_x = read_word(GYRO_XOUT_H) / 131.0  # Scale factor for ±250°/s
-    gyro_y = read_word(GYRO_XOUT_H + 2) / 131.0
-    gyro_z = read_word(GYRO_XOUT_H + 4) / 131.0
-    return gyro_x, gyro_y, gyro_z
+    return read_vector(GYRO_XOUT_H, GYRO_SCALE)  # ±250°/s
+
+def read_sample():
+    """
+    Read accelerometer, temperature and gyro in one 14-byte I2C transaction.
+    Returns:
+        tuple: (accel_x, accel_y, accel_z) in g, (gyro_x, gyro_y, gyro_z) in °/s, temperature in °C
+    """
+    raw = np.frombuffer(bytes(read_block(ACCEL_XOUT_H, 14)), dtype=">i2")
+    accel = raw[0:3] / ACCEL_SCALE
+    gyro = raw[4:7] / GYRO_SCALE
+    return tuple(accel.tolist()), tuple(gyro.tolist()), raw[3] / 340.0 + 36.53
+
+def configure(sample_rate=SAMPLE_RATE, dlpf=DLPF_CFG):
+    """
+    Set the digital low-pass filter and the sample rate (also the FIFO rate).
+    Returns:
+        float: The sample rate actually set in Hz
+    """
+    base = 8000 if dlpf in (0, 7) else 1000  # Gyro output rate with the DLPF off / on
+    divider = min(max(int(round(base / sample_rate)) - 1, 0), 255)
+    bus.write_byte_data(MPU6050_ADDR, CONFIG, dlpf & 0x07)
+    bus.write_byte_data(MPU6050_ADDR, SMPLRT_DIV, divider)
+    rate = base / (1 + divider)
+    logger.info("MPU6050 sampling at %.0f Hz with DLPF setting %d.", rate, dlpf)
+    return rate
+
+def fifo_reset():
+    bus.write_byte_data(MPU6050_ADDR, USER_CTRL, USER_CTRL_FIFO_RESET)
+    bus.write_byte_data(MPU6050_ADDR, USER_CTRL, USER_CTRL_FIFO_EN)
+
+def fifo_enable():
+    bus.write_byte_data(MPU6050_ADDR, FIFO_EN, FIFO_EN_ACCEL_GYRO)
+    fifo_reset()
+
+def fifo_disable():
+    bus.write_byte_data(MPU6050_ADDR, FIFO_EN, 0)
+    bus.write_byte_data(MPU6050_ADDR, USER_CTRL, 0)
+
+def read_fifo():
+    """
+    Drain every complete sample from the FIFO. On overflow the FIFO is reset
+    and the samples in it are dropped, since their timing is lost.
+    Returns:
+        numpy.ndarray: (n, 6) array of accel (g) and gyro (°/s) rows, oldest first
+    """
+    high, low = read_block(FIFO_COUNTH, 2)
+    count = (high << 8) | low
+    if count >= FIFO_SIZE or read_block(INT_STATUS, 1)[0] & INT_STATUS_FIFO_OFLOW:
+        logger.warning("MPU6050 FIFO overflow. Resetting FIFO...")
+        fifo_reset()
+        return np.empty((0, 6))
+    count -= count % FIFO_FRAME
+    data = bytearray()
+    while len(data) < count:
+        data += bytes(read_block(FIFO_R_W, min(FIFO_BLOCK, count - len(data))))
+    raw = np.frombuffer(bytes(data), dtype=">i2").reshape(-1, 6)
+    samples = np.empty(raw.shape)
+    samples[:, :3] = raw[:, :3] / ACCEL_SCALE
+    samples[:, 3:] = raw[:, 3:] / GYRO_SCALE
+    return samples
+
+class ImuSampler:
+    """
+    Background thread that drains the MPU6050 FIFO into a fixed NumPy ring of
+    rows (timestamp, accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z).
+    FIFO samples carry no time, so they are spaced at the sample period ending
+    at the drain time. Without the FIFO (use_fifo=False) the thread polls one
+    14-byte burst per sample period instead.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, dlpf=DLPF_CFG, use_fifo=True, ring_size=RING_SIZE):
+        self.sample_rate = sample_rate
+        self.dlpf = dlpf
+        self.use_fifo = use_fifo
+        self.ring = np.zeros((ring_size, 7))
+        self.count = 0  # Samples written so far; sample n lives in row n % ring_size
+        self.last_time = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.sample_rate = configure(self.sample_rate, self.dlpf)
+        if self.use_fifo:
+            fifo_enable()
+        self.last_time = time.monotonic()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="mpu6050", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+        if self.use_fifo:
+            try:
+                fifo_disable()
+            except Exception as e:
+                logger.error("Failed to disable MPU6050 FIFO: %s", e)
+
+    def _publish(self, samples, end_time):
+        period = 1.0 / self.sample_rate
+        # Never stamp a sample before the previous batch ended
+        times = end_time - period * np.arange(len(samples) - 1, -1, -1)
+        times = np.maximum(times, self.last_time + period * np.arange(1, len(samples) + 1))
+        size = len(self.ring)
+        rows = (self.count + np.arange(len(samples))) % size
+        with self.lock:
+            self.ring[rows, 0] = times
+            self.ring[rows, 1:] = samples
+            self.count += len(samples)
+        self.last_time = times[-1]
+
+    def _run(self):
+        period = 1.0 / self.sample_rate
+        next_poll = time.monotonic()
+        while not self.stop_event.is_set():
+            next_poll += POLL_INTERVAL if self.use_fifo else period
+            try:
+                if self.use_fifo:
+                    samples = read_fifo()
+                else:
+                    accel, gyro, _ = read_sample()
+                    samples = np.array([accel + gyro])
+                if len(samples):
+                    self._publish(samples, time.monotonic())
+            except Exception as e:
+                logger.warning("MPU6050 read error: %s", e)
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                next_poll = time.monotonic()
+                delay = 0
+            self.stop_event.wait(delay)
+
+    def latest(self):
+        """
+        Returns:
+            numpy.ndarray: Newest row (timestamp, accel xyz, gyro xyz), or None before the first sample
+        """
+        with self.lock:
+            if not self.count:
+                return None
+            return self.ring[(self.count - 1) % len(self.ring)].copy()
+
+    def read_since(self, count):
+        """
+        Samples written after the first count samples, for consumers that process in batches.
+        Args:
+            count: Value returned by the previous call (0 at first)
+        Returns:
+            tuple: (new count, (n, 7) array of rows oldest first); samples already overwritten are skipped
+        """
+        with self.lock:
+            end = self.count
+            start = max(count, end - len(self.ring))
+            rows = np.arange(start, end) % len(self.ring)
+            return end, self.ring[rows].copy()
+
+def start_sampler(**options):
+    """
+    Start the background IMU sampler (idempotent).
+    Returns:
+        ImuSampler: The running sampler
+    """
+    global sampler
+    if sampler is None:
+        sampler = ImuSampler(**options)
+    sampler.start()
+    return sampler
 
 def calculate_angles(accel_x, accel_y, accel_z):
     pitch = math.atan2(accel_y, math.sqrt(accel_x * accel_x + accel_z * accel_z)) * 180 / math.pi
@@ -70,12 +289,14 @@ def calculate_angles(accel_x, accel_y, accel_z):
     return pitch, roll
 
 def mpu6050_close():
-    print("Closing I2C bus...")
+    if sampler is not None:
+        sampler.stop()
+    logger.info("Closing I2C bus...")
     try:
         bus.close()
-        print("I2C bus closed successfully.")
+        logger.info("I2C bus closed successfully.")
     except Exception as e:
-        print(f"Failed to close I2C bus: {e}")
+        logger.error("Failed to close I2C bus: %s", e)
 
 if __name__ == "__main__":
     try:
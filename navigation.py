@@ -1,31 +1,137 @@
-import servo
+import threading
+import time
+from collections import deque
 import motor
+import vl53l1x
+from log import get_logger
 
-def plan(value):
+logger = get_logger("navigation")
+
+# Reflex settings
+STOP_DISTANCE = 300       # mm; cut the motors when a reading is closer than this while driving forward
+LATENCY_HISTORY = 256     # Latencies kept for stats()
+WAIT_TIMEOUT = 0.5        # Seconds to wait for a sample before re-checking for shutdown
+
+reflex = None  # SafetyReflex once start_reflex() has run
+
+class SafetyReflex:
+    """
+    Dedicated thread that wakes on every VL53L1X sample the RangingSampler
+    publishes and stops the motors itself when an obstacle is closer than
+    stop_distance while both wheels drive forward. It does not wait for the
+    control loop, a Gemini call or a maneuver. Turning and reversing are not
+    guarded, so a robot that stopped in front of an obstacle can still turn away.
+
+    Latencies are measured from the sample's timestamp (when the sampler saw
+    data-ready): reaction is until the reflex has evaluated it, and stop is until
+    motor.stop() has returned. observed_stop_time() adds one ranging cycle and the
+    sampler's data-ready poll to the longest latency seen so far; it is a
+    measurement, not a guaranteed bound.
+    Args:
+        on_trip: Optional function called with the Sample after each stop (on the reflex thread)
+    """
+
+    def __init__(self, sampler, stop_distance=STOP_DISTANCE, on_trip=None):
+        self.sampler = sampler
+        self.stop_distance = stop_distance
+        self.on_trip = on_trip
+        self.samples = 0
+        self.trips = 0
+        self.reactions = deque(maxlen=LATENCY_HISTORY)
+        self.stops = deque(maxlen=LATENCY_HISTORY)
+        self.max_reaction = 0.0
+        self.max_stop = 0.0
+        self.last_trip = None     # Sample that caused the last stop
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="safety-reflex", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=WAIT_TIMEOUT * 2)
+            self.thread = None
+
+    def _driving_forward(self):
+        return motor.wheel_duty["left"] > 0 and motor.wheel_duty["right"] > 0
+
+    def _run(self):
+        last = self.sampler.latest()
+        seq = last.seq if last else 0
+        while not self.stop_event.is_set():
+            sample = self.sampler.wait_for_sample(seq, WAIT_TIMEOUT)
+            if sample is None:
+                continue
+            seq = sample.seq
+            reaction = time.monotonic() - sample.timestamp
+            self.samples += 1
+            self.reactions.append(reaction)
+            self.max_reaction = max(self.max_reaction, reaction)
+            if not sample.valid or sample.distance >= self.stop_distance or not self._driving_forward():
+                continue
+            motor.stop()
+            latency = time.monotonic() - sample.timestamp
+            self.trips += 1
+            self.stops.append(latency)
+            self.max_stop = max(self.max_stop, latency)
+            self.last_trip = sample
+            logger.warning("Safety stop: obstacle at %.0f mm, motors cut %.1f ms after the reading.", sample.distance,
+                           latency * 1000, extra={"distance": sample.distance, "latency": latency})
+            if self.on_trip is not None:
+                try:
+                    self.on_trip(sample)
+                except Exception as e:
+                    logger.error("Safety stop callback failed: %s", e)
+
+    def observed_stop_time(self):
+        """
+        Returns:
+            float: Seconds from an obstacle entering range to the motors being cut, as observed
+                   so far (one ranging cycle + data-ready polling + the longest latency seen)
+        """
+        cycle = self.sampler.timing_budget / 1000.0 + vl53l1x.POLL_INTERVAL
+        return cycle + max(self.max_stop, self.max_reaction)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Sample and trip counts and latencies in seconds
+        """
+        reactions, stops = list(self.reactions), list(self.stops)
+        return {
+            "samples": self.samples,
+            "trips": self.trips,
+            "mean_reaction": sum(reactions) / len(reactions) if reactions else None,
+            "max_reaction": self.max_reaction,
+            "mean_stop": sum(stops) / len(stops) if stops else None,
+            "max_stop": self.max_stop,
+            "observed_stop_time": self.observed_stop_time(),
+        }
+
+def start_reflex(sampler, **options):
     """
-    Plan the vehicle's next move based on distance and servo angle.
+    Start the safety reflex on a running RangingSampler (idempotent).
+    Returns:
+        SafetyReflex: The running reflex
     """
+    global reflex
+    if reflex is None or reflex.sampler is not sampler:
+        if reflex is not None:
+            reflex.stop()
+        reflex = SafetyReflex(sampler, **options)
+    reflex.start()
+    return reflex
 
-    if value>100 :
-        motor.forward()
-    else :
-        motor.stop()
-    # Get the current servo angle
-    servo_angle = servo.get_angle()
-
-    # Read distance from VL53L1X sensor
-    distance = servo.read_distance()
-
-    print(f"Planning move: Distance={distance} mm, Servo Angle={servo_angle}°")
-
-    # Decision-making logic
-    if distance > 100:
-        if 0 <= servo_angle <= 40:
-            print("Turning right...")
-            motor.turn_right()
-        elif 40 < servo_angle <= 80:
-            print("Turning left...")
-            motor.turn_left()
-    else:
-        print("Performing U-turn...")
-        motor.u_turn()
+def stop_reflex():
+    if reflex is not None:
+        reflex.stop()
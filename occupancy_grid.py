@@ -0,0 +1,193 @@
+import math
+import threading
+import numpy as np
+
+# Grid settings
+GRID_RESOLUTION = 50.0    # mm per cell
+GRID_SIZE = 200           # Cells per side of the window kept around the robot (10 m at 50 mm)
+RECENTER_MARGIN = 40      # Slide the window once the robot is this many cells from an edge
+LOG_ODDS_HIT = 1.2        # Added to the cell a ray ends in
+LOG_ODDS_MISS = -0.4      # Added to every cell a ray passes through
+LOG_ODDS_MIN = -2.0       # Clamps: a long-cleared cell needs only a few hits to show a new obstacle
+LOG_ODDS_MAX = 3.5
+OCCUPIED_PROBABILITY = 0.65
+
+# Range sensor geometry
+SENSOR_MAX_RANGE = 1000.0  # Readings at or beyond this only clear space (the sensor sees the ground)
+SENSOR_CENTER_ANGLE = 40   # Servo angle that looks straight ahead; larger angles look left
+SENSOR_OFFSET = (0.0, 0.0)  # Sensor position relative to the robot center in mm (forward, left)
+
+def _logit(probability):
+    return math.log(probability / (1.0 - probability))
+
+class OccupancyGrid:
+    """
+    Log-odds occupancy grid over a square window that slides with the robot, so
+    memory stays fixed however far it drives. World coordinates are in mm in the
+    odometry frame (x forward at start, y left); cell (i, j) covers
+    [origin_x + i * resolution, +resolution) x [origin_y + j * resolution, +resolution).
+    """
+
+    def __init__(self, size=GRID_SIZE, resolution=GRID_RESOLUTION, max_range=SENSOR_MAX_RANGE):
+        self.size = size
+        self.resolution = resolution
+        self.max_range = max_range
+        self.log_odds = np.zeros((size, size), dtype=np.float32)
+        self.origin = np.array([-size * resolution / 2.0, -size * resolution / 2.0])
+        self.lock = threading.Lock()
+        self.samples = 0  # Range samples integrated so far
+
+    def cell_of(self, x, y):
+        """
+        Returns:
+            tuple: (i, j) cell indices; may lie outside the window
+        """
+        return (int(math.floor((x - self.origin[0]) / self.resolution)),
+                int(math.floor((y - self.origin[1]) / self.resolution)))
+
+    def world_of(self, i, j):
+        """
+        Returns:
+            tuple: (x, y) of the cell center in mm
+        """
+        return (self.origin[0] + (i + 0.5) * self.resolution,
+                self.origin[1] + (j + 0.5) * self.resolution)
+
+    def contains(self, i, j):
+        return 0 <= i < self.size and 0 <= j < self.size
+
+    def _recenter(self, x, y):
+        # Caller holds self.lock
+        i, j = self.cell_of(x, y)
+        margin = RECENTER_MARGIN
+        if margin <= i < self.size - margin and margin <= j < self.size - margin:
+            return
+        di, dj = i - self.size // 2, j - self.size // 2
+        shifted = np.zeros_like(self.log_odds)
+        src_i = slice(max(di, 0), min(self.size + di, self.size))
+        dst_i = slice(max(-di, 0), min(self.size - di, self.size))
+        src_j = slice(max(dj, 0), min(self.size + dj, self.size))
+        dst_j = slice(max(-dj, 0), min(self.size - dj, self.size))
+        shifted[dst_i, dst_j] = self.log_odds[src_i, src_j]
+        self.log_odds = shifted
+        self.origin = self.origin + np.array([di, dj]) * self.resolution
+
+    def update(self, poses, angles, distances):
+        """
+        Integrate a batch of range samples, ray-casting all of them at once.
+        Args:
+            poses: (x, y, heading) per sample, mm and radians
+            angles: Horizontal servo angle per sample (degrees)
+            distances: Measured distance per sample in mm
+        """
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        angles = np.asarray(angles, dtype=np.float64)
+        distances = np.asarray(distances, dtype=np.float64)
+        if len(distances) == 0:
+            return
+        heading = poses[:, 2]
+        bearing = heading + np.radians(angles - SENSOR_CENTER_ANGLE)
+        origin_x = poses[:, 0] + np.cos(heading) * SENSOR_OFFSET[0] - np.sin(heading) * SENSOR_OFFSET[1]
+        origin_y = poses[:, 1] + np.sin(heading) * SENSOR_OFFSET[0] + np.cos(heading) * SENSOR_OFFSET[1]
+        hit = distances < self.max_range
+        length = np.minimum(distances, self.max_range)
+        with self.lock:
+            self._recenter(poses[-1, 0], poses[-1, 1])
+            cells = self.size * self.size
+            # Points every half cell along each ray, up to half a cell short of its end
+            steps = np.arange(0.0, length.max(), self.resolution / 2.0)
+            free = steps[None, :] < (length - self.resolution / 2.0)[:, None]
+            ix = np.floor((origin_x[:, None] + np.cos(bearing)[:, None] * steps - self.origin[0]) / self.resolution)
+            iy = np.floor((origin_y[:, None] + np.sin(bearing)[:, None] * steps - self.origin[1]) / self.resolution)
+            free &= (ix >= 0) & (ix < self.size) & (iy >= 0) & (iy < self.size)
+            ray = np.broadcast_to(np.arange(len(distances))[:, None], free.shape)
+            # Each ray clears a cell once, however many of its points fall in it
+            keys = np.unique(ray[free] * cells + (ix[free] * self.size + iy[free]).astype(np.int64))
+            grid = self.log_odds.reshape(-1)
+            np.add.at(grid, keys % cells, LOG_ODDS_MISS)
+            end_x = np.floor((origin_x + np.cos(bearing) * length - self.origin[0]) / self.resolution)
+            end_y = np.floor((origin_y + np.sin(bearing) * length - self.origin[1]) / self.resolution)
+            hit &= (end_x >= 0) & (end_x < self.size) & (end_y >= 0) & (end_y < self.size)
+            np.add.at(grid, (end_x[hit] * self.size + end_y[hit]).astype(np.int64), LOG_ODDS_HIT)
+            np.clip(self.log_odds, LOG_ODDS_MIN, LOG_ODDS_MAX, out=self.log_odds)
+            self.samples += len(distances)
+
+    def probabilities(self):
+        """
+        Returns:
+            numpy.ndarray: Occupancy probability per cell (0.5 = unknown)
+        """
+        with self.lock:
+            return 1.0 - 1.0 / (1.0 + np.exp(self.log_odds))
+
+    def occupied(self):
+        """
+        Returns:
+            numpy.ndarray: bool mask of cells believed occupied
+        """
+        with self.lock:
+            return self.log_odds > _logit(OCCUPIED_PROBABILITY)
+
+    def probability_at(self, x, y):
+        i, j = self.cell_of(x, y)
+        if not self.contains(i, j):
+            return 0.5
+        return float(1.0 - 1.0 / (1.0 + math.exp(self.log_odds[i, j])))
+
+    def ray_distance(self, x, y, bearing, max_range=SENSOR_MAX_RANGE):
+        """
+        Distance along a ray to the first cell believed occupied, from the map alone.
+        Args:
+            x, y: Ray start in mm
+            bearing: Ray direction in radians
+        Returns:
+            float: Distance in mm, or None if nothing known within max_range
+        """
+        steps = np.arange(0.0, max_range, self.resolution / 2.0)
+        with self.lock:
+            ix = np.floor((x + np.cos(bearing) * steps - self.origin[0]) / self.resolution).astype(np.int64)
+            iy = np.floor((y + np.sin(bearing) * steps - self.origin[1]) / self.resolution).astype(np.int64)
+            inside = (ix >= 0) & (ix < self.size) & (iy >= 0) & (iy < self.size)
+            blocked = np.zeros(len(steps), dtype=bool)
+            blocked[inside] = self.log_odds[ix[inside], iy[inside]] > _logit(OCCUPIED_PROBABILITY)
+        index = np.argmax(blocked)
+        return float(steps[index]) if blocked[index] else None
+
+class RangeMapper:
+    """
+    Folds new RangingSampler results into an OccupancyGrid, each at the pose and
+    servo angle of the middle of its ranging window. update() can be called from
+    any thread; every sample is integrated once.
+    Args:
+        angle_source: Function mapping a time.monotonic() timestamp to the servo angle
+    """
+
+    def __init__(self, grid, sampler, odometry, angle_source):
+        self.grid = grid
+        self.sampler = sampler
+        self.odometry = odometry
+        self.angle_source = angle_source
+        self.last_seq = 0
+        self.lock = threading.Lock()
+
+    def update(self):
+        """
+        Returns:
+            int: Number of valid samples added to the grid
+        """
+        with self.lock:
+            samples = [sample for sample in self.sampler.history() if sample.seq > self.last_seq]
+            if not samples:
+                return 0
+            self.last_seq = samples[-1].seq
+            half_window = self.sampler.timing_budget / 2000.0
+            poses, angles, distances = [], [], []
+            for sample in samples:
+                if sample.valid:
+                    middle = sample.timestamp - half_window
+                    pose = self.odometry.pose_at(middle)
+                    poses.append((pose.x, pose.y, pose.heading))
+                    angles.append(self.angle_source(middle))
+                    distances.append(sample.distance)
+            self.grid.update(poses, angles, distances)
+            return len(distances)
@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque, namedtuple
+
+import motor
+
+# Drive geometry (measure on the robot)
+WHEEL_SPEED_PER_DUTY = 6.0  # Wheel speed in mm/s per % duty cycle
+WHEEL_BASE = 250.0          # Distance between the wheels in mm
+POSE_HISTORY = 400          # Poses kept for pose_at() (20 s at the control rate)
+
+# Robot pose in the start frame: x forward and y to the left in mm, heading in
+# radians counter-clockwise. timestamp is time.monotonic().
+Pose = namedtuple("Pose", ["x", "y", "heading", "timestamp"])
+
+class Odometry:
+    """
+    Dead-reckoning pose from the duty cycles applied in motor.wheel_duty.
+    There are no wheel encoders, so the pose drifts; it is meant for short
+    horizons such as placing range samples in the occupancy grid. With a
+    heading_source (e.g. HeadingEstimator.heading) the heading comes from the
+    IMU and only the distance travelled from the wheel commands.
+    """
+
+    def __init__(self, speed_per_duty=WHEEL_SPEED_PER_DUTY, wheel_base=WHEEL_BASE, history=POSE_HISTORY,
+                 heading_source=None):
+        self.speed_per_duty = speed_per_duty
+        self.wheel_base = wheel_base
+        self.heading_source = heading_source
+        self.heading_offset = 0.0  # heading_source() value that corresponds to heading 0
+        self.poses = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        with self.lock:
+            if self.heading_source is not None:
+                self.heading_offset = self.heading_source() - heading
+            self.poses.clear()
+            self.poses.append(Pose(x, y, heading, time.monotonic()))
+
+    def update(self, now=None):
+        """
+        Integrate the wheel commands up to now and record the new pose.
+        Returns:
+            Pose: The current pose
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            last = self.poses[-1]
+            dt = max(now - last.timestamp, 0.0)
+            left = motor.wheel_duty["left"] * self.speed_per_duty
+            right = motor.wheel_duty["right"] * self.speed_per_duty
+            v = (left + right) / 2.0
+            w = (right - left) / self.wheel_base
+            if self.heading_source is not None:
+                heading = self.heading_source() - self.heading_offset
+                turn = math.atan2(math.sin(heading - last.heading), math.cos(heading - last.heading))
+                mid = last.heading + turn / 2.0
+            else:
+                heading = last.heading + w * dt
+                mid = last.heading + w * dt / 2.0
+            pose = Pose(last.x + v * math.cos(mid) * dt, last.y + v * math.sin(mid) * dt,
+                        math.atan2(math.sin(heading), math.cos(heading)), now)
+            self.poses.append(pose)
+            return pose
+
+    def latest(self):
+        return self.poses[-1]
+
+    def pose_at(self, timestamp):
+        """
+        Pose at a past time.monotonic() timestamp, interpolated between recorded poses.
+        Returns:
+            Pose: The estimated pose (the oldest or newest pose outside the recorded range)
+        """
+        with self.lock:
+            poses = list(self.poses)
+        times = [pose.timestamp for pose in poses]
+        index = bisect_left(times, timestamp)
+        if index <= 0:
+            return poses[0]
+        if index >= len(poses):
+            return poses[-1]
+        before, after = poses[index - 1], poses[index]
+        span = after.timestamp - before.timestamp
+        fraction = (timestamp - before.timestamp) / span if span > 0 else 1.0
+        turn = math.atan2(math.sin(after.heading - before.heading), math.cos(after.heading - before.heading))
+        return Pose(before.x + (after.x - before.x) * fraction,
+                    before.y + (after.y - before.y) * fraction,
+                    before.heading + turn * fraction, timestamp)
@@ -1,24 +1,85 @@
-from motor import reverse, turn_left, turn_right, u_turn, stop as motor_stop, forward
+from motor import reverse, u_turn, stop as motor_stop, maneuver, Step
 from vl53l1x import read_distance
+import vl53l1x
+import servo
+import math
+import time
+from log import get_logger
 
-def plan_path(vl53, servo_move, servo_angles, servo_lock, stop_event):
+logger = get_logger("path_plan")
+
+# Continuous scan settings
+SCAN_MIN_ANGLE = 0
+SCAN_MAX_ANGLE = 80
+SCAN_SPEED = 120.0        # Servo degrees per second during an obstacle scan
+SCAN_TIMING_BUDGET = 33   # ms per ranging cycle while scanning
+SCAN_BIN = 10             # Degrees per bin used by the steering rules
+
+# Planned steering settings
+PLAN_TIME = 0.25          # Seconds of search allowed before acting on the plan
+STRAIGHT_TOLERANCE = 15   # Drive straight if the plan turns less than this (degrees)
+TURN_RATE = 0.72          # rad/s when turning in place at 15% duty; sets the time limit of heading-terminated turns
+MAX_RESCANS = 3           # Reverse-and-rescan rounds for a very close obstacle before falling back to a U-turn
+
+# Steering rule settings
+RULE_TURN_ANGLE = 90      # Degrees turned away from an obstacle
+RULE_COMMIT_TIME = 1.0    # Seconds driven straight after a rule turn before normal control resumes
+
+def sweep_scan(stop_event):
     """
-    Plan the next move based on VL53L1X readings at servo angles 0° to 80°.
-    Args:
-        vl53: VL53L1X sensor object
-        servo_move: Function to move the servo
-        servo_angles: Dict with current servo angles (thread-safe)
-        servo_lock: Threading lock for servo angles
-        stop_event: Threading event to stop the process
+    Sweep the range sensor once across SCAN_MIN_ANGLE..SCAN_MAX_ANGLE without
+    stopping, keeping every sample the background sampler publishes on the way.
+    Each sample is tagged with the servo angle at the middle of its ranging
+    window, interpolated from the trajectory timeline.
+    Returns:
+        list: (angle, distance in mm) for every valid sample, or None if the sampler is not running
+    """
+    sampler = vl53l1x.sampler
+    if sampler is None or not sampler.running:
+        return None
+    # Sweep away from the nearer end, starting from wherever the servo was left
+    current = servo.get_angle()
+    direction = 1 if current <= (SCAN_MIN_ANGLE + SCAN_MAX_ANGLE) / 2 else -1
+    start_angle = SCAN_MIN_ANGLE if direction == 1 else SCAN_MAX_ANGLE
+    previous_budget = sampler.timing_budget
+    sampler.configure(timing_budget=SCAN_TIMING_BUDGET)
+    servo.move_servo(servo.HORIZONTAL_SERVO_PIN, start_angle, speed=3)
+    servo.move_servo(servo.VERTICAL_SERVO_PIN, 0, speed=3)
+    # Let the new timing budget take effect before the pass starts
+    sampler.wait_for_sample(sampler.latest().seq if sampler.latest() else 0, previous_budget / 1000.0 * 2)
+    player = servo.TrajectoryPlayer(servo.SweepTrajectory(SCAN_MIN_ANGLE, SCAN_MAX_ANGLE, SCAN_SPEED, nod_angle=0))
+    readings = []
+    try:
+        ready = time.monotonic()  # The servo rests at start_angle from here until the pass starts
+        player.start(start_angle, direction)
+        start_time = player.start_time
+        pass_end = time.monotonic() + player.trajectory.pass_time
+        stop_event.wait(max(pass_end - time.monotonic(), 0))
+        player.stop()  # Hold the far end for one more ranging window
+        window = sampler.timing_budget / 1000.0
+        stop_event.wait(window * 1.5)
+        for sample in sampler.history():
+            middle = sample.timestamp - window / 2
+            if sample.valid and sample.timestamp - window >= ready:
+                angle = player.trajectory.angles_at(max(min(middle, pass_end) - start_time, 0.0), interpolate=True)[0]
+                readings.append((angle, sample.distance))
+    finally:
+        player.stop()
+        sampler.configure(timing_budget=previous_budget)
+    logger.info("Swept %d-%d° in %.2f s: %d samples.", SCAN_MIN_ANGLE, SCAN_MAX_ANGLE, player.trajectory.pass_time, len(readings))
+    return readings
+
+def stepped_scan(vl53, servo_move, servo_angles, servo_lock, stop_event):
+    """
+    Scan by stepping the servo to 0°, 10°, ... 80° and reading once at each stop.
+    Used when the background sampler is not running.
     Returns:
-        None (executes motor commands directly)
+        dict: Angle -> distance in mm (None for invalid readings)
     """
     readings = {}
     horizontal_angle = 0
     vertical_angle = 0
     direction = 1
-
-    print("Scanning for obstacles at specific angles...")
     for target_angle in range(0, 81, 10):
         if stop_event.is_set():
             break
@@ -36,75 +97,182 @@ def plan_path(vl53, servo_move, servo_angles, servo_lock, stop_event):
 
         distance = read_distance(vl53)
         readings[target_angle] = distance
-        print(f"Distance at {target_angle}°: {distance if distance is not None else 'None'} mm")
-
-    # Filter out None values and check if we have any valid readings
-    valid_readings = {angle: dist for angle, dist in readings.items() if dist is not None}
-    if not valid_readings:
-        print("No valid distance readings obtained. Performing a U-turn as a fallback...")
-        u_turn(duty_cycle=15)
-        return
-
-    # Find the lowest and highest values
-    distances = list(valid_readings.values())
-    angles = list(valid_readings.keys())
-    lowest_distance = min(distances)
-    highest_distance = max(distances)
-    lowest_angle = angles[distances.index(lowest_distance)]
-    print(f"Lowest distance: {lowest_distance} mm at {lowest_angle}°")
-    print(f"Highest distance: {highest_distance} mm")
-
-    # If lowest distance is under 150 mm, reverse until 300 mm
-    if lowest_distance < 150:
-        print("Obstacle too close (<150 mm)! Reversing until 300 mm...")
-        max_retries = 20  # Maximum number of reverse attempts
-        retry_count = 0
-        invalid_reading_count = 0
-        while lowest_distance < 300:
-            if stop_event.is_set():
-                break
-            if retry_count >= max_retries:
-                print("Max retries reached. Sensor may be failing. Performing a U-turn as a fallback...")
-                u_turn(duty_cycle=15)
-                return
-            reverse(duty_cycle=15)
-            time.sleep(0.5)  # Give some time for the vehicle to move
-            horizontal_angle = lowest_angle
-            with servo_lock:
-                servo_angles["horizontal"] = horizontal_angle
-            servo_move(horizontal_angle, vertical_angle, direction)
-            lowest_distance = read_distance(vl53)
-            retry_count += 1
-            if lowest_distance is None:
-                invalid_reading_count += 1
-                if invalid_reading_count >= 5:  # Too many invalid readings
-                    print("Too many invalid readings. Performing a U-turn as a fallback...")
-                    u_turn(duty_cycle=15)
-                    return
-            else:
-                invalid_reading_count = 0  # Reset counter if we get a valid reading
-            print(f"Current distance: {lowest_distance if lowest_distance is not None else 'None'} mm")
-        motor_stop()
-        print(f"Reversed to {lowest_distance if lowest_distance is not None else 'unknown'} mm. Rechecking...")
-        return plan_path(vl53, servo_move, servo_angles, servo_lock, stop_event)
+        logger.debug("Distance at %d°: %s mm", target_angle, distance, extra={"angle": target_angle, "distance": distance})
+    return readings
+
+def _turn_and_go(name, left, right, duration, angle, message, commit=None, duty_cycle=15):
+    """
+    Start a background maneuver: turn in place (skipped when left and right are
+    None), then drive forward. The wheels keep going forward when it ends.
+    Args:
+        commit: Seconds to drive straight before the maneuver counts as done
+    Returns:
+        concurrent.futures.Future: Resolves to a motor.ManeuverResult
+    """
+    steps = []
+    if left is not None:
+        steps.append(Step(left, right, duration, angle, message))
+    steps.append(Step(duty_cycle, duty_cycle, commit, None, f"Moving forward at {duty_cycle}% duty cycle..."))
+    return maneuver(name, steps, stop_at_end=False)
+
+def follow_plan(planner, odometry):
+    """
+    Bring the grid planner up to date and start turning onto its path.
+    Returns:
+        Future of the started maneuver, or None to leave the decision to the caller
+    """
+    pose = odometry.update()
+    # One cost map and one search run for the whole budget
+    if not planner.replan(pose, budget=PLAN_TIME):
+        logger.warning("Path search did not finish in time. Falling back to the steering rules...")
+        return None
+    turn = planner.steering(pose)
+    if turn is None:
+        logger.info("No collision-free path ahead. Performing U-turn...")
+        planner.set_goal_heading(pose.heading + math.pi)
+        return u_turn(duty_cycle=15, angle=180, wait=False)
+    degrees = math.degrees(turn)
+    duration = abs(turn) / TURN_RATE
+    if abs(degrees) < STRAIGHT_TOLERANCE:
+        logger.info("Planned path is clear ahead (%.0f°). Moving forward...", degrees)
+        return _turn_and_go("forward", None, None, None, None, None)
+    elif turn > 0:
+        logger.info("Planned path turns %.0f° left. Turning left...", degrees)
+        return _turn_and_go("turn_left", -15, 15, duration, degrees, "Turning left at 15% duty cycle...")
+    else:
+        logger.info("Planned path turns %.0f° right. Turning right...", -degrees)
+        return _turn_and_go("turn_right", 15, -15, duration, degrees, "Turning right at 15% duty cycle...")
+
+def _scan(vl53, servo_move, servo_angles, servo_lock, stop_event):
+    """
+    One obstacle scan: a continuous sweep, or a stepped scan without the background sampler.
+    Returns:
+        dict: Angle -> distance in mm for the valid readings
+    """
+    logger.info("Scanning for obstacles...")
+    samples = sweep_scan(stop_event)
+    if samples is None:
+        readings = stepped_scan(vl53, servo_move, servo_angles, servo_lock, stop_event)
+    else:
+        # Keep the nearest sample per SCAN_BIN-degree bin
+        readings = {}
+        for angle, distance in samples:
+            key = int(round(angle / SCAN_BIN)) * SCAN_BIN
+            if readings.get(key) is None or distance < readings[key]:
+                readings[key] = distance
+        for angle in sorted(readings):
+            logger.debug("Distance at %d°: %.0f mm", angle, readings[angle], extra={"angle": angle, "distance": readings[angle]})
+        with servo_lock:
+            servo_angles["horizontal"] = round(servo.get_angle())
+            servo_angles["vertical"] = 0
+    return {angle: dist for angle, dist in readings.items() if dist is not None}
+
+def _reverse_until_clear(vl53, servo_move, servo_angles, servo_lock, stop_event, angle):
+    """
+    Reverse in short steps until the reading at angle is 300 mm or more.
+    Returns:
+        bool: False if the sensor kept failing (the caller falls back to a U-turn)
+    """
+    max_retries = 20  # Maximum number of reverse attempts
+    retry_count = 0
+    invalid_reading_count = 0
+    distance = 0
+    while distance is None or distance < 300:
+        if stop_event.is_set():
+            break
+        if retry_count >= max_retries:
+            logger.warning("Max retries reached. Sensor may be failing. Performing a U-turn as a fallback...")
+            return False
+        reverse(duty_cycle=15)
+        time.sleep(0.5)  # Give some time for the vehicle to move
+        with servo_lock:
+            servo_angles["horizontal"] = angle
+        servo_move(angle, 0, 1)
+        distance = read_distance(vl53)
+        retry_count += 1
+        if distance is None:
+            invalid_reading_count += 1
+            if invalid_reading_count >= 5:  # Too many invalid readings
+                logger.warning("Too many invalid readings. Performing a U-turn as a fallback...")
+                return False
+        else:
+            invalid_reading_count = 0  # Reset counter if we get a valid reading
+        logger.debug("Current distance: %s mm", distance, extra={"distance": distance})
+    motor_stop()
+    logger.info("Reversed to %s mm. Rechecking...", distance if distance is not None else "unknown")
+    return True
+
+def plan_path(vl53, servo_move, servo_angles, servo_lock, stop_event, mapper=None, odometry=None, planner=None):
+    """
+    Plan the next move based on VL53L1X readings from one continuous sweep of
+    the servo from 0° to 80° (or a stepped scan without the background sampler).
+    With a planner, the scan is folded into the occupancy grid and the robot
+    follows the planned path; otherwise it steers by the fixed rules below.
+    Args:
+        vl53: VL53L1X sensor object
+        servo_move: Function to move the servo
+        servo_angles: Dict with current servo angles (thread-safe)
+        servo_lock: Threading lock for servo angles
+        stop_event: Threading event to stop the process
+        mapper: occupancy_grid.RangeMapper that adds the scan to the map
+        odometry: odometry.Odometry giving the robot pose
+        planner: grid_planner.GridPlanner over the same map
+    Returns:
+        concurrent.futures.Future of the maneuver started in the background
+        (resolves to a motor.ManeuverResult), or None if no maneuver was started
+    """
+    for rescan in range(MAX_RESCANS + 1):
+        valid_readings = _scan(vl53, servo_move, servo_angles, servo_lock, stop_event)
+        if not valid_readings:
+            logger.warning("No valid distance readings obtained. Performing a U-turn as a fallback...")
+            return u_turn(duty_cycle=15, angle=180, wait=False)
+
+        # Find the lowest and highest values
+        distances = list(valid_readings.values())
+        angles = list(valid_readings.keys())
+        lowest_distance = min(distances)
+        highest_distance = max(distances)
+        lowest_angle = angles[distances.index(lowest_distance)]
+        logger.info("Lowest distance: %.0f mm at %d°", lowest_distance, lowest_angle)
+        logger.info("Highest distance: %.0f mm", highest_distance)
+        if lowest_distance >= 150:
+            break
+
+        # If lowest distance is under 150 mm, reverse until 300 mm and scan again
+        if rescan == MAX_RESCANS:
+            logger.warning("Still too close after %d rescans. Performing a U-turn as a fallback...", MAX_RESCANS)
+            return u_turn(duty_cycle=15, angle=180, wait=False)
+        logger.warning("Obstacle too close (<150 mm)! Reversing until 300 mm...")
+        if not _reverse_until_clear(vl53, servo_move, servo_angles, servo_lock, stop_event, lowest_angle):
+            return u_turn(duty_cycle=15, angle=180, wait=False)
+        if stop_event.is_set():
+            return None
+    if stop_event.is_set():
+        return None
+
+    if planner is not None and odometry is not None:
+        if mapper is not None:
+            mapper.update()
+        started = follow_plan(planner, odometry)
+        if started is not None:
+            return started
 
     # Check where obstacles are (under 300 mm)
     below_40 = any(angle < 40 and valid_readings[angle] < 300 for angle in valid_readings)
     above_40 = any(angle >= 40 and valid_readings[angle] < 300 for angle in valid_readings)
 
+    turn_time = math.radians(RULE_TURN_ANGLE) / TURN_RATE
     if below_40 and above_40:
-        print("Obstacles on both sides! Performing U-turn...")
-        u_turn(duty_cycle=15)
+        logger.info("Obstacles on both sides! Performing U-turn...")
+        return u_turn(duty_cycle=15, angle=180, wait=False)
     elif below_40:
-        print("Obstacle below 40°. Turning left...")
-        turn_left(duty_cycle=15)
-        forward(duty_cycle=15)
-        time.sleep(1)
+        logger.info("Obstacle below 40°. Turning left...")
+        return _turn_and_go("turn_left", -15, 15, turn_time, RULE_TURN_ANGLE,
+                            "Turning left at 15% duty cycle...", commit=RULE_COMMIT_TIME)
     elif above_40:
-        print("Obstacle above 40°. Turning right...")
-        turn_right(duty_cycle=15)
-        forward(duty_cycle=15)
-        time.sleep(1)
+        logger.info("Obstacle above 40°. Turning right...")
+        return _turn_and_go("turn_right", 15, -15, turn_time, -RULE_TURN_ANGLE,
+                            "Turning right at 15% duty cycle...", commit=RULE_COMMIT_TIME)
     else:
-        print("No significant obstacles under 300 mm. Moving forward...")
-        forward(duty_cycle=15)
+        logger.info("No significant obstacles under 300 mm. Moving forward...")
+        return _turn_and_go("forward", None, None, None, None, None)
@@ -0,0 +1,147 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime
+from log import get_logger
+
+logger = get_logger("quota")
+
+# Persistence settings
+FLUSH_EVERY = 5        # Persist after this many unsaved requests (max loss on a crash)
+FLUSH_INTERVAL = 10.0  # ...or when the oldest unsaved request is this many seconds old
+
+class QuotaExceededError(Exception):
+    pass
+
+class QuotaManager:
+    """
+    Daily API request counter shared by every process on the robot.
+    Requests are counted in memory and merged into the "YYYY-MM-DD,count"
+    record file in batches under an exclusive fcntl lock, so concurrent
+    processes never overwrite each other and a crash loses at most
+    FLUSH_EVERY requests. Near the limit every request is checked and counted
+    under the lock; other processes can still overshoot by the requests they
+    have not flushed yet (under FLUSH_EVERY each).
+    """
+
+    def __init__(self, path, daily_limit, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.daily_limit = daily_limit
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.date = None       # Day the counters belong to
+        self.saved_total = 0   # Shared total as of the last flush
+        self.pending = 0       # Requests not yet written
+        self.oldest_pending = None
+        self.loaded = False
+        atexit.register(self.flush)
+
+    def _today(self):
+        return datetime.now().date().strftime("%Y-%m-%d")
+
+    def _merge(self, add, reserve=False):
+        """
+        Add this process's pending count to the shared record and reload the total.
+        With reserve, one more request is added only if it stays within the limit.
+        Caller holds self.lock.
+        Returns:
+            bool: False if a reservation was refused
+        """
+        today = self._today()
+        granted = True
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o666)
+            os.fchmod(fd, 0o666)  # Past the umask, so processes run as other users can update it too
+        except FileExistsError:
+            fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 64).decode("ascii", errors="replace").strip()
+            date_str, total = today, 0
+            if raw:
+                try:
+                    if "," in raw:
+                        date_str, count = raw.split(",", 1)
+                    else:
+                        count = raw  # Legacy record without a date: assume today
+                    total = int(count)
+                except ValueError:
+                    logger.warning("Ignoring corrupt request count record: %r", raw)
+                    date_str, total = today, 0
+            if date_str != today:
+                total = 0
+            if self.date is not None and self.date != today:
+                add = 0  # Pending requests belong to a finished day
+            total += add
+            granted = not reserve or total < self.daily_limit
+            if reserve and granted:
+                total += 1
+                add += 1
+            if add or date_str != today or not raw:
+                record = f"{today},{total}".encode("ascii")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, record)
+                os.fsync(fd)
+        finally:
+            os.close(fd)  # Releases the lock
+        self.date = today
+        self.saved_total = total
+        self.pending = 0
+        self.oldest_pending = None
+        self.loaded = True
+        return granted
+
+    def _try_merge(self, add, reserve=False):
+        """
+        _merge() that keeps counting in memory when the record file can't be
+        updated (the next merge retries). Caller holds self.lock.
+        """
+        try:
+            return self._merge(add, reserve)
+        except OSError as e:
+            logger.error("Error writing %s: %s", self.path, e)
+            return True
+
+    def total(self):
+        with self.lock:
+            if not self.loaded or self.date != self._today():
+                self._try_merge(self.pending)
+            return self.saved_total + self.pending
+
+    def record(self):
+        """
+        Count one API request.
+        Returns:
+            int: Total requests made today (all processes, as far as known)
+        Raises:
+            QuotaExceededError: If the daily limit has been reached
+        """
+        with self.lock:
+            if not self.loaded or self.date != self._today():
+                self._try_merge(self.pending)
+            if self.saved_total + self.pending + self.flush_every >= self.daily_limit:
+                # Near the limit: check and count under the file lock
+                try:
+                    if not self._merge(self.pending, reserve=True):
+                        raise QuotaExceededError("Daily request limit exceeded for Gemini API.")
+                    return self.saved_total
+                except OSError as e:
+                    logger.error("Error writing %s: %s", self.path, e)
+                    if self.saved_total + self.pending >= self.daily_limit:
+                        raise QuotaExceededError("Daily request limit exceeded for Gemini API.")
+            self.pending += 1
+            if self.oldest_pending is None:
+                self.oldest_pending = time.monotonic()
+            if (self.pending >= self.flush_every
+                    or time.monotonic() - self.oldest_pending >= self.flush_interval):
+                self._try_merge(self.pending)
+            return self.saved_total + self.pending
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self._try_merge(self.pending)
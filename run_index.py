@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from log import get_logger
+
+logger = get_logger("run_index")
+
+# Index settings
+INDEX_FILE = "run_index.json"   # Stored next to the telemetry segments
+ANGLE_BIN = 10                  # Degrees per horizontal angle bin (0-80° sweep -> 9 bins)
+ANGLE_BINS = 9
+DISTANCE_EDGES = [150, 300, 500, 1000, 1500]  # mm; bins below each edge, one open-ended bin, one "no reading" bin
+MAX_DETAILS = 10                # Individual sightings listed for a single run
+
+STOPWORDS = {"a", "an", "the", "in", "on", "of", "and", "or", "any", "were", "was", "is", "are", "did", "do",
+             "does", "find", "found", "there", "what", "which", "where", "how", "often", "many", "much", "my",
+             "last", "run", "runs", "robot", "see", "seen", "detected", "detect", "it", "we", "you", "i", "all",
+             "every", "time", "times", "with", "at", "to", "for", "from", "during", "about", "tell", "me",
+             "show", "summary", "summarize", "happen", "happened", "previous", "past"}
+
+def normalize(text):
+    """
+    Split a label or query into lowercase word tokens, dropping a plural "s".
+    Returns:
+        list: Tokens, e.g. "Aphid pests" -> ["aphid", "pest"]
+    """
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+def _records(count):
+    return f"{count} record" if count == 1 else f"{count} records"
+
+def _angle_bin_names():
+    return [f"{i * ANGLE_BIN}-{(i + 1) * ANGLE_BIN - 1}°" for i in range(ANGLE_BINS - 1)] + \
+           [f"{(ANGLE_BINS - 1) * ANGLE_BIN}° and up"]
+
+def _distance_bin_names():
+    names, low = [], 0
+    for edge in DISTANCE_EDGES:
+        names.append(f"{low}-{edge} mm")
+        low = edge
+    return names + [f"over {low} mm", "no reading"]
+
+class RunIndex:
+    """
+    Persistent index over a TelemetryStore for answering run-history questions
+    offline. Per run it keeps a summary (time span, records, and for every label
+    its record count, first/last time and angle and distance histograms); an
+    inverted index maps normalized label tokens to labels and labels to the runs
+    they occur in. refresh() indexes only the records added since the last call
+    and saves the index as JSON next to the segments, so queries never scan the
+    telemetry log.
+    """
+
+    def __init__(self, store, path=None):
+        self.store = store
+        self.path = path or os.path.join(store.path, INDEX_FILE)
+        self.runs = {}        # run id -> summary
+        self.indexed = {}     # segment index -> records indexed
+        self.tokens = {}      # token -> set of labels
+        self.label_runs = {}  # label -> sorted run ids
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def _load(self):
+        # Caller holds self.lock
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.runs = {int(run): summary for run, summary in data["runs"].items()}
+            self.indexed = {int(segment): count for segment, count in data["indexed"].items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Run index unreadable (%s). Rebuilding it from telemetry...", e)
+            self.runs, self.indexed = {}, {}
+        self._invert()
+
+    def _save(self):
+        # Caller holds self.lock; write-then-rename so a crash never leaves half a file
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"runs": self.runs, "indexed": self.indexed}, f)
+        os.replace(temporary, self.path)
+
+    def _invert(self):
+        # Caller holds self.lock
+        self.tokens, label_runs = {}, {}
+        for run, summary in self.runs.items():
+            for label in summary["labels"]:
+                label_runs.setdefault(label, set()).add(run)
+        for label in label_runs:
+            for token in normalize(label):
+                self.tokens.setdefault(token, set()).add(label)
+        self.label_runs = {label: sorted(runs) for label, runs in label_runs.items()}
+
+    def _add(self, records):
+        # Caller holds self.lock
+        labels = self.store.labels.labels
+        angle_bins = np.clip(records["horizontal_angle"] // ANGLE_BIN, 0, ANGLE_BINS - 1)
+        distance = records["distance"]
+        distance_bins = np.where(np.isnan(distance), len(DISTANCE_EDGES) + 1,
+                                 np.searchsorted(DISTANCE_EDGES, np.nan_to_num(distance), side="right"))
+        keys = records["run"].astype(np.int64) << 16 | records["label"]
+        for key in np.unique(keys):
+            mask = keys == key
+            run, label = int(key >> 16), labels[int(key & 0xFFFF)]
+            times = records["timestamp"][mask]
+            summary = self.runs.setdefault(run, {"start": float(times[0]), "end": float(times[0]),
+                                                 "records": 0, "labels": {}})
+            summary["start"] = min(summary["start"], float(times.min()))
+            summary["end"] = max(summary["end"], float(times.max()))
+            summary["records"] += int(mask.sum())
+            stats = summary["labels"].setdefault(label, {
+                "count": 0, "first": float(times[0]), "last": float(times[0]),
+                "angles": [0] * ANGLE_BINS, "distances": [0] * (len(DISTANCE_EDGES) + 2)})
+            stats["count"] += int(mask.sum())
+            stats["first"] = min(stats["first"], float(times.min()))
+            stats["last"] = max(stats["last"], float(times.max()))
+            stats["angles"] = (np.array(stats["angles"]) +
+                               np.bincount(angle_bins[mask], minlength=ANGLE_BINS)).tolist()
+            stats["distances"] = (np.array(stats["distances"]) +
+                                  np.bincount(distance_bins[mask], minlength=len(DISTANCE_EDGES) + 2)).tolist()
+
+    def refresh(self):
+        """
+        Index the telemetry records added since the last refresh.
+        Returns:
+            int: Number of records indexed
+        """
+        with self.lock:
+            self._load()
+            added = 0
+            for segment, records in self.store.segments():
+                done = self.indexed.get(segment, 0)
+                if len(records) > done:
+                    self._add(np.asarray(records[done:]))
+                    added += len(records) - done
+                    self.indexed[segment] = len(records)
+            if added:
+                self._invert()
+                self._save()
+            return added
+
+    def labels_for(self, term):
+        """
+        Returns:
+            set: Recorded labels containing every token of term (e.g. "pest" -> {"pest", "aphid pest"})
+        """
+        tokens = normalize(term)
+        with self.lock:
+            self._load()
+            if not tokens:
+                return set()
+            matches = set(self.tokens.get(tokens[0], ()))
+            for token in tokens[1:]:
+                matches &= self.tokens.get(token, set())
+            return matches
+
+    def run_ids(self):
+        with self.lock:
+            self._load()
+            return sorted(self.runs)
+
+    def summary(self, run):
+        with self.lock:
+            self._load()
+            return self.runs.get(run)
+
+    def stats(self, term, runs=None):
+        """
+        Aggregate the labels matching term over runs (all runs by default).
+        Returns:
+            dict: count, runs {run: count}, angles and distances histograms, labels
+        """
+        labels = self.labels_for(term)
+        total = {"count": 0, "runs": {}, "angles": np.zeros(ANGLE_BINS, dtype=np.int64),
+                 "distances": np.zeros(len(DISTANCE_EDGES) + 2, dtype=np.int64), "labels": sorted(labels)}
+        with self.lock:
+            candidates = set()
+            for label in labels:
+                candidates.update(self.label_runs.get(label, ()))
+            if runs is not None:
+                candidates &= set(runs)
+            for run in sorted(candidates):
+                for label in labels:
+                    stats = self.runs[run]["labels"].get(label)
+                    if stats:
+                        total["count"] += stats["count"]
+                        total["runs"][run] = total["runs"].get(run, 0) + stats["count"]
+                        total["angles"] += stats["angles"]
+                        total["distances"] += stats["distances"]
+        return total
+
+    def entries(self, term, run, limit=MAX_DETAILS):
+        """
+        Telemetry entries of one run whose label matches term, as dicts.
+        Returns:
+            list: Up to limit entries where the label first appears at a new angle
+        """
+        labels = self.labels_for(term)
+        if not labels:
+            return []
+        records = self.store.load_run(run)
+        label_ids = [self.store.labels.ids[label] for label in labels if label in self.store.labels.ids]
+        matching = records[np.isin(records["label"], label_ids)]
+        if not len(matching):
+            return []
+        # One entry per sighting: drop records that repeat the previous label and angle
+        change = np.ones(len(matching), dtype=bool)
+        change[1:] = ((matching["label"][1:] != matching["label"][:-1]) |
+                      (matching["horizontal_angle"][1:] != matching["horizontal_angle"][:-1]))
+        return self.store.to_entries(matching[change][:limit])
+
+    def answer(self, query):
+        """
+        Answer a question about past runs from the index alone.
+        Returns:
+            str: The answer, or None if the query is not about runs
+        """
+        words = normalize(query)
+        text = query.lower()
+        if "run" not in words:
+            return None
+        self.refresh()
+        known = [word for word in words if word in self.tokens]
+        if not known and not re.search(r"\b(last|previous|past|which|all)\b.*\bruns?\b", text):
+            return None  # e.g. "how long can the pump run?"
+        all_runs = self.run_ids()
+        if not all_runs:
+            return "No data from previous runs available."
+        count = re.search(r"last (\d+) runs", text)
+        if count:
+            scope, scope_name = all_runs[-int(count.group(1)):], f"the last {count.group(1)} runs"
+        elif "last run" in text:
+            scope, scope_name = all_runs[-1:], "the last run"
+        else:
+            scope, scope_name = all_runs, f"all {len(all_runs)} runs"
+        terms = known or [word for word in words if word not in STOPWORDS and not word.isdigit()]
+        if not terms:
+            return self._describe_runs(scope, scope_name)
+        lines = []
+        for term in dict.fromkeys(terms):
+            stats = self.stats(term, scope)
+            if not stats["count"]:
+                lines.append(f"No {term}s were found in {scope_name}.")
+                continue
+            if len(scope) == 1:
+                lines.append(f"Yes, {term}s were found in {scope_name} ({_records(stats['count'])}).")
+            else:
+                lines.append(f"{term.capitalize()}s were found in {len(stats['runs'])} of {len(scope)} runs "
+                             f"({_records(stats['count'])}).")
+                for run, run_count in sorted(stats["runs"].items(), reverse=True)[:MAX_DETAILS]:
+                    start = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.runs[run]["start"]))
+                    lines.append(f"  Run {run} ({start}): {_records(run_count)}")
+            lines.append("  Where: " + self._histogram(stats["angles"], _angle_bin_names()))
+            lines.append("  Distance: " + self._histogram(stats["distances"], _distance_bin_names()))
+            if len(scope) == 1:
+                for entry in self.entries(term, scope[0]):
+                    distance = f"{entry['distance']:.0f} mm" if entry["distance"] is not None else "N/A"
+                    lines.append(f"  {entry['object'].capitalize()} detected at horizontal angle "
+                                 f"{entry['horizontal_angle']}°, distance {distance}")
+        return "\n".join(lines)
+
+    def _histogram(self, counts, names):
+        order = np.argsort(counts)[::-1]
+        return ", ".join(f"{names[i]} ({int(counts[i])})" for i in order if counts[i]) or "N/A"
+
+    def _describe_runs(self, scope, scope_name):
+        lines = [f"Summary of {scope_name}:"]
+        for run in scope[-MAX_DETAILS:]:
+            summary = self.summary(run)
+            start = time.strftime("%Y-%m-%d %H:%M", time.localtime(summary["start"]))
+            labels = sorted(summary["labels"].items(), key=lambda item: -item[1]["count"])
+            seen = ", ".join(f"{label} ({stats['count']})" for label, stats in labels[:5])
+            lines.append(f"  Run {run} ({start}, {summary['end'] - summary['start']:.0f} s): {seen}")
+        return "\n".join(lines)
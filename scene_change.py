@@ -0,0 +1,90 @@
+import io
+import time
+import numpy as np
+from log import get_logger
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow missing: every frame counts as changed
+    Image = None
+
+logger = get_logger("scene_change")
+
+# Gating settings
+SCENE_SIZE = (32, 24)          # Grayscale thumbnail compared between frames
+SCENE_CHANGE_THRESHOLD = 0.06  # Change score (0-1) a frame needs to be sent
+SCENE_MAX_AGE = 60.0           # Always resend a view after this many seconds
+SCENE_ANGLE_STEP = 5           # Reference frames are kept per servo step of this size
+HISTOGRAM_BINS = 16
+
+def thumbnail(image, size=SCENE_SIZE):
+    """
+    Decode a JPEG frame to a small grayscale array.
+    Args:
+        image: JPEG data (bytes, bytearray or memoryview)
+    Returns:
+        numpy.ndarray: float32 array in [0, 1] of shape (height, width), or None
+    """
+    if Image is None or image is None:
+        return None
+    try:
+        img = Image.open(io.BytesIO(image))
+        img.draft("L", (size[0] * 4, size[1] * 4))  # Let the JPEG decoder downscale
+        img = img.convert("L").resize(size)
+    except Exception as e:
+        logger.warning("Failed to decode frame for scene check: %s", e)
+        return None
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+def change_score(a, b):
+    """
+    Difference between two thumbnails: the larger of the mean absolute pixel
+    difference (after removing the brightness offset) and the histogram distance.
+    Returns:
+        float: 0 for identical frames, up to 1
+    """
+    diff = np.abs((a - a.mean()) - (b - b.mean())).mean()
+    ha, _ = np.histogram(a, bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+    hb, _ = np.histogram(b, bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+    hist = 0.5 * np.abs(ha / a.size - hb / b.size).sum()
+    return float(max(diff, hist))
+
+class SceneChangeGate:
+    """
+    Decides whether a frame differs enough from the last frame sent at the same
+    servo step to be worth a cloud detection.
+    """
+
+    def __init__(self, threshold=SCENE_CHANGE_THRESHOLD, max_age=SCENE_MAX_AGE, angle_step=SCENE_ANGLE_STEP):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.angle_step = angle_step
+        self.references = {}  # servo step -> (thumbnail, time sent)
+        self.passed = 0
+        self.skipped = 0
+
+    def check(self, image, angle=None):
+        """
+        Args:
+            image: JPEG frame
+            angle: Servo angle of the frame
+        Returns:
+            bool: True if the frame should be sent (its thumbnail becomes the new reference)
+        """
+        thumb = thumbnail(image)
+        if thumb is None:
+            self.passed += 1
+            return True
+        step = None if angle is None else round(angle / self.angle_step)
+        reference = self.references.get(step)
+        now = time.monotonic()
+        if (reference is not None and now - reference[1] < self.max_age
+                and change_score(thumb, reference[0]) < self.threshold):
+            self.skipped += 1
+            return False
+        self.references[step] = (thumb, now)
+        self.passed += 1
+        return True
+
+    def reset(self):
+        self.references.clear()
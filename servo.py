@@ -1,5 +1,13 @@
+import math
+import threading
+from collections import deque
+import hal  # selects real or simulated devices
 import pigpio
 import time
+from log import get_logger
+import metrics
+
+logger = get_logger("servo")
 
 # Servo GPIO pins (adjust as needed)
 HORIZONTAL_SERVO_PIN = 23  # GPIO 23 for horizontal servo
@@ -9,33 +17,373 @@ VERTICAL_SERVO_PIN = 18    # GPIO 18 for vertical servo
 SERVO_MIN_PULSE = 500   # 0 degrees
 SERVO_MAX_PULSE = 2500  # 180 degrees
 
+# Sweep trajectory settings
+SERVO_FRAME_US = 20000   # Servo pulses repeat every 20 ms (50 Hz)
+SWEEP_MIN_ANGLE = 0
+SWEEP_MAX_ANGLE = 80
+SWEEP_SPEED = 40.0       # Horizontal degrees per second
+NOD_ANGLE = 30           # Vertical nod at each end of the sweep
+NOD_SPEED = 120.0        # Vertical degrees per second
+WAVE_CHUNK = 1000        # Pulses per wave_add_generic call
+
 # Initialize pigpio
 pi = pigpio.pi()
 if not pi.connected:
     raise Exception("Failed to connect to pigpiod daemon.")
 
+# Last commanded angle per servo pin, updated on every pulse width change
+commanded_angles = {HORIZONTAL_SERVO_PIN: 0.0, VERTICAL_SERVO_PIN: 0.0}
+sweep_player = None   # TrajectoryPlayer once start_sweep() has run
+active_player = None  # TrajectoryPlayer currently driving the servos, if any
+timeline = deque(maxlen=16)  # Finished runs: (start, stop, trajectory, held horizontal, held vertical)
+timeline_lock = threading.Lock()  # Guards timeline; angle_at reads it from capture and mapping threads
+
 def angle_to_pulse(angle):
     # Convert angle (0-180) to pulse width (500-2500 us)
     return int(SERVO_MIN_PULSE + (angle / 180.0) * (SERVO_MAX_PULSE - SERVO_MIN_PULSE))
 
+def pulse_to_angle(pulse):
+    # Convert pulse width (500-2500 us) back to angle (0-180)
+    return (pulse - SERVO_MIN_PULSE) * 180.0 / (SERVO_MAX_PULSE - SERVO_MIN_PULSE)
+
+def get_angle(pin=HORIZONTAL_SERVO_PIN):
+    """
+    Return the angle the servo is commanded to right now (degrees). Safe to call from any thread.
+    """
+    return angle_at(time.monotonic(), pin)
+
+def angle_at(timestamp, pin=HORIZONTAL_SERVO_PIN, interpolate=False):
+    """
+    Return the angle the servo was commanded to at a time.monotonic() timestamp.
+    While a trajectory plays this comes from its timeline (interpolated between
+    servo frames if asked), otherwise it is the last angle set with move_servo.
+    """
+    angles = None
+    player = active_player
+    start_time = player.start_time if player is not None else None
+    if start_time is not None and timestamp >= start_time:
+        angles = player.trajectory.angles_at(timestamp - start_time, interpolate)
+    else:
+        # Look up the run that covered the timestamp, or the angles it left the servos at
+        with timeline_lock:
+            runs = list(timeline)
+        for start, stop, trajectory, horizontal, vertical in reversed(runs):
+            if start <= timestamp < stop:
+                angles = trajectory.angles_at(timestamp - start, interpolate)
+                break
+            if timestamp >= stop:
+                angles = (horizontal, vertical)
+                break
+    if angles is not None:
+        if pin == HORIZONTAL_SERVO_PIN:
+            return angles[0]
+        if pin == VERTICAL_SERVO_PIN:
+            return angles[1]
+    return commanded_angles[pin]
+
+step_time = metrics.stage("servo_step")   # One streamed sweep frame written to both servos
+move_time = metrics.stage("servo_move")   # One move_servo() call, including its pacing sleeps
+
 def move_servo(pin, angle, speed=2):
     # Move servo to the target angle smoothly
+    start = time.perf_counter()
     current_pulse = pi.get_servo_pulsewidth(pin)
     if current_pulse == 0:
         current_pulse = angle_to_pulse(0)  # Assume starting at 0 if not set
     target_pulse = angle_to_pulse(angle)
     step = 20 if target_pulse > current_pulse else -20  # Increased step size for faster movement
-    for pulse in range(current_pulse, target_pulse + step, step):
+    pulses = list(range(current_pulse + step, target_pulse, step)) + [target_pulse]
+    for pulse in pulses:
         pi.set_servo_pulsewidth(pin, pulse)
+        commanded_angles[pin] = pulse_to_angle(pulse)
         time.sleep(0.005 / speed)  # Reduced sleep time for faster movement
+    commanded_angles[pin] = angle
+    move_time.record(time.perf_counter() - start)
+    logger.debug("Servo %d moved to %s° in %d steps", pin, angle, len(pulses))
     return angle
 
+class SweepTrajectory:
+    """
+    One full scan cycle (min -> max, nod, max -> min, nod) precomputed as the
+    commanded (horizontal, vertical, direction) for every servo frame. Times are
+    seconds from the start of the cycle, which repeats.
+    """
+
+    def __init__(self, min_angle=SWEEP_MIN_ANGLE, max_angle=SWEEP_MAX_ANGLE, speed=SWEEP_SPEED,
+                 nod_angle=NOD_ANGLE, nod_speed=NOD_SPEED):
+        self.frame_time = SERVO_FRAME_US / 1e6
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.frames = []
+        self.extremes = []  # Cycle times at which each end of the sweep is reached
+        self.pass_time = abs(max_angle - min_angle) / speed
+        self.passes = {}  # direction -> (first frame, frame count) of that pass
+        for start, end, direction in ((min_angle, max_angle, 1), (max_angle, min_angle, -1)):
+            ramp = self._ramp(start, end, speed)
+            self.passes[direction] = (len(self.frames), len(ramp))
+            for angle in ramp:
+                self.frames.append((angle, 0.0, direction))
+            self.extremes.append(len(self.frames) * self.frame_time)
+            for nod in self._ramp(0, nod_angle, nod_speed) + self._ramp(nod_angle, 0, nod_speed):
+                self.frames.append((end, nod, -direction))
+        self.period = len(self.frames) * self.frame_time
+
+    def _ramp(self, start, end, speed):
+        count = max(int(math.ceil(abs(end - start) / speed / self.frame_time)), 1)
+        return [start + (end - start) * i / count for i in range(count)]
+
+    def frame_index(self, t):
+        return int((t % self.period) / self.frame_time)
+
+    def angles_at(self, t, interpolate=False):
+        """
+        Args:
+            t: Seconds since the cycle started (wraps around)
+            interpolate: Blend linearly towards the next frame instead of holding the current one
+        Returns:
+            tuple: (horizontal angle, vertical angle, direction)
+        """
+        index = self.frame_index(t)
+        horizontal, vertical, direction = self.frames[index]
+        if interpolate:
+            fraction = (t % self.period) / self.frame_time - index
+            next_horizontal, next_vertical, _ = self.frames[(index + 1) % len(self.frames)]
+            horizontal += (next_horizontal - horizontal) * fraction
+            vertical += (next_vertical - vertical) * fraction
+        return horizontal, vertical, direction
+
+    def extremes_before(self, t):
+        """
+        Returns:
+            int: Number of sweep ends reached within t seconds of the cycle start
+        """
+        cycles, rest = divmod(max(t, 0.0), self.period)
+        return int(cycles) * len(self.extremes) + sum(1 for extreme in self.extremes if extreme <= rest)
+
+    def start_frame(self, angle, direction=1):
+        """
+        Returns:
+            int: First frame of the pass in direction at or past angle, so a sweep can resume without a jump
+        """
+        first, count = self.passes[direction]
+        for index in range(first, first + count):
+            if (self.frames[index][0] - angle) * direction >= 0:
+                return index
+        return first
+
+    def pulses(self, horizontal_pin, vertical_pin, first_frame=0):
+        """
+        Build the cycle as pigpio pulses, starting at first_frame: both pins go
+        high at the start of each frame and low after their pulse width.
+        Returns:
+            list: pigpio.pulse objects covering one period
+        """
+        pulses = []
+        count = len(self.frames)
+        for index in range(first_frame, first_frame + count):
+            horizontal, vertical, _ = self.frames[index % count]
+            (first_width, first_pin), (second_width, second_pin) = sorted(
+                [(angle_to_pulse(horizontal), horizontal_pin), (angle_to_pulse(vertical), vertical_pin)])
+            if first_width == second_width:
+                pulses.append(pigpio.pulse((1 << first_pin) | (1 << second_pin), 0, first_width))
+                pulses.append(pigpio.pulse(0, (1 << first_pin) | (1 << second_pin), SERVO_FRAME_US - first_width))
+            else:
+                pulses.append(pigpio.pulse((1 << first_pin) | (1 << second_pin), 0, first_width))
+                pulses.append(pigpio.pulse(0, 1 << first_pin, second_width - first_width))
+                pulses.append(pigpio.pulse(0, 1 << second_pin, SERVO_FRAME_US - second_width))
+        return pulses
+
+class TrajectoryPlayer:
+    """
+    Plays a SweepTrajectory on the servos without the control loop's help.
+    The whole cycle is uploaded once as a pigpio waveform that pigpiod repeats
+    with DMA timing; if the daemon cannot build the wave, a background thread
+    streams the pulse widths on an absolute 50 Hz schedule instead. The start
+    time is recorded, so angles_at() can report the commanded angles for any
+    time.monotonic() timestamp of the current run.
+    """
+
+    def __init__(self, trajectory=None, horizontal_pin=HORIZONTAL_SERVO_PIN, vertical_pin=VERTICAL_SERVO_PIN,
+                 use_waveform=True):
+        self.trajectory = trajectory or SweepTrajectory()
+        self.horizontal_pin = horizontal_pin
+        self.vertical_pin = vertical_pin
+        self.use_waveform = use_waveform
+        self.mode = None        # "waveform" or "stream" while running
+        self.wave_id = None
+        self.start_time = None  # time.monotonic() of cycle time 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.start_time is not None
+
+    def start(self, from_angle=None, direction=1):
+        """
+        Start sweeping. With from_angle the cycle is entered on the pass in
+        direction at that angle instead of at its start.
+        """
+        global active_player
+        if self.running:
+            return
+        if active_player is not None and active_player is not self:
+            active_player.stop()
+        first_frame = self.trajectory.start_frame(from_angle, direction) if from_angle is not None else 0
+        started = False
+        if self.use_waveform:
+            try:
+                self._start_waveform(first_frame)
+                started = True
+            except Exception as e:
+                logger.warning("Servo waveform unavailable (%s). Streaming pulse widths instead...", e)
+                self._delete_wave()
+        if not started:
+            self._start_stream(first_frame)
+        active_player = self
+
+    def _start_waveform(self, first_frame):
+        pulses = self.trajectory.pulses(self.horizontal_pin, self.vertical_pin, first_frame)
+        pi.wave_clear()
+        offset = 0
+        for index in range(0, len(pulses), WAVE_CHUNK):
+            chunk = pulses[index:index + WAVE_CHUNK]
+            # Later chunks are merged from time zero, so lead them with a delay
+            pi.wave_add_generic(([pigpio.pulse(0, 0, offset)] if offset else []) + chunk)
+            offset += sum(pulse.delay for pulse in chunk)
+        wave_id = pi.wave_create()
+        if wave_id < 0:
+            raise RuntimeError(f"wave_create failed ({wave_id})")
+        self.wave_id = wave_id
+        # Leave servo mode; the wave now drives both pins
+        for pin in (self.horizontal_pin, self.vertical_pin):
+            pi.set_servo_pulsewidth(pin, 0)
+            pi.set_mode(pin, pigpio.OUTPUT)
+        pi.wave_send_repeat(wave_id)
+        self.start_time = time.monotonic() - first_frame * self.trajectory.frame_time
+        self.mode = "waveform"
+        logger.info("Servo sweep running as a %.2f s hardware-timed waveform.", self.trajectory.period)
+
+    def _delete_wave(self):
+        if self.wave_id is not None:
+            try:
+                pi.wave_tx_stop()
+                pi.wave_delete(self.wave_id)
+            except Exception as e:
+                logger.error("Error deleting servo waveform: %s", e)
+            self.wave_id = None
+
+    def _start_stream(self, first_frame):
+        self.start_time = time.monotonic() - first_frame * self.trajectory.frame_time
+        self.mode = "stream"
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._stream, args=(first_frame,), name="servo", daemon=True)
+        self.thread.start()
+
+    def _stream(self, index):
+        frame_time = self.trajectory.frame_time
+        last = {}
+        while not self.stop_event.is_set():
+            delay = self.start_time + index * frame_time - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            elif delay < -frame_time:
+                index = int((time.monotonic() - self.start_time) / frame_time)  # Late: skip missed frames
+            horizontal, vertical, _ = self.trajectory.frames[index % len(self.trajectory.frames)]
+            start = time.perf_counter()
+            for pin, angle in ((self.horizontal_pin, horizontal), (self.vertical_pin, vertical)):
+                pulse = angle_to_pulse(angle)
+                if last.get(pin) != pulse:
+                    pi.set_servo_pulsewidth(pin, pulse)
+                    last[pin] = pulse
+            step_time.record(time.perf_counter() - start)
+            index += 1
+
+    def stop(self):
+        """
+        Stop sweeping and hold the servos at the angles commanded at that moment.
+        Returns:
+            tuple: (horizontal angle, vertical angle) the servos were left at
+        """
+        global active_player
+        if not self.running:
+            return commanded_angles[self.horizontal_pin], commanded_angles[self.vertical_pin]
+        now = time.monotonic()
+        horizontal, vertical, _ = self.angles_at(now)
+        # Record the run before giving up active_player so angle_at always finds one or the other
+        with timeline_lock:
+            timeline.append((self.start_time, now, self.trajectory, horizontal, vertical))
+        if active_player is self:
+            active_player = None
+        if self.mode == "waveform":
+            self._delete_wave()
+        else:
+            self.stop_event.set()
+            if self.thread is not None:
+                self.thread.join(timeout=1)
+                self.thread = None
+        self.start_time = None
+        self.mode = None
+        for pin, angle in ((self.horizontal_pin, horizontal), (self.vertical_pin, vertical)):
+            pi.set_servo_pulsewidth(pin, angle_to_pulse(angle))
+            commanded_angles[pin] = angle
+        return horizontal, vertical
+
+    def angles_at(self, timestamp=None, interpolate=False):
+        """
+        Args:
+            timestamp: time.monotonic() value (default: now)
+            interpolate: Interpolate between servo frames
+        Returns:
+            tuple: (horizontal angle, vertical angle, direction); direction is 0 when stopped
+        """
+        start_time = self.start_time
+        if start_time is None:
+            return commanded_angles[self.horizontal_pin], commanded_angles[self.vertical_pin], 0
+        if timestamp is None:
+            timestamp = time.monotonic()
+        return self.trajectory.angles_at(max(timestamp - start_time, 0.0), interpolate)
+
+    def sweeps_completed(self, timestamp=None):
+        """
+        Returns:
+            int: Sweep ends reached since the player started (0 when stopped)
+        """
+        start_time = self.start_time
+        if start_time is None:
+            return 0
+        if timestamp is None:
+            timestamp = time.monotonic()
+        return self.trajectory.extremes_before(timestamp - start_time)
+
+def start_sweep(from_angle=None):
+    """
+    Start the continuous servo sweep (idempotent).
+    Returns:
+        TrajectoryPlayer: The running player
+    """
+    global sweep_player
+    if sweep_player is None:
+        sweep_player = TrajectoryPlayer()
+    sweep_player.start(from_angle)
+    return sweep_player
+
+def stop_sweep():
+    """
+    Returns:
+        tuple: (horizontal angle, vertical angle) the servos were left at
+    """
+    if sweep_player is None:
+        return commanded_angles[HORIZONTAL_SERVO_PIN], commanded_angles[VERTICAL_SERVO_PIN]
+    return sweep_player.stop()
+
 def servo_init():
-    print("Initializing servos...")
+    logger.info("Initializing servos...")
     # Set initial positions
     pi.set_servo_pulsewidth(HORIZONTAL_SERVO_PIN, angle_to_pulse(0))
     pi.set_servo_pulsewidth(VERTICAL_SERVO_PIN, angle_to_pulse(0))
-    print("Servos initialized at 0 degrees.")
+    commanded_angles[HORIZONTAL_SERVO_PIN] = commanded_angles[VERTICAL_SERVO_PIN] = 0.0
+    logger.info("Servos initialized at 0 degrees.")
 
 def servo_move(horizontal_angle, vertical_angle, direction):
     """
@@ -69,11 +417,12 @@ def servo_move(horizontal_angle, vertical_angle, direction):
     return horizontal_angle, vertical_angle, direction, at_extreme
 
 def servo_stop():
-    print("Stopping servos...")
+    logger.info("Stopping servos...")
+    stop_sweep()
     pi.set_servo_pulsewidth(HORIZONTAL_SERVO_PIN, 0)
     pi.set_servo_pulsewidth(VERTICAL_SERVO_PIN, 0)
     pi.stop()
-    print("Servos stopped.")
+    logger.info("Servos stopped.")
 
 if __name__ == "__main__":
     try:
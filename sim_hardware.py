@@ -0,0 +1,835 @@
+"""
+In-process simulated hardware for running FormBot without a Raspberry Pi.
+
+install() registers drop-in replacements for pigpio, smbus, RPi.GPIO, board,
+busio, adafruit_vl53l1x, picamera and serial in sys.modules, so servo.py,
+mpu6050.py, motor.py, vl53l1x.py, gps.py and main.py import them unchanged.
+Every simulated device shares one SimWorld: the motor PWM drives the robot
+pose, the servo pulse widths aim the range sensor, and the VL53L1X, MPU6050
+and GPS report what that pose implies, with configurable latency and noise.
+"""
+import sys
+import os
+import types
+import time
+import math
+import random
+import threading
+import zlib
+import io
+import bisect
+import struct
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Latencies are in seconds, distances in millimeters, angles in degrees.
+SIM_CONFIG = {
+    "seed": None,                # RNG seed for reproducible runs
+    "i2c_latency": 0.0005,       # per I2C transaction
+    "pigpio_latency": 0.0002,    # per pigpiod socket command
+    "gpio_latency": 0.00005,     # per RPi.GPIO call
+    "camera_latency": 0.08,      # per still capture, including JPEG encode
+    "camera_jpeg_size": 40000,   # bytes per simulated JPEG frame
+    "range_noise": 5.0,          # VL53L1X noise (1 sigma)
+    "range_dropout": 0.0,        # probability a ranging cycle is invalid
+    "range_max": 1300.0,         # short distance mode limit
+    "ground_range": 1100.0,      # reported when nothing is nearer (sensor sees the ground); None = open sky
+    "accel_noise": 0.002,        # g (1 sigma)
+    "gyro_noise": 0.05,          # deg/s (1 sigma)
+    "gps_noise": 0.5,            # meters (1 sigma)
+    "gps_rate": 1.0,             # fixes per second
+    "gps_protocol": "ubx",       # "ubx" (u-blox NEO-6M, max 5 Hz) or "pmtk" (MediaTek, max 10 Hz)
+    "gps_origin": (12.971600, 77.594600),
+    "max_wheel_speed": 600.0,    # wheel speed at 100% duty cycle (mm/s)
+    "wheel_base": 250.0,
+    "left_pwm_pins": (12, 13),   # (forward, reverse), see motor.py
+    "right_pwm_pins": (20, 21),
+    "horizontal_servo_pin": 23,  # see servo.py
+    "servo_center": 40,          # servo angle that looks straight ahead
+    "obstacles": [(1500.0, 300.0, 150.0), (2500.0, -400.0, 200.0)],  # (x, y, radius)
+    "cloud_latency": 1.5,        # simulated Gemini round trip
+    "cloud_labels": ["plant", "weed", "soil", "pest", "stone"],
+    "cloud_batch_misalign": 0.0,  # probability a batch answer is missing a line
+}
+
+def configure(**options):
+    """
+    Override simulation settings. Unknown keys raise KeyError.
+    """
+    for key, value in options.items():
+        if key not in SIM_CONFIG:
+            raise KeyError(f"Unknown simulation option: {key}")
+        SIM_CONFIG[key] = value
+    if "seed" in options:
+        world.rng.seed(options["seed"])
+    if "obstacles" in options:
+        world.obstacles = list(options["obstacles"])
+
+def _delay(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+class SimWorld:
+    """
+    Shared physical state: robot pose, actuator outputs and an event log.
+    The pose is integrated lazily from the wheel duty cycles whenever it is read.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rng = random.Random(SIM_CONFIG["seed"])
+        self.obstacles = list(SIM_CONFIG["obstacles"])
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0  # radians, counter-clockwise
+        self.last_step = time.monotonic()
+        self.duty = {}
+        self.servo_pulse = {}
+        self.wave = None  # (per-pin (rise times, widths), length us, start time, repeat) while a wave plays
+        self.motor_stops = []  # timestamps where all wheel PWM dropped to zero
+        self.cloud_requests = 0
+
+    def reset(self):
+        with self.lock:
+            self.x = self.y = self.heading = 0.0
+            self.last_step = time.monotonic()
+            self.duty.clear()
+            self.servo_pulse.clear()
+            self.wave = None
+            self.motor_stops.clear()
+            self.cloud_requests = 0
+            self.obstacles = list(SIM_CONFIG["obstacles"])
+
+    def _wheel_speeds(self):
+        lf, lr = SIM_CONFIG["left_pwm_pins"]
+        rf, rr = SIM_CONFIG["right_pwm_pins"]
+        scale = SIM_CONFIG["max_wheel_speed"] / 100.0
+        left = (self.duty.get(lf, 0.0) - self.duty.get(lr, 0.0)) * scale
+        right = (self.duty.get(rf, 0.0) - self.duty.get(rr, 0.0)) * scale
+        return left, right
+
+    def step(self):
+        with self.lock:
+            now = time.monotonic()
+            dt = now - self.last_step
+            self.last_step = now
+            left, right = self._wheel_speeds()
+            v = (left + right) / 2.0
+            w = (right - left) / SIM_CONFIG["wheel_base"]
+            self.x += v * math.cos(self.heading) * dt
+            self.y += v * math.sin(self.heading) * dt
+            self.heading = (self.heading + w * dt) % (2 * math.pi)
+
+    def set_duty(self, pin, duty):
+        with self.lock:
+            self.step()
+            was_moving = any(self.duty.values())
+            self.duty[pin] = float(duty)
+            if was_moving and not any(self.duty.values()):
+                self.motor_stops.append(time.monotonic())
+
+    def yaw_rate(self):
+        with self.lock:
+            left, right = self._wheel_speeds()
+            return math.degrees((right - left) / SIM_CONFIG["wheel_base"])
+
+    def pulse_width(self, pin):
+        wave = self.wave
+        if wave is None or pin not in wave[0]:
+            return self.servo_pulse.get(pin, 0)
+        (rises, widths), length, start, repeat = wave[0][pin], wave[1], wave[2], wave[3]
+        offset = (time.monotonic() - start) * 1e6
+        if repeat:
+            offset %= length
+        elif offset >= length:
+            return widths[-1]  # The servo holds the last pulse it saw
+        index = bisect.bisect_right(rises, offset) - 1
+        return widths[index] if index >= 0 else widths[-1]
+
+    def servo_angle(self, pin):
+        pulse = self.pulse_width(pin)
+        if pulse == 0:
+            return 0.0
+        return (pulse - 500) * 180.0 / 2000.0
+
+    def true_range(self):
+        """
+        Distance from the sensor to the nearest obstacle along the servo bearing.
+        """
+        with self.lock:
+            self.step()
+            offset = self.servo_angle(SIM_CONFIG["horizontal_servo_pin"]) - SIM_CONFIG["servo_center"]
+            bearing = self.heading + math.radians(offset)
+            dx, dy = math.cos(bearing), math.sin(bearing)
+            nearest = math.inf
+            for ox, oy, radius in self.obstacles:
+                # Ray-circle intersection
+                fx, fy = self.x - ox, self.y - oy
+                b = fx * dx + fy * dy
+                c = fx * fx + fy * fy - radius * radius
+                disc = b * b - c
+                if disc < 0:
+                    continue
+                t = -b - math.sqrt(disc)
+                if t < 0:
+                    t = -b + math.sqrt(disc)
+                if 0 <= t < nearest:
+                    nearest = t
+            return nearest
+
+    def place_wall_ahead(self, distance):
+        """
+        Drop a wide obstacle across the robot's path, visible over the whole sweep.
+        """
+        with self.lock:
+            self.step()
+            radius = 5000.0
+            cx = self.x + (distance + radius) * math.cos(self.heading)
+            cy = self.y + (distance + radius) * math.sin(self.heading)
+            self.obstacles.append((cx, cy, radius))
+
+    def scene_key(self):
+        """
+        Coarse description of what the camera sees, used to seed synthetic frames.
+        """
+        with self.lock:
+            self.step()
+            pan = int(self.servo_angle(SIM_CONFIG["horizontal_servo_pin"])) // 5
+            return (int(math.degrees(self.heading)) // 5, pan, int(self.x) // 200, int(self.y) // 200)
+
+world = SimWorld()
+
+# --- pigpio -----------------------------------------------------------------
+
+class SimPulse:
+    def __init__(self, gpio_on, gpio_off, delay):
+        self.gpio_on = gpio_on
+        self.gpio_off = gpio_off
+        self.delay = delay
+
+class SimPi:
+    """
+    pigpiod client: servo pulses and the waveform calls servo.py uses. Waves
+    are decoded into per-pin pulse widths that SimWorld replays against the clock.
+    """
+
+    def __init__(self, host="localhost", port=8888):
+        self.connected = True
+        self.pending = []  # (time us, on mask, off mask) of the wave being built
+        self.waves = {}
+        self.next_wave = 0
+
+    def set_mode(self, gpio, mode):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        return 0
+
+    def wave_clear(self):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        self.pending = []
+        self.waves.clear()
+        return 0
+
+    def wave_add_generic(self, pulses):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        t = 0
+        for pulse in pulses:
+            self.pending.append((t, pulse.gpio_on, pulse.gpio_off))
+            t += pulse.delay
+        self.pending.append((t, 0, 0))
+        return len(self.pending)
+
+    def wave_create(self):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        events = sorted(self.pending, key=lambda event: event[0])
+        length = events[-1][0] if events else 0
+        edges, high = {}, {}
+        for t, on, off in events:
+            for gpio in range(32):
+                bit = 1 << gpio
+                if on & bit:
+                    high[gpio] = t
+                elif off & bit and gpio in high:
+                    rises, widths = edges.setdefault(gpio, ([], []))
+                    rises.append(high.pop(gpio))
+                    widths.append(t - rises[-1])
+        wave_id = self.next_wave
+        self.next_wave += 1
+        self.waves[wave_id] = (edges, length)
+        self.pending = []
+        return wave_id
+
+    def _send(self, wave_id, repeat):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        edges, length = self.waves[wave_id]
+        with world.lock:
+            world.wave = (edges, length, time.monotonic(), repeat)
+        return len(edges)
+
+    def wave_send_once(self, wave_id):
+        return self._send(wave_id, False)
+
+    def wave_send_repeat(self, wave_id):
+        return self._send(wave_id, True)
+
+    def wave_tx_busy(self):
+        wave = world.wave
+        return int(wave is not None and (wave[3] or (time.monotonic() - wave[2]) * 1e6 < wave[1]))
+
+    def wave_tx_stop(self):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        with world.lock:
+            world.wave = None
+        return 0
+
+    def wave_delete(self, wave_id):
+        self.waves.pop(wave_id, None)
+        return 0
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        if pulsewidth != 0 and not 500 <= pulsewidth <= 2500:
+            raise ValueError(f"GPIO {gpio}: bad pulsewidth {pulsewidth}")
+        with world.lock:
+            world.servo_pulse[gpio] = pulsewidth
+        return 0
+
+    def get_servo_pulsewidth(self, gpio):
+        _delay(SIM_CONFIG["pigpio_latency"])
+        return world.servo_pulse.get(gpio, 0)
+
+    def stop(self):
+        self.connected = False
+
+# --- smbus (MPU6050 at 0x68) --------------------------------------------------
+
+MPU6050_ADDR = 0x68
+
+class SimSMBus:
+    """
+    MPU6050 register file: live data registers, WHO_AM_I, the sample rate and
+    DLPF registers, and a 1024-byte FIFO filled at the configured rate.
+    """
+
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.registers = {}
+        self.fifo = bytearray()
+        self.fifo_time = time.monotonic()
+        self.fifo_overflow = False
+
+    def _sample_rate(self):
+        base = 8000 if self.registers.get(0x1A, 0) & 0x07 in (0, 7) else 1000
+        return base / (1 + self.registers.get(0x19, 0))
+
+    def _fifo_fill(self):
+        # Append the accel + gyro frames the chip produced since the last fill
+        now = time.monotonic()
+        if not self.registers.get(0x6A, 0) & 0x40 or not self.registers.get(0x23, 0):
+            self.fifo_time = now
+            return
+        rate = self._sample_rate()
+        count = int((now - self.fifo_time) * rate)
+        self.fifo_time += count / rate
+        for _ in range(count):
+            if len(self.fifo) + 12 > 1024:
+                self.fifo_overflow = True
+                self.fifo_time = now
+                break
+            data = self._mpu_data()
+            self.fifo += bytes(data[0:6] + data[8:14])
+
+    def _read_register(self, reg):
+        if 0x3B <= reg <= 0x48:
+            return self._mpu_data()[reg - 0x3B]
+        if reg == 0x75:  # WHO_AM_I
+            return MPU6050_ADDR
+        if reg in (0x72, 0x73):  # FIFO_COUNTH/L
+            self._fifo_fill()
+            return len(self.fifo) >> 8 if reg == 0x72 else len(self.fifo) & 0xFF
+        if reg == 0x3A:  # INT_STATUS, cleared on read
+            status = 0x10 if self.fifo_overflow else 0
+            self.fifo_overflow = False
+            return status
+        if reg == 0x74:  # FIFO_R_W
+            if not self.fifo:
+                return 0
+            value = self.fifo[0]
+            del self.fifo[0]
+            return value
+        return self.registers.get(reg, 0)
+
+    def _mpu_data(self):
+        """
+        Current 14-byte ACCEL_XOUT_H..GYRO_ZOUT_L block as the chip would report it.
+        """
+        rng = world.rng
+        an, gn = SIM_CONFIG["accel_noise"], SIM_CONFIG["gyro_noise"]
+        accel = (rng.gauss(0, an), rng.gauss(0, an), 1.0 + rng.gauss(0, an))
+        gyro = (rng.gauss(0, gn), rng.gauss(0, gn), world.yaw_rate() + rng.gauss(0, gn))
+        temp = 25.0
+        raw = [int(a * 16384) for a in accel] + [int((temp - 36.53) * 340)] + [int(g * 131) for g in gyro]
+        data = []
+        for value in raw:
+            value = max(-32768, min(32767, value)) & 0xFFFF
+            data += [value >> 8, value & 0xFF]
+        return data
+
+    def _check(self, addr):
+        _delay(SIM_CONFIG["i2c_latency"])
+        if addr != MPU6050_ADDR:
+            raise OSError(121, "Remote I/O error")
+
+    def write_byte_data(self, addr, reg, value):
+        self._check(addr)
+        if reg == 0x6A:  # USER_CTRL
+            self._fifo_fill()
+            if value & 0x04:  # FIFO_RESET
+                self.fifo.clear()
+                self.fifo_overflow = False
+                self.fifo_time = time.monotonic()
+            value &= ~0x04
+        self.registers[reg] = value & 0xFF
+
+    def read_byte_data(self, addr, reg):
+        self._check(addr)
+        return self._read_register(reg)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self._check(addr)
+        if length > 32:
+            raise OSError(22, "Invalid argument")  # SMBus block limit
+        if 0x3B <= reg and reg + length <= 0x49:
+            return self._mpu_data()[reg - 0x3B:reg - 0x3B + length]
+        if reg == 0x74:  # FIFO_R_W does not auto-increment
+            return [self._read_register(reg) for _ in range(length)]
+        return [self._read_register(reg + i) for i in range(length)]
+
+    def close(self):
+        pass
+
+# --- RPi.GPIO -----------------------------------------------------------------
+
+class SimPWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+
+    def start(self, duty_cycle):
+        self.ChangeDutyCycle(duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        _delay(SIM_CONFIG["gpio_latency"])
+        if not 0 <= duty_cycle <= 100:
+            raise ValueError("dutycycle must have a value from 0.0 to 100.0")
+        world.set_duty(self.pin, duty_cycle)
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        world.set_duty(self.pin, 0)
+
+def _make_gpio_module():
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.BCM, gpio.BOARD = 11, 10
+    gpio.OUT, gpio.IN = 0, 1
+    gpio.HIGH, gpio.LOW = 1, 0
+    gpio.levels = {}
+    gpio.setmode = lambda mode: None
+    gpio.setwarnings = lambda flag: None
+    gpio.setup = lambda pin, mode, initial=0, pull_up_down=None: gpio.levels.__setitem__(pin, initial)
+    gpio.output = lambda pin, value: gpio.levels.__setitem__(pin, value)
+    gpio.input = lambda pin: gpio.levels.get(pin, 0)
+    gpio.PWM = SimPWM
+    gpio.cleanup = lambda *pins: gpio.levels.clear()
+    return gpio
+
+# --- board / busio / adafruit_vl53l1x -----------------------------------------
+
+class SimI2C:
+    def __init__(self, scl=None, sda=None, frequency=100000):
+        self.frequency = frequency
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def deinit(self):
+        pass
+
+class SimVL53L1X:
+    """
+    VL53L1X that produces a new range every timing_budget milliseconds.
+    distance is reported in centimeters like the Adafruit driver.
+    """
+
+    def __init__(self, i2c, address=0x29):
+        self.i2c = i2c
+        self.address = address
+        self.distance_mode = 1
+        self.timing_budget = 100
+        self.ranging = False
+        self.cycle_start = time.monotonic()
+
+    def start_ranging(self):
+        _delay(SIM_CONFIG["i2c_latency"])
+        self.ranging = True
+        self.cycle_start = time.monotonic()
+
+    def stop_ranging(self):
+        _delay(SIM_CONFIG["i2c_latency"])
+        self.ranging = False
+
+    @property
+    def data_ready(self):
+        _delay(SIM_CONFIG["i2c_latency"])
+        return self.ranging and time.monotonic() - self.cycle_start >= self.timing_budget / 1000.0
+
+    @property
+    def distance(self):
+        _delay(SIM_CONFIG["i2c_latency"] * 2)
+        if world.rng.random() < SIM_CONFIG["range_dropout"]:
+            return None
+        limit = SIM_CONFIG["range_max"] if self.distance_mode == 1 else 4000.0
+        mm = world.true_range()
+        if SIM_CONFIG["ground_range"] is not None:
+            mm = min(mm, SIM_CONFIG["ground_range"])
+        mm += world.rng.gauss(0, SIM_CONFIG["range_noise"])
+        if mm > limit:
+            return None
+        return max(mm, 1.0) / 10.0
+
+    def clear_interrupt(self):
+        _delay(SIM_CONFIG["i2c_latency"])
+        self.cycle_start = time.monotonic()
+
+# --- picamera -----------------------------------------------------------------
+
+class SimPiCamera:
+    """
+    PiCamera that writes synthetic frames derived from the simulated scene.
+    Frames show a luma pattern that shifts with heading, pan and position; JPEG
+    frames are real JPEGs when Pillow is installed and opaque bytes otherwise.
+    """
+
+    def __init__(self, resolution=(640, 480), framerate=30):
+        self.resolution = resolution
+        self.framerate = framerate
+        self.closed = False
+
+    def start_preview(self):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def _frame(self, format, resize):
+        key = world.scene_key()
+        width, height = resize or self.resolution
+        # Raw captures are padded to 32x16 like the real firmware
+        fw, fh = (width + 31) // 32 * 32, (height + 15) // 16 * 16
+        shift = key[0] * 7 + key[1] * 11 + key[2] * 3 + key[3] * 5
+        row = bytes(int(128 + 100 * math.sin((x + shift) / 9.0)) for x in range(fw))
+        luma = b"".join(row[(y + shift) % 7:] + row[:(y + shift) % 7] for y in range(fh))
+        if format == "jpeg":
+            if Image is None:
+                rng = random.Random(zlib.crc32(repr(key).encode()))
+                return b"\xff\xd8" + rng.randbytes(SIM_CONFIG["camera_jpeg_size"]) + b"\xff\xd9"
+            out = io.BytesIO()
+            Image.frombytes("L", (fw, fh), luma).crop((0, 0, width, height)).save(out, "JPEG", quality=85)
+            return out.getvalue()
+        if format == "yuv":
+            return luma + bytes([128]) * (fw * fh // 2)
+        channels = {"rgb": 3, "bgr": 3, "rgba": 4, "bgra": 4}[format]
+        return bytes(b for value in luma for b in [value] * channels)
+
+    def capture(self, output, format="jpeg", use_video_port=False, resize=None, **options):
+        if self.closed:
+            raise RuntimeError("Camera is closed")
+        _delay(SIM_CONFIG["camera_latency"] / (2 if use_video_port else 1))
+        output.write(self._frame(format, resize))
+
+    def capture_continuous(self, output, format="jpeg", use_video_port=False, resize=None, **options):
+        period = 1.0 / float(self.framerate)
+        next_frame = time.monotonic()
+        while not self.closed:
+            _delay(next_frame - time.monotonic())
+            next_frame = max(next_frame + period, time.monotonic())
+            output.write(self._frame(format, resize))
+            yield output
+
+    def close(self):
+        self.closed = True
+
+# --- serial (GPS UART) -----------------------------------------------------
+
+def _nmea(body):
+    checksum = 0
+    for ch in body:
+        checksum ^= ord(ch)
+    return f"${body}*{checksum:02X}\r\n"
+
+def _nmea_coord(value, lat):
+    hemisphere = ("N" if value >= 0 else "S") if lat else ("E" if value >= 0 else "W")
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    return (f"{degrees:02d}{minutes:07.4f}" if lat else f"{degrees:03d}{minutes:07.4f}"), hemisphere
+
+class SimSerial:
+    """
+    UART attached to a simulated GPS module emitting GGA, RMC and VTG bursts.
+    The module starts at 9600 baud and gps_rate fixes per second. A "ubx" module
+    accepts UBX CFG-PRT (baud rate) and CFG-RATE (fix interval) and ignores PMTK
+    commands; a "pmtk" module accepts PMTK251 and PMTK220 and ignores UBX. Bytes
+    are paced at the module's baud rate and arrive garbled while the UART's baud
+    rate differs.
+    """
+
+    def __init__(self, port=None, baudrate=9600, timeout=None, **options):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self.buffer = b""
+        self.next_fix = time.monotonic()
+        self.last_pose = None
+        self.module_baud = 9600
+        self.fix_rate = SIM_CONFIG["gps_rate"]
+        self.protocol = SIM_CONFIG["gps_protocol"]
+        self.max_rate = 5.0 if self.protocol == "ubx" else 10.0
+        self.commands = b""
+
+    def _burst(self):
+        world.step()
+        rng = world.rng
+        lat0, lon0 = SIM_CONFIG["gps_origin"]
+        noise = SIM_CONFIG["gps_noise"]
+        north = world.y / 1000.0 + rng.gauss(0, noise)
+        east = world.x / 1000.0 + rng.gauss(0, noise)
+        lat = lat0 + north / 111320.0
+        lon = lon0 + east / (111320.0 * math.cos(math.radians(lat0)))
+        wall = time.time()
+        now = time.gmtime(wall)
+        stamp = time.strftime("%H%M%S", now) + f".{int(wall * 100) % 100:02d}"
+        lat_s, ns = _nmea_coord(lat, True)
+        lon_s, ew = _nmea_coord(lon, False)
+        pose = (time.monotonic(), world.x, world.y)
+        speed = 0.0
+        if self.last_pose:
+            dt = pose[0] - self.last_pose[0]
+            if dt > 0:
+                speed = math.hypot(pose[1] - self.last_pose[1], pose[2] - self.last_pose[2]) / 1000.0 / dt
+        self.last_pose = pose
+        course = (90.0 - math.degrees(world.heading)) % 360.0
+        knots = speed * 1.943844
+        sentences = [
+            _nmea(f"GPGGA,{stamp},{lat_s},{ns},{lon_s},{ew},1,08,0.9,920.0,M,-86.0,M,,"),
+            _nmea(f"GPRMC,{stamp},A,{lat_s},{ns},{lon_s},{ew},{knots:.2f},{course:.1f},"
+                  f"{time.strftime('%d%m%y', now)},,,A"),
+            _nmea(f"GPVTG,{course:.1f},T,,M,{knots:.2f},N,{speed * 3.6:.2f},K,A"),
+        ]
+        return "".join(sentences).encode("ascii")
+
+    def _fill(self, deadline):
+        while not self.buffer:
+            now = time.monotonic()
+            if now >= self.next_fix:
+                self.buffer = self._burst()
+                self.next_fix = max(self.next_fix + 1.0 / self.fix_rate, now)
+                return True
+            wait = self.next_fix - now
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+                if wait <= 0:
+                    return False
+            time.sleep(wait)
+        return True
+
+    def _take(self, count):
+        data, self.buffer = self.buffer[:count], self.buffer[count:]
+        _delay(len(data) * 10.0 / self.module_baud)  # 8N1 framing
+        if self.baudrate != self.module_baud:
+            data = bytes(byte ^ 0x5A for byte in data)
+        return data
+
+    def readline(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        line = b""
+        while not line.endswith(b"\n"):
+            if not self._fill(deadline):
+                break
+            end = self.buffer.find(b"\n")
+            line += self._take(end + 1 if end >= 0 else len(self.buffer))
+        return line
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        data = b""
+        while len(data) < size and self._fill(deadline):
+            data += self._take(size - len(data))
+        return data
+
+    @property
+    def in_waiting(self):
+        if time.monotonic() >= self.next_fix and not self.buffer:
+            self._fill(None)
+        return len(self.buffer)
+
+    def write(self, data):
+        _delay(len(data) * 10.0 / self.baudrate)
+        if self.baudrate == self.module_baud:
+            self.commands += bytes(data)
+        while self.commands:
+            if self.commands.startswith(b"\xb5\x62"):
+                if len(self.commands) < 6:
+                    break
+                length = struct.unpack_from("<H", self.commands, 4)[0]
+                if len(self.commands) < 8 + length:
+                    break
+                key, payload = self.commands[2:4], self.commands[6:6 + length]
+                self.commands = self.commands[8 + length:]
+                if self.protocol != "ubx":
+                    continue
+                if key == b"\x06\x00" and length >= 12:
+                    self.module_baud = struct.unpack_from("<I", payload, 8)[0]
+                    self.buffer = b""
+                elif key == b"\x06\x08" and length >= 2:
+                    self.fix_rate = min(1000.0 / struct.unpack_from("<H", payload)[0], self.max_rate)
+            elif self.commands.startswith(b"$"):
+                if b"\n" not in self.commands:
+                    break
+                line, self.commands = self.commands.split(b"\n", 1)
+                fields = line.strip().split(b"*")[0].split(b",")
+                if self.protocol != "pmtk":
+                    continue
+                if fields[0] == b"$PMTK251" and len(fields) > 1:
+                    self.module_baud = int(fields[1])
+                    self.buffer = b""
+                elif fields[0] == b"$PMTK220" and len(fields) > 1:
+                    self.fix_rate = min(1000.0 / int(fields[1]), self.max_rate)
+            else:
+                self.commands = self.commands[1:]  # Skip noise up to the next command
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.buffer = b""
+
+    def close(self):
+        self.is_open = False
+
+# --- google.generativeai ------------------------------------------------------
+
+class SimResponse:
+    def __init__(self, text):
+        self.text = text
+
+class SimGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel that answers after cloud_latency seconds.
+    Labels are derived from the image bytes, so identical frames get identical answers.
+    """
+
+    def __init__(self, model_name="gemini-1.5-flash", generation_config=None, **options):
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def generate_content(self, contents, **options):
+        _delay(SIM_CONFIG["cloud_latency"])
+        with world.lock:
+            world.cloud_requests += 1
+        labels = SIM_CONFIG["cloud_labels"]
+        images = [part["data"] for part in contents if isinstance(part, dict) and "data" in part]
+        if not images:
+            return SimResponse("Simulated answer.")
+        answers = []
+        for data in images:
+            if isinstance(data, str):
+                data = data.encode("ascii")
+            answers.append(labels[zlib.crc32(bytes(data)) % len(labels)])
+        if len(answers) == 1:
+            return SimResponse(answers[0])
+        if world.rng.random() < SIM_CONFIG["cloud_batch_misalign"]:
+            answers.pop()  # Model skipped an image
+        return SimResponse("\n".join(f"{n}: {label}" for n, label in enumerate(answers, start=1)))
+
+    def count_tokens(self, contents, **options):
+        _delay(SIM_CONFIG["cloud_latency"] / 4)
+        return types.SimpleNamespace(total_tokens=len(str(contents)) // 4)
+
+class SimGenerationConfig(dict):
+    def __init__(self, **options):
+        super().__init__(**options)
+
+def _make_genai_module():
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda api_key=None, **options: None
+    genai.GenerativeModel = SimGenerativeModel
+    genai.GenerationConfig = SimGenerationConfig
+    genai.types = types.SimpleNamespace(GenerationConfig=SimGenerationConfig)
+    return genai
+
+# --- installation -------------------------------------------------------------
+
+def install(cloud=False):
+    """
+    Register the simulated device modules in sys.modules.
+    Args:
+        cloud: Also replace google.generativeai with SimGenerativeModel
+    """
+    modules = {}
+
+    pigpio = types.ModuleType("pigpio")
+    pigpio.pi = SimPi
+    pigpio.pulse = SimPulse
+    pigpio.OUTPUT = 1
+    modules["pigpio"] = pigpio
+
+    smbus = types.ModuleType("smbus")
+    smbus.SMBus = SimSMBus
+    modules["smbus"] = smbus
+
+    gpio = _make_gpio_module()
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = gpio
+    modules["RPi"] = rpi
+    modules["RPi.GPIO"] = gpio
+
+    board = types.ModuleType("board")
+    board.SCL, board.SDA = 3, 2
+    board.I2C = SimI2C
+    modules["board"] = board
+
+    busio = types.ModuleType("busio")
+    busio.I2C = SimI2C
+    modules["busio"] = busio
+
+    vl53 = types.ModuleType("adafruit_vl53l1x")
+    vl53.VL53L1X = SimVL53L1X
+    modules["adafruit_vl53l1x"] = vl53
+
+    picamera = types.ModuleType("picamera")
+    picamera.PiCamera = SimPiCamera
+    modules["picamera"] = picamera
+
+    serial = types.ModuleType("serial")
+    serial.Serial = SimSerial
+    serial.SerialException = OSError
+    modules["serial"] = serial
+
+    if cloud:
+        google = sys.modules.get("google") or types.ModuleType("google")
+        google.generativeai = _make_genai_module()
+        modules["google"] = google
+        modules["google.generativeai"] = google.generativeai
+        os.environ.setdefault("GOOGLE_API_KEY", "simulated")
+
+    sys.modules.update(modules)
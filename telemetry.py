@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+import numpy as np
+
+# Storage settings
+TELEMETRY_DIR = "telemetry"   # Segment log directory (relative to the working directory)
+SEGMENT_RECORDS = 65536       # Records per segment file (1.5 MB)
+RING_SIZE = 4096              # Newest records kept in RAM for recent()
+FLUSH_INTERVAL = 5.0          # Seconds between msyncs of the active segment (max loss on power failure)
+
+# One detected frame. timestamp is time.time() so runs line up across reboots;
+# label indexes the LabelTable; distance is NaN when there was no valid reading.
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("run", "<u4"),
+    ("label", "<u2"),
+    ("horizontal_angle", "<i2"),
+    ("vertical_angle", "<i2"),
+    ("distance", "<f4"),
+    ("reserved", "<u2"),
+])
+
+class LabelTable:
+    """
+    Interns object labels as small integers, persisted one label per line in
+    an append-only text file (the line number is the id).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.labels = []
+        self.ids = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    self._add(line.rstrip("\n"))
+
+    def _add(self, label):
+        self.ids[label] = len(self.labels)
+        self.labels.append(label)
+
+    def intern(self, label):
+        label_id = self.ids.get(label)
+        if label_id is None:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(label.replace("\n", " ") + "\n")
+            self._add(label)
+            label_id = self.ids[label]
+        return label_id
+
+    def label(self, label_id):
+        return self.labels[label_id]
+
+    def matching(self, text):
+        """
+        Returns:
+            list: Ids of the labels containing text (case-insensitive)
+        """
+        text = text.lower()
+        return [label_id for label_id, label in enumerate(self.labels) if text in label.lower()]
+
+class TelemetryStore:
+    """
+    Per-frame Autonomous Mode detections in a NumPy structured array log. New
+    records go to a bounded in-memory ring and to the active segment, a
+    preallocated file written through a memory map, so memory stays constant
+    however long the robot runs. Segments are never rewritten; a full one is
+    closed and the next is started. Past runs are read back through read-only
+    memory maps, which loads nothing until the records are touched.
+    The directory is created on first use. append() only writes memory; a
+    background thread msyncs the active segment every flush_interval seconds.
+    """
+
+    def __init__(self, path=TELEMETRY_DIR, segment_records=SEGMENT_RECORDS, ring_size=RING_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.segment_records = segment_records
+        self.ring = np.zeros(ring_size, dtype=RECORD_DTYPE)
+        self.ring_count = 0      # Records ever appended to the ring in this process
+        self.labels = None
+        self.segment = None      # Writable memmap of the active segment
+        self.segment_index = 0
+        self.segment_count = 0   # Records used in the active segment
+        self.run = 0             # Current run id (0 = no run started)
+        self.flush_interval = flush_interval
+        self.dirty = False       # Records appended since the last flush
+        self.retired = []        # Full segments waiting for their final flush
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flusher = None
+
+    def _segment_path(self, index):
+        return os.path.join(self.path, f"segment-{index:06d}.bin")
+
+    def _segment_indexes(self):
+        names = [name for name in os.listdir(self.path) if name.startswith("segment-") and name.endswith(".bin")]
+        return sorted(int(name[8:-4]) for name in names)
+
+    def _used(self, records):
+        # Unused slots are zero-filled, and every record has a nonzero timestamp
+        empty = np.flatnonzero(records["timestamp"] == 0)
+        return int(empty[0]) if len(empty) else len(records)
+
+    def _open(self):
+        # Caller holds self.lock
+        if self.labels is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self.labels = LabelTable(os.path.join(self.path, "labels.txt"))
+        self.stop_event.clear()
+        self.flusher = threading.Thread(target=self._flush_loop, name="telemetry-flush", daemon=True)
+        self.flusher.start()
+        indexes = self._segment_indexes()
+        if not indexes:
+            self._new_segment(1)
+            return
+        self.segment_index = indexes[-1]
+        self.segment = np.memmap(self._segment_path(self.segment_index), dtype=RECORD_DTYPE, mode="r+")
+        self.segment_count = self._used(self.segment)
+        # Continue numbering after the newest run on disk
+        for index in reversed(indexes):
+            records = self.segment if index == self.segment_index else \
+                np.memmap(self._segment_path(index), dtype=RECORD_DTYPE, mode="r")
+            used = self._used(records)
+            if used:
+                self.run = int(records["run"][used - 1])
+                break
+
+    def _new_segment(self, index):
+        # Caller holds self.lock; the flush thread writes the full segment out
+        if self.segment is not None:
+            self.retired.append(self.segment)
+        path = self._segment_path(index)
+        with open(path, "wb") as f:
+            f.truncate(self.segment_records * RECORD_DTYPE.itemsize)
+        self.segment = np.memmap(path, dtype=RECORD_DTYPE, mode="r+")
+        self.segment_index = index
+        self.segment_count = 0
+
+    def begin_run(self):
+        """
+        Start a new run; following append() calls belong to it.
+        Returns:
+            int: The run id
+        """
+        with self.lock:
+            self._open()
+            self.run += 1
+            return self.run
+
+    def append(self, label, horizontal_angle, vertical_angle, distance, timestamp=None):
+        """
+        Record one detected frame of the current run.
+        Args:
+            label: Detected object label (interned)
+            distance: Distance in mm, or None
+        """
+        with self.lock:
+            self._open()
+            if self.segment_count >= len(self.segment):
+                self._new_segment(self.segment_index + 1)
+            record = (timestamp if timestamp is not None else time.time(), self.run, self.labels.intern(label),
+                      horizontal_angle, vertical_angle, np.nan if distance is None else distance, 0)
+            self.segment[self.segment_count] = record
+            self.ring[self.ring_count % len(self.ring)] = record
+            self.segment_count += 1
+            self.ring_count += 1
+            self.dirty = True
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        # The msync runs outside the lock so append() never waits for the disk
+        with self.lock:
+            segment, dirty, self.dirty = self.segment, self.dirty, False
+            retired, self.retired = self.retired, []
+        for full in retired:
+            full.flush()
+        if dirty and segment is not None:
+            segment.flush()
+
+    def end_run(self):
+        """
+        Write the current run's records through to disk.
+        """
+        self._flush()
+
+    def close(self):
+        """
+        Stop the flush thread and write everything through to disk.
+        """
+        self.stop_event.set()
+        if self.flusher is not None:
+            self.flusher.join(timeout=self.flush_interval)
+            self.flusher = None
+        self._flush()
+
+    def recent(self, count=None):
+        """
+        Returns:
+            numpy.ndarray: Up to count newest records from the in-memory ring, oldest first
+        """
+        with self.lock:
+            available = min(self.ring_count, len(self.ring))
+            count = available if count is None else min(count, available)
+            indexes = np.arange(self.ring_count - count, self.ring_count) % len(self.ring)
+            return self.ring[indexes]
+
+    def segments(self):
+        """
+        Yields:
+            tuple: (segment index, records) for every segment, oldest first; the
+                   active segment is trimmed to its used records
+        """
+        with self.lock:
+            self._open()
+            indexes = self._segment_indexes()
+            active, active_records = self.segment_index, self.segment[:self.segment_count]
+        for index in indexes:
+            if index == active:
+                yield index, active_records
+            else:
+                records = np.memmap(self._segment_path(index), dtype=RECORD_DTYPE, mode="r")
+                yield index, records[:self._used(records)]
+
+    def runs(self):
+        """
+        Returns:
+            list: Ids of the runs with at least one record, oldest first
+        """
+        found = set()
+        for _, records in self.segments():
+            if len(records):
+                found.update(np.unique(records["run"]).tolist())
+        return sorted(found)
+
+    def last_run(self):
+        """
+        Returns:
+            int: Id of the newest run with records, or None
+        """
+        runs = self.runs()
+        return runs[-1] if runs else None
+
+    def load_run(self, run):
+        """
+        Records of one run. Runs are appended in order, so each segment holds a
+        contiguous (searchsorted) slice of a run.
+        Returns:
+            numpy.ndarray: Structured array of RECORD_DTYPE records
+        """
+        parts = []
+        for _, records in self.segments():
+            runs = records["run"]
+            start, stop = np.searchsorted(runs, run, "left"), np.searchsorted(runs, run, "right")
+            if stop > start:
+                parts.append(np.array(records[start:stop]))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def label_of(self, label_id):
+        with self.lock:
+            self._open()
+            return self.labels.label(label_id)
+
+    def to_entries(self, records):
+        """
+        Convert records to the {"object", "horizontal_angle", "vertical_angle", "distance"} dicts
+        Autonomous Mode used to keep in run_data.
+        Returns:
+            list: One dict per record
+        """
+        return [{
+            "object": self.label_of(int(record["label"])),
+            "horizontal_angle": int(record["horizontal_angle"]),
+            "vertical_angle": int(record["vertical_angle"]),
+            "distance": None if np.isnan(record["distance"]) else float(record["distance"]),
+            "timestamp": float(record["timestamp"]),
+        } for record in records]
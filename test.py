@@ -1,4 +1,5 @@
 import time
+import hal  # selects real or simulated devices
 import board
 import busio
 import adafruit_vl53l1x
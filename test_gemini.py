@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+import pytest
+import gemini
+from detection_cache import DetectionCache
+
+def test_parse_batch_labels_in_frame_order():
+    text = "2: tree\n1: 'apple'\nImage 3. **car**\n"
+    assert gemini.parse_batch_labels(text, 3) == ["apple", "tree", "car"]
+
+def test_parse_batch_labels_skips_chatter_and_fills_blank_labels():
+    text = "Here are the objects:\n1: weed\n2:\n"
+    assert gemini.parse_batch_labels(text, 2) == ["weed", "unknown"]
+
+@pytest.mark.parametrize("text", [
+    "1: apple\n2: tree",               # Missing line
+    "1: apple\n1: tree\n2: car",       # Duplicate number
+    "1: apple\n2: tree\n4: car",       # Number out of range
+    "",
+    None,
+])
+def test_parse_batch_labels_rejects_misaligned_answers(text):
+    assert gemini.parse_batch_labels(text, 3) is None
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """
+    Replace the Gemini model with one that answers each image with its data
+    and drops the last line of every batch larger than misalign_above.
+    """
+    api = SimpleNamespace(requests=[], misalign_above=None)
+
+    class Model:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, contents):
+            images = [part["data"] for part in contents if isinstance(part, dict)]
+            api.requests.append(len(images))
+            if len(images) == 1:
+                return SimpleNamespace(text=images[0].decode())
+            lines = [f"{n}: {image.decode()}" for n, image in enumerate(images, start=1)]
+            if api.misalign_above is not None and len(images) > api.misalign_above:
+                lines = lines[:-1]
+            return SimpleNamespace(text="\n".join(lines))
+
+    monkeypatch.setattr(gemini.genai, "GenerativeModel", Model)
+    monkeypatch.setattr(gemini, "_models", {})
+    monkeypatch.setattr(gemini, "update_request_count", lambda: 0)
+    monkeypatch.setattr(gemini, "is_online", lambda: True)
+    monkeypatch.setattr(gemini, "detection_cache", DetectionCache())
+    return api
+
+def frames(count):
+    return [(f"frame {n}".encode(), n * 5) for n in range(count)]
+
+def test_batch_is_one_request(fake_api):
+    assert gemini.detect_objects_batch(frames(4)) == ["frame 0", "frame 1", "frame 2", "frame 3"]
+    assert fake_api.requests == [4]
+
+def test_misaligned_batch_is_split_in_half(fake_api):
+    fake_api.misalign_above = 2
+    assert gemini.detect_objects_batch(frames(5)) == ["frame 0", "frame 1", "frame 2", "frame 3", "frame 4"]
+    # 5 -> 2 + 3 -> 2 + 1 + 2; the single frame goes through detect_object
+    assert fake_api.requests == [5, 2, 3, 1, 2]
+
+def test_batch_is_unknown_while_offline(fake_api, monkeypatch):
+    monkeypatch.setattr(gemini, "is_online", lambda: False)
+    assert gemini.detect_objects_batch(frames(2)) == ["unknown (offline)"] * 2
+    assert fake_api.requests == []
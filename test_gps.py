@@ -0,0 +1,52 @@
+from functools import reduce
+import gps
+
+GGA = "GPGGA,123519.00,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,"
+RMC = "GPRMC,123519.00,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W"
+
+def sentence(body, checksum=None):
+    if checksum is None:
+        checksum = reduce(lambda total, char: total ^ ord(char), body, 0)
+    return f"${body}*{checksum:02X}\r\n".encode("ascii")
+
+def test_complete_sentences():
+    parser = gps.NmeaParser()
+    assert parser.feed(sentence(GGA) + sentence(RMC)) == [GGA, RMC]
+    assert (parser.sentences, parser.errors) == (2, 0)
+
+def test_sentence_split_across_reads():
+    parser = gps.NmeaParser()
+    data = sentence(GGA) + sentence(RMC)
+    completed = []
+    for i in range(0, len(data), 7):
+        completed += parser.feed(data[i:i + 7])
+    assert completed == [GGA, RMC]
+    completed = []
+    for byte in sentence(GGA):
+        completed += parser.feed(bytes([byte]))
+    assert completed == [GGA]
+
+def test_corrupt_sentences_are_dropped():
+    parser = gps.NmeaParser()
+    corrupted = bytearray(sentence(GGA))
+    corrupted[10] ^= 0x01
+    data = (sentence(GGA, checksum=0) + bytes(corrupted) + b"$GPGGA,12*ZZ\r\n"
+            + b"$GPRMC,1\x00\x01\r\n" + sentence(RMC))
+    assert parser.feed(data) == [RMC]
+    assert (parser.sentences, parser.errors) == (1, 4)
+
+def test_dollar_restarts_a_truncated_sentence():
+    parser = gps.NmeaParser()
+    assert parser.feed(b"$GPGGA,1235" + sentence(RMC)) == [RMC]
+    assert parser.errors == 1
+
+def test_overlong_sentence_is_dropped():
+    parser = gps.NmeaParser()
+    body = "GPTXT," + "A" * gps.MAX_SENTENCE
+    assert parser.feed(sentence(body) + sentence(GGA)) == [GGA]
+    assert parser.errors == 1
+
+def test_noise_between_sentences_is_ignored():
+    parser = gps.NmeaParser()
+    assert parser.feed(b"\xb5b\x05\x01\x02\x00garbage" + sentence(GGA) + b"\r\n\x00" + sentence(RMC)) == [GGA, RMC]
+    assert parser.errors == 0
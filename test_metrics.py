@@ -0,0 +1,64 @@
+import math
+import random
+import pytest
+import metrics
+from metrics import Histogram
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)), 1) - 1]
+
+@pytest.mark.parametrize("low, high", [(1e-6, 1e-3), (1e-4, 10.0), (0.5, 0.6)])
+def test_quantiles_within_relative_error(low, high):
+    rng = random.Random(25)
+    values = [math.exp(rng.uniform(math.log(low), math.log(high))) for _ in range(20000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    snapshot = histogram.snapshot((0.5, 0.9, 0.99, 0.999, 1.0))
+    for q, estimate in snapshot["quantiles"].items():
+        exact = exact_quantile(values, q)
+        # The estimate is the upper bound of the exact value's bucket
+        assert exact <= estimate <= exact * (1 + 1.0 / metrics.SUB_BUCKETS)
+    assert snapshot["count"] == len(values)
+    assert snapshot["sum"] == pytest.approx(sum(values))
+    assert snapshot["max"] == max(values)
+
+def test_quantile_never_exceeds_max():
+    histogram = Histogram()
+    for value in (0.010, 0.010, 0.010, 0.0101):
+        histogram.record(value)
+    assert histogram.quantile(0.999) == 0.0101
+
+def test_out_of_range_values_are_clamped():
+    histogram = Histogram(lowest=1e-3, highest=1.0)
+    histogram.record(1e-9)
+    histogram.record(50.0)
+    assert histogram.counts[0] == 1 and histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) <= 2e-3
+    # Values past highest report the last bucket's bound; max stays exact
+    assert histogram.quantile(1.0) == pytest.approx(2.0)
+    assert histogram.snapshot()["max"] == 50.0
+
+def test_memory_is_fixed():
+    histogram = Histogram()
+    buckets = len(histogram.counts)
+    for i in range(1, 10001):
+        histogram.record(i * 1e-5)
+    assert len(histogram.counts) == buckets
+
+def test_empty_and_reset():
+    histogram = Histogram()
+    assert math.isnan(histogram.quantile(0.5))
+    histogram.record(0.25)
+    histogram.reset()
+    assert histogram.snapshot()["count"] == 0
+    assert math.isnan(histogram.quantile(0.99))
+
+def test_render_exposes_stage_summary():
+    histogram = metrics.stage("test_render")
+    histogram.reset()
+    histogram.record(0.002)
+    text = metrics.render()
+    assert 'formbot_stage_seconds_count{stage="test_render"} 1' in text
+    assert 'formbot_stage_seconds{stage="test_render",quantile="0.99"}' in text
@@ -0,0 +1,89 @@
+import os
+import pytest
+from quota import QuotaManager, QuotaExceededError
+
+def manager(path, daily_limit=10, flush_every=3, day="2026-10-18"):
+    quota = QuotaManager(str(path), daily_limit, flush_every=flush_every, flush_interval=3600)
+    quota._today = lambda: quota.day
+    quota.day = day
+    return quota
+
+def record_file(path):
+    return path.read_text()
+
+def test_requests_are_persisted_in_batches(tmp_path):
+    path = tmp_path / "request_count.txt"
+    quota = manager(path, daily_limit=100, flush_every=3)
+    assert [quota.record() for _ in range(4)] == [1, 2, 3, 4]
+    assert record_file(path) == "2026-10-18,3"
+    quota.flush()
+    assert record_file(path) == "2026-10-18,4"
+
+def test_record_file_is_shared_across_users(tmp_path):
+    path = tmp_path / "request_count.txt"
+    umask = os.umask(0o022)
+    try:
+        manager(path).total()
+    finally:
+        os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o666
+
+def test_reserve_stops_at_the_limit(tmp_path):
+    path = tmp_path / "request_count.txt"
+    quota = manager(path, daily_limit=10, flush_every=3)
+    assert [quota.record() for _ in range(10)] == list(range(1, 11))
+    with pytest.raises(QuotaExceededError):
+        quota.record()
+    assert record_file(path) == "2026-10-18,10"
+
+def test_processes_share_the_limit(tmp_path):
+    path = tmp_path / "request_count.txt"
+    first = manager(path, daily_limit=10, flush_every=3)
+    second = manager(path, daily_limit=10, flush_every=3)
+    for _ in range(6):
+        first.record()
+    first.flush()
+    # second sees first's requests and is near the limit from the start
+    assert [second.record() for _ in range(4)] == [7, 8, 9, 10]
+    with pytest.raises(QuotaExceededError):
+        second.record()
+    # first learns of them on its next merge, so it overshoots by less than flush_every
+    overshoot = 0
+    with pytest.raises(QuotaExceededError):
+        while overshoot < 10:
+            first.record()
+            overshoot += 1
+    assert overshoot < 3
+
+def test_count_restarts_on_a_new_day(tmp_path):
+    path = tmp_path / "request_count.txt"
+    path.write_text("2026-10-17,10")
+    quota = manager(path, daily_limit=10, day="2026-10-17")
+    with pytest.raises(QuotaExceededError):
+        quota.record()
+    quota.day = "2026-10-18"
+    assert quota.record() == 1
+    assert quota.total() == 1
+    assert record_file(path) == "2026-10-18,0"
+    quota.flush()
+    assert record_file(path) == "2026-10-18,1"
+
+def test_unsaved_requests_of_a_finished_day_are_dropped(tmp_path):
+    path = tmp_path / "request_count.txt"
+    quota = manager(path, daily_limit=100, flush_every=5, day="2026-10-17")
+    for _ in range(3):
+        quota.record()
+    quota.day = "2026-10-18"
+    assert quota.record() == 1
+
+@pytest.mark.parametrize("contents, total", [("42", 42), ("not a count", 0), ("", 0)])
+def test_legacy_and_corrupt_records(tmp_path, contents, total):
+    path = tmp_path / "request_count.txt"
+    path.write_text(contents)
+    assert manager(path, daily_limit=100).total() == total
+
+def test_unwritable_record_file_keeps_counting_in_memory(tmp_path):
+    quota = manager(tmp_path / "missing" / "request_count.txt", daily_limit=5, flush_every=2)
+    assert [quota.record() for _ in range(5)] == [1, 2, 3, 4, 5]
+    with pytest.raises(QuotaExceededError):
+        quota.record()
@@ -1,59 +1,241 @@
 import time
+import threading
+from collections import deque, namedtuple
+import hal  # selects real or simulated devices
 import board
 import adafruit_vl53l1x
+from log import get_logger
+import metrics
+
+logger = get_logger("vl53l1x")
 
 vl53 = None
+sampler = None  # RangingSampler once start_sampler() has run
+
+# Ranging settings
+DISTANCE_MODE = 1        # 1 = short (up to 1.3 m), 2 = long
+TIMING_BUDGET = 100      # ms per ranging cycle
+HISTORY_SIZE = 64        # Samples kept by RangingSampler
+POLL_INTERVAL = 0.002    # Seconds between data-ready polls near the end of a cycle
+
+ranging_time = metrics.stage("ranging")  # I2C read of one finished measurement
+invalid_samples = metrics.counter("formbot_ranging_invalid_total", "Ranging cycles without a valid distance")
+
+# One ranging result. distance is in mm (None if invalid), timestamp is time.monotonic().
+Sample = namedtuple("Sample", ["seq", "distance", "timestamp", "valid"])
+
+def _configure(sensor, distance_mode, timing_budget):
+    sensor.distance_mode = distance_mode
+    sensor.timing_budget = timing_budget
+    sensor.start_ranging()
 
 def vl53l1x_init():
     global vl53
     try:
         i2c = board.I2C()
         vl53 = adafruit_vl53l1x.VL53L1X(i2c, address=0x29)
-        print("I2C bus initialized on I2C1 (GPIO 2/3).")
-        vl53.distance_mode = 1  # Short range
-        print("Distance mode set to short range.")
-        vl53.timing_budget = 100
-        print("Timing budget set to 100 ms.")
+        logger.info("I2C bus initialized on I2C1 (GPIO 2/3).")
+        vl53.distance_mode = DISTANCE_MODE
+        logger.info("Distance mode set to %s range.", "short" if DISTANCE_MODE == 1 else "long")
+        vl53.timing_budget = TIMING_BUDGET
+        logger.info("Timing budget set to %d ms.", TIMING_BUDGET)
         vl53.start_ranging()
-        print("Started ranging...")
+        logger.info("Started ranging...")
         return True
     except Exception as e:
-        print(f"Failed to initialize VL53L1X: {e}")
+        logger.error("Failed to initialize VL53L1X: %s", e)
         vl53 = None
         return False
 
-def read_distance(sensor):
+def _read_sensor(sensor, retry=True, check_ready=True):
+    """
+    Read one measurement straight from the sensor without waiting.
+    On an error the sensor is reinitialized and read once more.
+    Args:
+        check_ready: Poll data-ready first; the sampler has already done so
+    Returns:
+        float: Distance in mm, or None if no new or valid measurement
+    """
     if sensor is None:
         return None
     try:
-        if not sensor.data_ready:
+        if check_ready and not sensor.data_ready:
             return None
         distance = sensor.distance
-        time.sleep(0.1)  # Respect the timing budget
         sensor.clear_interrupt()
         if distance is None or distance <= 0:
             raise ValueError("Invalid distance reading from VL53L1X")
         return distance * 10  # Convert cm to mm
     except Exception as e:
-        print(f"VL53L1X read error: {e}")
+        logger.warning("VL53L1X read error: %s", e)
+        if not retry:
+            return None
         try:
             sensor.stop_ranging()
             i2c = board.I2C()
             global vl53
             vl53 = adafruit_vl53l1x.VL53L1X(i2c, address=0x29)
-            vl53.distance_mode = 1
-            vl53.timing_budget = 100
-            vl53.start_ranging()
-            print("VL53L1X reinitialized after error.")
-            return read_distance(vl53)
+            if sampler is not None:
+                _configure(vl53, sampler.distance_mode, sampler.timing_budget)
+            else:
+                _configure(vl53, DISTANCE_MODE, TIMING_BUDGET)
+            logger.info("VL53L1X reinitialized after error.")
+            return _read_sensor(vl53, retry=False)
         except Exception as reinitialize_error:
-            print(f"Failed to reinitialize VL53L1X: {reinitialize_error}")
+            logger.error("Failed to reinitialize VL53L1X: %s", reinitialize_error)
             return None
 
+def read_distance(sensor, timeout=None):
+    """
+    Read a distance in mm, or None if no valid reading is available.
+    While the background sampler runs, this waits for its next sample (up to
+    one ranging cycle by default) instead of touching the I2C bus.
+    """
+    if sampler is not None and sampler.running:
+        last = sampler.latest()
+        if timeout is None:
+            timeout = sampler.timing_budget / 1000.0 * 1.5
+        sample = sampler.wait_for_sample(last.seq if last else 0, timeout)
+        return sample.distance if sample is not None and sample.valid else None
+    return _read_sensor(sensor)
+
+class RangingSampler:
+    """
+    Background thread that follows the sensor's data-ready cadence and publishes
+    every measurement. latest() is a single attribute read (the slot is replaced
+    atomically, never mutated), so readers never block; history() returns the
+    most recent HISTORY_SIZE samples.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_ring = deque(maxlen=history_size)
+        self.slot = None
+        self.seq = 0
+        self.timing_budget = TIMING_BUDGET
+        self.distance_mode = DISTANCE_MODE
+        self.pending_config = None
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        if vl53 is not None:
+            self.timing_budget = vl53.timing_budget
+            self.distance_mode = vl53.distance_mode
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="vl53l1x", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def configure(self, timing_budget=None, distance_mode=None):
+        """
+        Change timing budget (ms) and/or distance mode; applied between ranging cycles.
+        """
+        self.pending_config = (timing_budget or self.timing_budget, distance_mode or self.distance_mode)
+
+    def _publish(self, distance, timestamp):
+        self.seq += 1
+        sample = Sample(self.seq, distance, timestamp, distance is not None)
+        if distance is None:
+            invalid_samples.inc()
+        self.history_ring.append(sample)
+        self.slot = sample
+        logger.debug("Range sample %d: %s mm", sample.seq, distance, extra={"distance": distance})
+        with self.condition:
+            self.condition.notify_all()
+
+    def _apply_config(self):
+        timing_budget, distance_mode = self.pending_config
+        self.pending_config = None
+        try:
+            vl53.stop_ranging()
+            _configure(vl53, distance_mode, timing_budget)
+            self.timing_budget, self.distance_mode = timing_budget, distance_mode
+            logger.info("VL53L1X reconfigured: timing budget %d ms, distance mode %d.", timing_budget, distance_mode)
+        except Exception as e:
+            logger.error("Failed to reconfigure VL53L1X: %s", e)
+
+    def _run(self):
+        cycle_start = time.monotonic()
+        while not self.stop_event.is_set():
+            if vl53 is None:
+                self.stop_event.wait(self.timing_budget / 1000.0)
+                continue
+            if self.pending_config:
+                self._apply_config()
+                cycle_start = time.monotonic()
+            # Sleep through most of the cycle, then poll data-ready closely
+            wake = cycle_start + self.timing_budget / 1000.0 * 0.9
+            self.stop_event.wait(max(wake - time.monotonic(), 0))
+            try:
+                ready = vl53.data_ready
+            except Exception as e:
+                logger.warning("VL53L1X data-ready check failed: %s", e)
+                ready = True  # Let _read_sensor recover the sensor
+            if not ready:
+                if time.monotonic() - cycle_start > self.timing_budget / 1000.0 * 3:
+                    # No result for three cycles: report it and start a new cycle
+                    self._publish(None, time.monotonic())
+                    cycle_start = time.monotonic()
+                else:
+                    self.stop_event.wait(POLL_INTERVAL)
+                continue
+            timestamp = time.monotonic()
+            with ranging_time.time():
+                distance = _read_sensor(vl53, check_ready=False)
+            self._publish(distance, timestamp)
+            cycle_start = timestamp
+
+    def latest(self):
+        """
+        Returns:
+            Sample: Newest sample, or None before the first measurement
+        """
+        return self.slot
+
+    def history(self):
+        return list(self.history_ring)
+
+    def wait_for_sample(self, after_seq=0, timeout=None):
+        """
+        Block until a sample newer than after_seq is published.
+        Returns:
+            Sample: The newest sample, or None on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.slot is not None and self.slot.seq > after_seq, timeout)
+        sample = self.slot
+        return sample if sample is not None and sample.seq > after_seq else None
+
+def start_sampler():
+    """
+    Start the background sampler (idempotent).
+    Returns:
+        RangingSampler: The running sampler
+    """
+    global sampler
+    if sampler is None:
+        sampler = RangingSampler()
+    sampler.start()
+    return sampler
+
 def vl53l1x_stop(sensor):
+    if sampler is not None:
+        sampler.stop()
     if sensor is not None:
         try:
             sensor.stop_ranging()
-            print("VL53L1X ranging stopped and I2C bus deinitialized.")
+            logger.info("VL53L1X ranging stopped and I2C bus deinitialized.")
         except Exception as e:
-            print(f"Error stopping VL53L1X: {e}")
+            logger.error("Error stopping VL53L1X: %s", e)